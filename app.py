@@ -1,27 +1,65 @@
-from flask import Flask, render_template, redirect, url_for, request, flash
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, abort, g, has_request_context, Response, send_file, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
-from models import db, User, Course, Submission, Assignment
+from models import db, User, Course, Submission, Assignment, enrollments, CHECK_FAILED
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload
 import logic 
+import tasks
+import config
+from job_queue import SQLiteQueue
+from ingest import IngestRequest, store_upload, link_blob
+import admission
+import course_search
+import export
+import audit
+import stats
+import telemetry
 import datetime
 import os
 import re
 from functools import wraps
-import hashlib
+import json
+import mimetypes
+import time
+from urllib.parse import quote
+from collections import defaultdict
 
 
-app = Flask(__name__)
+app = Flask(__name__, instance_path=config.INSTANCE_PATH)
+app.request_class = IngestRequest
 app.config['SECRET_KEY'] = 'dev-key-123'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///university.db'
-app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static/uploads')
+app.config['SQLALCHEMY_DATABASE_URI'] = config.DATABASE_URI
+# Not under static/: uploads are only served by the download routes, which check who is asking
+app.config['UPLOAD_FOLDER'] = config.UPLOAD_FOLDER or os.path.join(app.instance_path, 'uploads')
+app.config['BLOB_FOLDER'] = os.path.join(app.instance_path, 'blobs')
+app.config['AUDIT_FOLDER'] = os.path.join(app.instance_path, 'audits')
+app.config['SLOT_FOLDER'] = os.path.join(app.instance_path, 'slots')  # admission-control lock files
+IngestRequest.blob_folder = app.config['BLOB_FOLDER']
+app.config['ASYNC_SUBMISSIONS'] = config.ASYNC_SUBMISSIONS
+app.config['CHECK_INLINE_BUDGET_SECONDS'] = config.CHECK_INLINE_BUDGET_SECONDS  # under gunicorn's WEB_TIMEOUT
+app.config['CATALOGUE_PAGE_SIZE'] = config.CATALOGUE_PAGE_SIZE
+app.config['REPORT_PAGE_SIZE'] = config.REPORT_PAGE_SIZE
+app.config['QUERY_BUDGET'] = config.QUERY_BUDGET
+app.config['DOWNLOAD_OFFLOAD'] = config.DOWNLOAD_OFFLOAD
+app.config['USE_X_SENDFILE'] = config.DOWNLOAD_OFFLOAD == 'x-sendfile'
+app.config['JOB_QUEUE_PATH'] = config.JOB_QUEUE_PATH or os.path.join(app.instance_path, 'jobs.db')
+app.config['METRICS_DIR'] = config.METRICS_DIR or os.path.join(app.instance_path, 'metrics')
+telemetry.set_metrics_dir(app.config['METRICS_DIR'])
+log = telemetry.get_logger('app')
+if os.path.abspath(app.config['UPLOAD_FOLDER']).startswith(os.path.abspath(app.static_folder) + os.sep):
+    log.warning("UPLOAD_FOLDER is inside the static folder: uploads are served to anyone", folder=app.config['UPLOAD_FOLDER'])
 
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
+os.makedirs(app.instance_path, exist_ok=True)
 
 db.init_app(app)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
+job_queue = SQLiteQueue(app.config['JOB_QUEUE_PATH'])
 
 @login_manager.user_loader
 def load_user(id): 
@@ -37,13 +75,58 @@ def faculty_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# --- QUERY BUDGET (N+1 guard) ---
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(*_):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+@app.after_request
+def report_query_count(response):
+    count = g.get('query_count', 0)
+    response.headers['X-Query-Count'] = str(count)
+    budget = app.config['QUERY_BUDGET']
+    if budget and count > budget:
+        log.warning("SQL query budget exceeded", endpoint=request.endpoint, queries=count, budget=budget)
+    return response
+
+# --- REQUEST TELEMETRY (correlation id + latency histogram) ---
+@app.before_request
+def start_request_telemetry():
+    g.request_started = time.perf_counter()
+    g.request_id = request.headers.get('X-Request-ID') or telemetry.new_request_id()
+    g.telemetry_token = telemetry.push(request_id=g.request_id)
+
+@app.after_request
+def record_request_telemetry(response):
+    if 'request_started' in g:
+        seconds = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or 'unmatched'
+        telemetry.observe('lyken_http_request_seconds', seconds, endpoint=endpoint,
+                          method=request.method, status=response.status_code)
+        response.headers['X-Request-ID'] = g.request_id
+        if endpoint not in ('static', 'metrics', 'submission_status'):
+            log.info(f"{request.method} {request.path}", status=response.status_code, ms=round(seconds * 1000, 1),
+                     queries=g.get('query_count', 0))
+    return response
+
+@app.teardown_request
+def end_request_telemetry(_exc):
+    # g.pop: a streamed response (stream_with_context) runs the teardown a second time
+    token = g.pop('telemetry_token', None)
+    if token is not None:
+        telemetry.pop(token)
+
+@app.route('/metrics')
+def metrics():
+    return Response(telemetry.render({'lyken_job_queue_depth': job_queue.depth(),
+                                      'lyken_job_queue_overdue': job_queue.overdue()}),
+                    mimetype='text/plain; version=0.0.4')
+
 # --- HELPER FUNCTIONS ---
-def calculate_hash(file_path):
-    hasher = hashlib.sha256()
-    with open(file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hasher.update(chunk)
-    return hasher.hexdigest()
+@app.template_filter('from_json')
+def from_json(value):
+    return json.loads(value) if value else []
 
 # --- AUTH ROUTES ---
 
@@ -105,12 +188,26 @@ def logout():
 @login_required
 def dashboard():
     if current_user.role == 'faculty':
-        courses = Course.query.filter_by(faculty_id=current_user.id).all()
-        return render_template('dashboard.html', courses=courses)
+        courses = Course.query.options(joinedload(Course.faculty)) \
+            .filter_by(faculty_id=current_user.id).all()
+        course_ids = [c.id for c in courses]
+        student_counts = dict(db.session.query(enrollments.c.course_id, func.count())
+                              .filter(enrollments.c.course_id.in_(course_ids))
+                              .group_by(enrollments.c.course_id).all())
+        return render_template('dashboard.html', courses=courses, student_counts=student_counts,
+                               assignment_counts=assignment_counts(course_ids))
     else:
-        enrolled_courses = current_user.enrolled_courses 
-        all_available = Course.query.all()
-        return render_template('dashboard.html', courses=enrolled_courses, all_available_courses=all_available)
+        enrolled_courses = Course.query.options(joinedload(Course.faculty)) \
+            .join(enrollments, enrollments.c.course_id == Course.id) \
+            .filter(enrollments.c.student_id == current_user.id).all()
+        # The catalogue itself is searched through /search and /api/courses/suggest
+        return render_template('dashboard.html', courses=enrolled_courses,
+                               assignment_counts=assignment_counts([c.id for c in enrolled_courses]))
+
+def assignment_counts(course_ids):
+    return dict(db.session.query(Assignment.course_id, func.count(Assignment.id))
+                .filter(Assignment.course_id.in_(course_ids))
+                .group_by(Assignment.course_id).all())
 
 @app.route('/create_course', methods=['GET', 'POST'])
 @login_required
@@ -138,6 +235,24 @@ def enroll(course_id):
         flash("You are already enrolled in this course.", "info")
     return redirect(url_for('dashboard'))
 
+# --- COURSE SEARCH ---
+
+@app.route('/search')
+@login_required
+def search():
+    query = request.args.get('query', '').strip()
+    page = course_search.search(query, page=request.args.get('page', 1, type=int),
+                                per_page=app.config['CATALOGUE_PAGE_SIZE'])
+    return render_template('search.html', query=query, results=page.items, page=page)
+
+@app.route('/api/courses/suggest')
+@login_required
+def suggest_courses():
+    response = jsonify(results=course_search.suggest(request.args.get('q', '')))
+    response.cache_control.private = True
+    response.cache_control.max_age = config.SEARCH_CACHE_SECONDS
+    return response
+
 # --- ASSIGNMENT MGMT ---
 
 @app.route('/course/<int:course_id>/create_assignment', methods=['GET', 'POST'])
@@ -157,17 +272,21 @@ def create_assignment(course_id):
             return render_template('create_assignment.html', course=course)
 
         files = request.files.getlist('question_files')
-        filenames = []
+        filenames, hashes = [], []
         for file in files:
             if file and file.filename != '':
                 timestamp = int(datetime.datetime.now().timestamp())
                 secure_name = f"Q_{course_id}_{timestamp}_{file.filename}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], secure_name))
+                # Hashed on the way in, like submissions: the hash is the download ETag
+                digest, blob, _ = store_upload(file, app.config['BLOB_FOLDER'])
+                link_blob(blob, os.path.join(app.config['UPLOAD_FOLDER'], secure_name))
                 filenames.append(secure_name)
+                hashes.append(digest)
 
         new_assign = Assignment(
             title=title, deadline=deadline, instructions=instructions,
             course_id=course.id, question_file=",".join(filenames) if filenames else None, 
+            question_hashes=",".join(hashes) if hashes else None,
             attempt_limit=int(request.form.get('attempt_limit', 3)), is_published=True
         )
         db.session.add(new_assign)
@@ -182,7 +301,11 @@ def create_assignment(course_id):
 def course_page(course_id):
     course = db.get_or_404(Course, course_id)
     assignments = Assignment.query.filter_by(course_id=course_id).order_by(Assignment.deadline.asc()).all()
-    return render_template('course_page.html', course=course, assignments=assignments, now=datetime.datetime.now(), Submission=Submission)
+    # All of this user's attempts for the course in one query, grouped per assignment
+    history = defaultdict(list)
+    for sub in Submission.query.filter_by(user_id=current_user.id, course_id=course_id).order_by(Submission.id):
+        history[sub.assignment_id].append(sub)
+    return render_template('course_page.html', course=course, assignments=assignments, now=datetime.datetime.now(), history=history)
 
 @app.route('/edit_assignment/<int:assignment_id>', methods=['GET', 'POST'])
 @login_required
@@ -225,7 +348,9 @@ def remove_student(course_id, user_id):
 @login_required
 def submit(assignment_id):
     assignment = db.get_or_404(Assignment, assignment_id)
-    attempts_made = Submission.query.filter_by(user_id=current_user.id, assignment_id=assignment_id).count()
+    attempts_made = Submission.query.filter(
+        Submission.user_id == current_user.id, Submission.assignment_id == assignment_id,
+        ~func.coalesce(Submission.reason, '').contains(CHECK_FAILED)).count()
 
     if attempts_made >= assignment.attempt_limit:
         flash("No attempts remaining.", "danger")
@@ -236,28 +361,134 @@ def submit(assignment_id):
         if file:
             filename = f"S_{assignment_id}_{current_user.id}_{int(datetime.datetime.now().timestamp())}_{file.filename}"
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            new_hash = calculate_hash(file_path)
-            score, reason = logic.run_plagiarism_check(file_path, new_hash, assignment.course_id, current_user.id, Submission)
-            
-            final_status = 'rejected' if score > 0.3 or "scan" in reason.lower() else 'accepted'
-            flash_category = "danger" if final_status == 'rejected' else "success"
-
+            # Hashed while streamed to disk; identical content is stored once
+            new_hash, blob, _ = store_upload(file, app.config['BLOB_FOLDER'])
+
+            # A re-click while the same file is still being checked is not a new attempt
+            repeat = checks_in_progress(Submission.query.filter_by(
+                user_id=current_user.id, assignment_id=assignment_id, content_hash=new_hash, status='pending').all())
+            if repeat:
+                telemetry.inc('lyken_admission_total', outcome='repeat')
+                flash("Submission already RECEIVED - integrity check in progress.", "info")
+                return redirect(url_for('course_page', course_id=assignment.course_id))
+            link_blob(blob, file_path)
+
+            # Record the (on-time) arrival first; the verdict is filled in by the check
             new_sub = Submission(
                 assignment_id=assignment_id, user_id=current_user.id,
                 course_id=assignment.course_id, filename=filename,
-                content_hash=new_hash, score=score, status=final_status,
-                reason=reason, timestamp=datetime.datetime.now()
+                content_hash=new_hash, score=0.0, status='pending',
+                reason="⏳ INTEGRITY CHECK IN PROGRESS", timestamp=datetime.datetime.now()
             )
             db.session.add(new_sub)
             db.session.commit()
-            
-            flash(f"Submission {final_status.upper()} - {reason}", flash_category)
+            telemetry.push(submission_id=new_sub.id)  # reset with the request's fields at teardown
+
+            # Exact duplicates are decided here from the hash - no queue, no extraction
+            duplicate = logic.check_duplicate(new_hash, assignment.course_id, current_user.id, Submission, new_sub)
+            if duplicate:
+                tasks.record_verdict(new_sub, *duplicate)
+                flash(f"Submission {new_sub.status.upper()} - {new_sub.reason}", "danger")
+            elif app.config['ASYNC_SUBMISSIONS']:
+                enqueue_check(new_sub, assignment, file_path)
+                telemetry.inc('lyken_admission_total', outcome='queued')
+                flash("Submission RECEIVED - integrity check in progress, your result will appear below.", "info")
+            else:
+                with admission.inline_slot(app.config['SLOT_FOLDER'], current_user.id) as shed:
+                    if shed is None:
+                        try:
+                            tasks.check_submission(new_sub.id, file_path,
+                                                   budget=app.config['CHECK_INLINE_BUDGET_SECONDS'])
+                        except Exception as e:
+                            db.session.rollback()
+                            log.exception("❌ Inline check failed", error=str(e))
+                            tasks.mark_failed(new_sub.id, e)
+                if shed is None:
+                    flash_category = {'rejected': "danger", 'review': "warning"}.get(new_sub.status, "success")
+                    flash(f"Submission {new_sub.status.upper()} - {new_sub.reason}", flash_category)
+                else:
+                    # Busy: answer now, check later - the arrival time is already recorded
+                    enqueue_check(new_sub, assignment, file_path)
+                    flash("Submission RECEIVED on time - the checker is busy, your result will appear below.", "info")
             return redirect(url_for('course_page', course_id=assignment.course_id))
 
     return render_template('upload.html', assignment=assignment, attempts_made=attempts_made)
 
+def checks_in_progress(pending):
+    """Those of the pending submissions still being checked: by a queued or running job,
+    or inline by a request still within its budget. Any other pending row was orphaned."""
+    queued = job_queue.active_checks(s.id for s in pending)
+    inline_since = datetime.datetime.now() - datetime.timedelta(seconds=app.config['CHECK_INLINE_BUDGET_SECONDS'])
+    return [s for s in pending if s.id in queued or (s.timestamp and s.timestamp >= inline_since)]
+
+def enqueue_check(sub, assignment, file_path):
+    """Queue a pending submission's check; the nearest deadline is served first."""
+    job_queue.put('check_submission', {'submission_id': sub.id, 'file_path': file_path},
+                  priority=admission.priority(assignment.deadline), user_id=sub.user_id)
+
+@app.route('/submission/<int:submission_id>/status')
+@login_required
+def submission_status(submission_id):
+    sub = db.get_or_404(Submission, submission_id)
+    if sub.user_id != current_user.id and not (current_user.role == 'faculty' and sub.assignment.course.faculty_id == current_user.id):
+        abort(403)
+    return jsonify(id=sub.id, status=sub.status, score=sub.score, reason=sub.reason)
+
+# --- DOWNLOADS ---
+
+def send_upload(filename, digest, download_name):
+    """Send a file from the upload folder as an attachment, keyed by its SHA-256.
+
+    Uploads never change under their name, so a request whose If-None-Match
+    carries the stored hash gets a 304 without the file being touched.
+    Otherwise the file goes out through sendfile (wsgi.file_wrapper) with
+    Range support, or is handed to the front server (DOWNLOAD_OFFLOAD).
+    """
+    if digest and (request.if_none_match.contains(digest) or request.if_none_match.star_tag):
+        response = Response(status=304)
+        response.set_etag(digest)
+    elif app.config['DOWNLOAD_OFFLOAD'] == 'x-accel':
+        # nginx serves (and range-slices) the file from its internal location
+        response = Response(mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = config.DOWNLOAD_ACCEL_PREFIX + quote(filename)
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        if digest:
+            response.set_etag(digest)
+    else:
+        path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not os.path.isfile(path):
+            abort(404)
+        response = send_file(path, as_attachment=True, download_name=download_name,
+                             conditional=True, etag=digest or True)
+    response.cache_control.no_cache = None
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = config.DOWNLOAD_MAX_AGE
+    return response
+
+@app.route('/assignment/<int:assignment_id>/question/<int:index>')
+@login_required
+def download_question(assignment_id, index):
+    assignment = db.get_or_404(Assignment, assignment_id)
+    course = assignment.course
+    if not (current_user.role == 'faculty' and course.faculty_id == current_user.id):
+        enrolled = db.session.query(enrollments).filter_by(course_id=course.id, student_id=current_user.id).first()
+        if enrolled is None:
+            abort(403)
+    files = assignment.question_files()
+    if not 0 <= index < len(files):
+        abort(404)
+    filename, digest = files[index]
+    return send_upload(filename, digest, filename.split('_', 3)[-1])
+
+@app.route('/submission/<int:submission_id>/file')
+@login_required
+def download_submission(submission_id):
+    sub = db.get_or_404(Submission, submission_id)
+    if sub.user_id != current_user.id and not (current_user.role == 'faculty' and sub.assignment.course.faculty_id == current_user.id):
+        abort(403)
+    return send_upload(sub.filename, sub.content_hash, sub.filename.split('_', 4)[-1])
+
 # --- REPORTS ---
 
 @app.route('/view_reports/<int:course_id>')
@@ -266,9 +497,78 @@ def submit(assignment_id):
 def view_reports(course_id):
     course = db.get_or_404(Course, course_id)
     assignments = Assignment.query.filter_by(course_id=course_id).all()
-    total = sum(len(a.submissions) for a in assignments)
-    rejected = sum(len([s for s in a.submissions if s.status == 'rejected']) for a in assignments)
-    return render_template('reports.html', course=course, assignments=assignments, total=total, rejected=rejected)
+
+    # Counters maintained on write (stats.py) - no scan of the submissions
+    summary = stats.course_summary(course_id)
+
+    # One page of the submissions table, filtered in SQL
+    filters = {'student': request.args.get('student', '').strip(), 'status': request.args.get('status') or None,
+               'assignment_id': request.args.get('assignment_id', type=int)}
+    stmt = select(Submission).options(joinedload(Submission.author)).where(Submission.course_id == course_id)
+    if filters['assignment_id'] is not None:
+        stmt = stmt.where(Submission.assignment_id == filters['assignment_id'])
+    if filters['status']:
+        stmt = stmt.where(Submission.status == filters['status'])
+    if filters['student']:
+        stmt = stmt.where(Submission.user_id.in_(
+            select(User.id).where(User.username.ilike(f"%{filters['student']}%"))))
+    # The counters give the page count, except for a student search
+    page = db.paginate(stmt.order_by(Submission.assignment_id, Submission.id),
+                       page=request.args.get('page', 1, type=int), per_page=app.config['REPORT_PAGE_SIZE'],
+                       error_out=False, count=bool(filters['student']))
+    if not filters['student']:
+        page.total = stats.summary_count(summary, filters['assignment_id'], filters['status'])
+
+    audits = audit.load_reports(app.config['AUDIT_FOLDER'], course_id, [a.id for a in assignments])
+    return render_template('reports.html', course=course, assignments=assignments, summary=summary,
+                           total=summary['total'], rejected=summary['by_status']['rejected'],
+                           counts=summary['assignments'], page=page, filters=filters,
+                           titles={a.id: a.title for a in assignments}, audits=audits,
+                           categories=stats.CATEGORIES)
+
+@app.route('/course/<int:course_id>/export.<fmt>')
+@login_required
+@faculty_required
+def export_reports(course_id, fmt):
+    """Stream the course's (or ?assignment_id=) submissions as CSV or JSON Lines."""
+    course = db.get_or_404(Course, course_id)
+    if course.faculty_id != current_user.id:
+        abort(403)
+    if fmt not in export.FORMATS:
+        abort(404)
+    assignment_id = request.args.get('assignment_id', type=int)
+    if assignment_id is not None and db.get_or_404(Assignment, assignment_id).course_id != course.id:
+        abort(404)
+    try:
+        filters = export.parse_filters(request.args)
+    except ValueError:
+        abort(400)
+    stmt = export.export_select(course_id=course.id, assignment_id=assignment_id, **filters)
+    name = f"{course.code}-{assignment_id}" if assignment_id else course.code
+    response = Response(stream_with_context(export.encode(export.stream_rows(stmt), fmt)),
+                        mimetype=export.FORMATS[fmt])
+    response.headers.set('Content-Disposition', 'attachment', filename=f"{name}-submissions.{fmt}")
+    return response
+
+@app.route('/course/<int:course_id>/audit', methods=['POST'])
+@login_required
+@faculty_required
+def run_audit(course_id):
+    course = db.get_or_404(Course, course_id)
+    if course.faculty_id != current_user.id:
+        abort(403)
+    assignment_id = request.form.get('assignment_id', type=int)
+    if assignment_id is not None and db.get_or_404(Assignment, assignment_id).course_id != course.id:
+        abort(404)
+    scope = {'course_id': None if assignment_id else course_id, 'assignment_id': assignment_id}
+    if app.config['ASYNC_SUBMISSIONS']:
+        job_queue.put('audit', {'report_folder': app.config['AUDIT_FOLDER'],
+                                'upload_folder': app.config['UPLOAD_FOLDER'], **scope})
+        flash("Similarity audit queued - the report will appear here when it finishes.", "info")
+    else:
+        tasks.run_audit(app.config['AUDIT_FOLDER'], app.config['UPLOAD_FOLDER'], **scope)
+        flash("Similarity audit complete.", "success")
+    return redirect(url_for('view_reports', course_id=course_id))
 
 @app.route('/toggle_publish/<int:assignment_id>')
 @login_required
@@ -281,6 +581,7 @@ def toggle_publish(assignment_id):
     return redirect(url_for('view_reports', course_id=assign.course_id))
 
 if __name__ == '__main__':
+    import migrate
     with app.app_context():
-        db.create_all()
+        migrate.upgrade()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,214 @@
+"""
+🔎 BULK SIMILARITY AUDIT
+Compares every submission of an assignment (or a whole course) against
+every other after the deadline, instead of one upload against a handful
+of priors. Texts are extracted in parallel; TF-IDF and MiniLM
+similarities are computed as blocked matrix products, so memory stays
+within AUDIT_MEMORY_MB however many submissions there are. Suspicious
+pairs are grouped into clusters and written to a JSON report that the
+integrity reports page shows.
+
+    python audit.py --assignment 3
+    python audit.py --course 1 [--threshold 0.45] [--workers 4]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sqlalchemy import func
+
+import config
+import embeddings
+import logic
+import minhash
+import telemetry
+import text_store
+from models import db, Submission
+
+log = telemetry.get_logger('audit')
+
+# --- INPUTS ---
+
+def latest_submissions(course_id=None, assignment_id=None):
+    """Each student's latest attempt per assignment within the scope."""
+    latest = db.session.query(func.max(Submission.id)) \
+        .group_by(Submission.user_id, Submission.assignment_id)
+    query = Submission.query.filter(Submission.id.in_(latest), Submission.status != 'pending')
+    if assignment_id is not None:
+        query = query.filter(Submission.assignment_id == assignment_id)
+    if course_id is not None:
+        query = query.filter(Submission.course_id == course_id)
+    return query.order_by(Submission.id).all()
+
+def _extract(path):
+    return logic.fast_extract_text(path)
+
+def collect_texts(subs, upload_folder, workers):
+    """Texts for every submission: store hits first, the rest extracted in parallel."""
+    stored = text_store.get_many([s.content_hash for s in subs])
+    missing = [s for s in subs if s.content_hash not in stored]
+    if missing:
+        log.info("📄 Extracting texts", texts=len(missing), workers=workers)
+        paths = [os.path.join(upload_folder, s.filename) for s in missing]
+        if workers > 1 and not multiprocessing.current_process().daemon:  # a daemon may not start a pool
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                extracted = list(pool.map(_extract, paths, chunksize=4))
+        else:
+            extracted = [_extract(p) for p in paths]
+        for sub, text in zip(missing, extracted):
+            text_store.put(sub.content_hash, text)
+            stored[sub.content_hash] = text
+        db.session.commit()
+    return [stored.get(s.content_hash, "") for s in subs]
+
+def collect_embeddings(subs, texts):
+    """Stored MiniLM embeddings, encoding (in batches) only those missing."""
+    missing = [i for i, s in enumerate(subs) if s.embedding is None]
+    if missing:
+        vectors = logic.get_semantic_model().encode([texts[i][:1200] for i in missing], batch_size=64)
+        for i, vec in zip(missing, vectors):
+            subs[i].embedding = embeddings.to_blob(vec)
+        db.session.commit()
+    return np.vstack([embeddings.from_blob(s.embedding) for s in subs]).astype(np.float32)
+
+# --- PAIRWISE SCORING ---
+
+def block_rows(n, memory_mb):
+    """Rows per block so a few dense (rows x n) float32 blocks fit the budget."""
+    return max(1, min(n, int(memory_mb * 1024 * 1024 / (4 * max(n, 1) * 4))))
+
+def suspicious_pairs(subs, texts, threshold, memory_mb):
+    """Pairs of different students whose combined score exceeds the threshold."""
+    n = len(subs)
+    tfidf = TfidfVectorizer(stop_words='english', ngram_range=(1, 2), max_features=200000,
+                            dtype=np.float32).fit_transform(texts)
+    emb = collect_embeddings(subs, texts)
+    users = np.array([s.user_id for s in subs])
+    signatures = [minhash.from_blob(s.minhash) if s.minhash else minhash.signature(t)
+                  for s, t in zip(subs, texts)]
+    too_short = np.array([len(t) < 50 for t in texts])
+
+    pairs = []
+    step = block_rows(n, memory_mb)
+    for start in range(0, n, step):
+        stop = min(n, start + step)
+        lexical = (tfidf[start:stop] @ tfidf.T).toarray()
+        semantic = emb[start:stop] @ emb.T
+        # Upper bound before the MinHash term (worth at most 0.1), then exact on survivors
+        partial = 0.3 * lexical + 0.6 * semantic
+        rows, cols = np.nonzero(partial + 0.1 > threshold)
+        for r, c in zip(rows, cols):
+            i, j = start + int(r), int(c)
+            if j <= i or users[i] == users[j] or too_short[i] or too_short[j]:
+                continue
+            overlap = minhash.jaccard(signatures[i], signatures[j])
+            score = overlap if overlap > 0.6 else partial[r, c] + 0.1 * overlap
+            if subs[i].content_hash == subs[j].content_hash:
+                score = 1.0
+            if score > threshold:
+                pairs.append((i, j, float(score)))
+        log.info("   📊 Rows scored", rows=f"{stop}/{n}", pairs=len(pairs))
+    return pairs
+
+def clusters_from_pairs(n, pairs):
+    """Connected components of the suspicious-pair graph (union-find)."""
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j, _ in pairs:
+        parent[find(i)] = find(j)
+    groups = {}
+    for i, j, score in pairs:
+        groups.setdefault(find(i), []).append((i, j, score))
+    return list(groups.values())
+
+# --- REPORT ---
+
+def report_path(report_folder, course_id=None, assignment_id=None):
+    scope = f"assignment-{assignment_id}" if assignment_id is not None else f"course-{course_id}"
+    return os.path.join(report_folder, f"{scope}.json")
+
+def run_audit(report_folder, upload_folder, course_id=None, assignment_id=None,
+              threshold=0.45, workers=None, memory_mb=None):
+    started = time.perf_counter()
+    workers = workers or config.AUDIT_WORKERS
+    memory_mb = memory_mb or config.AUDIT_MEMORY_MB
+    subs = latest_submissions(course_id, assignment_id)
+    log.info("🔎 Audit started", submissions=len(subs), course=course_id, assignment=assignment_id)
+
+    texts = collect_texts(subs, upload_folder, workers)
+    pairs = suspicious_pairs(subs, texts, threshold, memory_mb) if len(subs) > 1 else []
+
+    def member(i):
+        s = subs[i]
+        return {'submission_id': s.id, 'user_id': s.user_id, 'username': s.author.username,
+                'assignment_id': s.assignment_id, 'filename': s.filename}
+
+    clusters = []
+    for group in clusters_from_pairs(len(subs), pairs):
+        members = sorted({i for i, j, _ in group} | {j for i, j, _ in group})
+        clusters.append({
+            'size': len(members),
+            'max_score': round(max(score for _, _, score in group), 4),
+            'members': [member(i) for i in members],
+            'pairs': [{'a': subs[i].id, 'b': subs[j].id, 'score': round(score, 4)}
+                      for i, j, score in sorted(group, key=lambda p: -p[2])],
+        })
+    clusters.sort(key=lambda c: (-c['max_score'], -c['size']))
+
+    report = {
+        'course_id': course_id if course_id is not None else (subs[0].course_id if subs else None),
+        'assignment_id': assignment_id,
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'threshold': threshold,
+        'submissions': len(subs),
+        'suspicious_pairs': len(pairs),
+        'seconds': round(time.perf_counter() - started, 2),
+        'clusters': clusters,
+    }
+    os.makedirs(report_folder, exist_ok=True)
+    path = report_path(report_folder, course_id, assignment_id)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(path + '.tmp', path)
+    log.info("✅ Audit done", clusters=len(clusters), pairs=len(pairs), seconds=report['seconds'], report=path)
+    return report
+
+def load_reports(report_folder, course_id, assignment_ids):
+    """Saved audit reports for a course and its assignments, newest first."""
+    reports = []
+    paths = [report_path(report_folder, course_id=course_id)] + \
+            [report_path(report_folder, assignment_id=a) for a in assignment_ids]
+    for path in paths:
+        if os.path.exists(path):
+            with open(path) as f:
+                reports.append(json.load(f))
+    return sorted(reports, key=lambda r: r['generated_at'], reverse=True)
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Audit all submissions of an assignment or course for similarity")
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument('--assignment', type=int)
+    scope.add_argument('--course', type=int)
+    parser.add_argument('--threshold', type=float, default=0.45)
+    parser.add_argument('--workers', type=int, default=config.AUDIT_WORKERS)
+    parser.add_argument('--memory-mb', type=int, default=config.AUDIT_MEMORY_MB)
+    args = parser.parse_args()
+    with app.app_context():
+        run_audit(app.config['AUDIT_FOLDER'], app.config['UPLOAD_FOLDER'], course_id=args.course,
+                  assignment_id=args.assignment, threshold=args.threshold,
+                  workers=args.workers, memory_mb=args.memory_mb)
@@ -0,0 +1,387 @@
+"""
+⏱️ PIPELINE BENCHMARKS
+Generates a reproducible synthetic corpus (text PDFs, scanned PDFs, DOCX,
+PNG, notebooks and legacy .doc files, with controlled overlap between
+variants of the same document) and times each stage of the plagiarism
+pipeline on it:
+
+    extract.<format>   fast_extract_text, per file format
+    ai                 detect_ai_content
+    similarity.<ovl>   ultra_fast_similarity, per overlap level
+    check.priors=<n>   run_plagiarism_check against n accepted priors
+
+Every stage reports p50/p95 latency, throughput and peak RSS. Results
+are written as JSON so runs can be compared:
+
+    python bench.py --stub                      offline, stub models
+    python bench.py --priors 0,50,500 --out before.json
+    python bench.py --out after.json --compare before.json
+
+The run uses its own database and upload folder under --workdir and
+never touches the application database.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+FORMATS = ['pdf', 'scan.pdf', 'docx', 'png', 'ipynb', 'doc']
+
+# --- SYNTHETIC CORPUS ---
+
+def vocabulary(rng, size=3000):
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'shi', 'ven', 'dor', 'pel', 'qua', 'zim', 'tor', 'al', 'ex', 'ion']
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables, size=rng.integers(2, 5))))
+    return sorted(words)
+
+def make_sentences(rng, vocab, count):
+    return [" ".join(rng.choice(vocab, size=rng.integers(12, 21))).capitalize() + "." for _ in range(count)]
+
+def make_variant(rng, vocab, base, overlap):
+    """A document sharing roughly `overlap` of its sentences with `base`."""
+    fresh = make_sentences(rng, vocab, len(base))
+    return [b if rng.random() < overlap else f for b, f in zip(base, fresh)]
+
+def _render_page_image(text, width=1240, height=1754):
+    from PIL import Image, ImageDraw
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    line, y = "", 60
+    for word in text.split():
+        if len(line) + len(word) > 90:
+            draw.text((60, y), line, fill=0)
+            line, y = "", y + 28
+            if y > height - 60:
+                break
+        line = f"{line} {word}".strip()
+    draw.text((60, y), line, fill=0)
+    return image
+
+def write_document(path, fmt, sentences):
+    text = " ".join(sentences)
+    if fmt == 'pdf':
+        import fitz
+        doc = fitz.open()
+        for start in range(0, len(text), 2500):
+            doc.new_page().insert_textbox(fitz.Rect(50, 50, 545, 792), text[start:start + 2500], fontsize=9)
+        doc.save(path)
+        doc.close()
+    elif fmt == 'scan.pdf':
+        import fitz
+        doc = fitz.open()
+        for start in range(0, min(len(text), 6000), 3000):
+            buf = io.BytesIO()
+            _render_page_image(text[start:start + 3000]).save(buf, format='PNG')
+            page = doc.new_page()
+            page.insert_image(page.rect, stream=buf.getvalue())
+        doc.save(path)
+        doc.close()
+    elif fmt == 'png':
+        _render_page_image(text[:3000]).save(path)
+    elif fmt == 'docx':
+        from docx import Document
+        doc = Document()
+        for start in range(0, len(sentences), 5):
+            doc.add_paragraph(" ".join(sentences[start:start + 5]))
+        doc.save(path)
+    elif fmt == 'ipynb':
+        cells = []
+        for start in range(0, len(sentences), 4):
+            cells.append({'cell_type': 'markdown', 'metadata': {}, 'source': " ".join(sentences[start:start + 4])})
+            cells.append({'cell_type': 'code', 'metadata': {}, 'execution_count': None, 'outputs': [],
+                          'source': f"result_{start} = analyse(data[{start}:{start + 4}])\nprint(result_{start})"})
+        with open(path, 'w') as f:
+            json.dump({'cells': cells, 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}, f)
+    elif fmt == 'doc':
+        # Legacy Word: binary OLE2 container with the text stored as 8-bit pieces
+        with open(path, 'wb') as f:
+            f.write(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + bytes(504))
+            f.write(text.encode('cp1252', errors='replace'))
+            f.write(bytes(512))
+    else:
+        with open(path, 'w') as f:
+            f.write(text)
+
+def generate_corpus(folder, docs=6, overlaps=(0.0, 0.3, 0.7, 1.0), sentences=40, seed=0):
+    """Write `docs` families of documents in every format. Returns the manifest."""
+    rng = np.random.default_rng(seed)
+    vocab = vocabulary(rng)
+    os.makedirs(folder, exist_ok=True)
+    manifest = []
+    for family in range(docs):
+        base = make_sentences(rng, vocab, sentences)
+        variants = [(overlap, make_variant(rng, vocab, base, overlap)) for overlap in overlaps]
+        for fmt in FORMATS + ['txt']:
+            path = os.path.join(folder, f"f{family}-base.{fmt}")
+            write_document(path, fmt, base)
+            manifest.append({'path': path, 'format': fmt, 'family': family, 'overlap': None,
+                             'text': " ".join(base)})
+        for overlap, variant in variants:
+            path = os.path.join(folder, f"f{family}-v{int(overlap * 100)}.txt")
+            write_document(path, 'txt', variant)
+            manifest.append({'path': path, 'format': 'txt', 'family': family, 'overlap': overlap,
+                             'text': " ".join(variant)})
+    with open(os.path.join(folder, 'manifest.json'), 'w') as f:
+        json.dump([{k: v for k, v in m.items() if k != 'text'} for m in manifest], f, indent=2)
+    return manifest
+
+# --- MEASUREMENT ---
+
+def current_rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+class Stage:
+    """Latencies of one stage plus the peak RSS sampled while it ran."""
+
+    def __init__(self, name, quiet=True):
+        self.name = name
+        self.quiet = quiet
+        self.times = []
+        self.peak_rss = 0.0
+        self._running = False
+
+    def _sample(self):
+        while self._running:
+            self.peak_rss = max(self.peak_rss, current_rss_mb())
+            time.sleep(0.01)
+
+    def __enter__(self):
+        self._running = True
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self._started
+        self._running = False
+        self._sampler.join()
+        self.peak_rss = max(self.peak_rss, current_rss_mb())
+
+    def call(self, fn, *args, **kwargs):
+        sink = io.StringIO() if self.quiet else sys.stdout
+        with contextlib.redirect_stdout(sink):
+            started = time.perf_counter()
+            result = fn(*args, **kwargs)
+            self.times.append(time.perf_counter() - started)
+        return result
+
+    def summary(self):
+        times = np.array(self.times) * 1000
+        return {
+            'n': len(self.times),
+            'p50_ms': round(float(np.percentile(times, 50)), 2) if len(times) else None,
+            'p95_ms': round(float(np.percentile(times, 95)), 2) if len(times) else None,
+            'mean_ms': round(float(times.mean()), 2) if len(times) else None,
+            'throughput_per_s': round(len(times) / self.wall, 2) if self.wall else None,
+            'peak_rss_mb': round(self.peak_rss, 1),
+        }
+
+# --- STAGES ---
+
+def bench_extract(logic, manifest, results, quiet):
+    for fmt in FORMATS + ['txt']:
+        with Stage(f"extract.{fmt}", quiet) as stage:
+            for doc in manifest:
+                if doc['format'] == fmt:
+                    stage.call(logic.fast_extract_text, doc['path'])
+        results[stage.name] = stage.summary()
+
+def bench_ai(logic, manifest, results, quiet):
+    texts = [d['text'] for d in manifest if d['format'] == 'txt']
+    stage_call(logic.get_ai_detector, quiet)  # model load is reported separately
+    with Stage('ai', quiet) as stage:
+        for text in texts:
+            stage.call(logic.detect_ai_content, text)
+    results[stage.name] = stage.summary()
+
+def bench_similarity(logic, manifest, results, quiet):
+    stage_call(logic.get_semantic_model, quiet)
+    bases = {d['family']: d['text'] for d in manifest if d['format'] == 'txt' and d['overlap'] is None}
+    for overlap in sorted({d['overlap'] for d in manifest if d['overlap'] is not None}):
+        with Stage(f"similarity.{overlap:.2f}", quiet) as stage:
+            scores = [stage.call(logic.ultra_fast_similarity, bases[d['family']], d['text'])
+                      for d in manifest if d['overlap'] == overlap]
+        results[stage.name] = dict(stage.summary(), mean_score=round(float(np.mean(scores)), 4))
+
+def bench_check(logic, manifest, results, prior_counts, queries, workdir, seed, quiet):
+    """Full check of `queries` new uploads against courses holding n accepted priors."""
+    import hashlib
+    from app import app
+    import migrate
+    import text_store
+    from models import db, User, Course, Assignment, Submission
+
+    rng = np.random.default_rng(seed + 1)
+    vocab = vocabulary(np.random.default_rng(seed))
+    upload_dir = os.path.join(workdir, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    query_docs = [d for d in manifest if d['format'] == 'txt' and d['overlap'] is not None][:queries]
+
+    with app.app_context():
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate.upgrade()
+        faculty = User(username='bench-faculty', email='bench-faculty@bench.local', password='-', role='faculty')
+        db.session.add(faculty)
+        db.session.commit()
+        for n in prior_counts:
+            course = Course(name=f"Bench {n}", code=f"B{n}", faculty_id=faculty.id)
+            db.session.add(course)
+            db.session.commit()
+            assignment = Assignment(course_id=course.id, title='Bench', deadline=datetime(2100, 1, 1))
+            students = [User(username=f"bench-{n}-{i}", email=f"bench-{n}-{i}@bench.local", password='-', role='student')
+                        for i in range(n + 1)]
+            db.session.add_all([assignment] + students)
+            db.session.commit()
+
+            # Priors: distinct documents plus the family bases the queries derive from
+            prior_texts = [d['text'] for d in manifest if d['format'] == 'txt' and d['overlap'] is None][:n]
+            prior_texts += [" ".join(make_sentences(rng, vocab, 40)) for _ in range(n - len(prior_texts))]
+            for student, text in zip(students[1:], prior_texts):
+                digest = hashlib.sha256(text.encode()).hexdigest()
+                text_store.put(digest, text)
+                db.session.add(Submission(assignment_id=assignment.id, user_id=student.id, course_id=course.id,
+                                          filename=f"{digest}.txt", content_hash=digest, score=0.0,
+                                          status='accepted', reason='bench prior', timestamp=datetime.now()))
+            db.session.commit()
+
+            # Warm-up: backfills prior embeddings/MinHash, so the timed runs see a steady state
+            stage_call(logic.backfill_features, quiet, course.id, Submission, upload_dir)
+            db.session.commit()
+            with Stage(f"check.priors={n}", quiet) as stage:
+                for q, doc in enumerate(query_docs):
+                    path = os.path.join(upload_dir, f"q{n}-{q}.txt")
+                    with open(doc['path'], 'rb') as src, open(path, 'wb') as dst:
+                        data = src.read() + f"\n{n}-{q}".encode()  # unique content, so no store hit
+                        dst.write(data)
+                    stage.call(logic.run_plagiarism_check, path, hashlib.sha256(data).hexdigest(),
+                               course.id, students[0].id, Submission, upload_dir)
+            results[stage.name] = stage.summary()
+
+def stage_call(fn, quiet, *args):
+    with contextlib.redirect_stdout(io.StringIO() if quiet else sys.stdout):
+        return fn(*args)
+
+# --- REPORT ---
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    print(f"\n{'stage':<24}{'p50 ms':>12}{'base':>10}{'Δ':>8}{'p95 ms':>12}{'base':>10}{'Δ':>8}")
+    for name, row in results['stages'].items():
+        base = baseline['stages'].get(name)
+        cells = []
+        for key in ('p50_ms', 'p95_ms'):
+            now, then = row.get(key), (base or {}).get(key)
+            delta = f"{(now - then) / then:+.0%}" if now is not None and then else "-"
+            cells.append(f"{now if now is not None else '-':>12}{then if then is not None else '-':>10}{delta:>8}")
+        print(f"{name:<24}{''.join(cells)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the plagiarism pipeline on a synthetic corpus")
+    parser.add_argument('--stub', action='store_true', help="use stub models (MODEL_BACKEND=stub), runs offline")
+    parser.add_argument('--docs', type=int, default=6, help="document families in the corpus")
+    parser.add_argument('--sentences', type=int, default=40, help="sentences per document")
+    parser.add_argument('--overlaps', default='0,0.3,0.7,1', help="overlap levels of the variants")
+    parser.add_argument('--priors', default='0,10,50', help="prior-submission counts for the full check")
+    parser.add_argument('--queries', type=int, default=8, help="full checks per prior count")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', default='extract,ai,similarity,check')
+    parser.add_argument('--workdir', help="corpus and scratch database folder (default: a temp dir)")
+    parser.add_argument('--out', help="results file (default: instance/bench/bench-<time>.json)")
+    parser.add_argument('--compare', help="earlier results file to print deltas against")
+    parser.add_argument('--verbose', action='store_true', help="show the pipeline's own output")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='lyken-bench-'))
+    os.makedirs(workdir, exist_ok=True)
+    # Settings are read at import time, so the environment is fixed before importing the app
+    if args.stub:
+        os.environ['MODEL_BACKEND'] = 'stub'
+    os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    if os.path.exists(os.path.join(workdir, 'bench.db')):
+        os.remove(os.path.join(workdir, 'bench.db'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        import config
+        import logic
+        import telemetry
+
+    quiet = not args.verbose
+    if quiet:
+        telemetry.configure_logging(level='WARNING')
+    stages = set(args.stages.split(','))
+    print(f"⏱️  Generating corpus in {workdir}")
+    started = time.perf_counter()
+    manifest = generate_corpus(os.path.join(workdir, 'corpus'), args.docs,
+                               [float(x) for x in args.overlaps.split(',')], args.sentences, args.seed)
+    print(f"   {len(manifest)} files in {time.perf_counter() - started:.1f}s")
+
+    results = {}
+    if 'extract' in stages:
+        print("⏱️  Extraction")
+        bench_extract(logic, manifest, results, quiet)
+    if 'ai' in stages:
+        print("⏱️  AI detection")
+        bench_ai(logic, manifest, results, quiet)
+    if 'similarity' in stages:
+        print("⏱️  Pairwise similarity")
+        bench_similarity(logic, manifest, results, quiet)
+    if 'check' in stages:
+        print("⏱️  Full check")
+        bench_check(logic, manifest, results, [int(x) for x in args.priors.split(',')],
+                    args.queries, workdir, args.seed, quiet)
+
+    report = {
+        'meta': {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'model_backend': config.MODEL_BACKEND,
+            'args': {k: v for k, v in vars(args).items() if k not in ('out', 'compare', 'verbose')},
+            'settings': {k: getattr(config, k) for k in ('MAX_TEXT_CHARS', 'AI_WINDOW_TOKENS', 'AI_BATCH_SIZE',
+                                                         'OCR_WORKERS', 'OCR_DPI', 'SIMILARITY_CANDIDATES',
+                                                         'TORCH_NUM_THREADS')},
+            'model_load_seconds': {k: round(v, 2) for k, v in logic.model_load_seconds.items()},
+        },
+        'stages': results,
+    }
+
+    print(f"\n{'stage':<24}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'per s':>9}{'peak MB':>10}")
+    for name, row in results.items():
+        print(f"{name:<24}{row['n']:>5}{row['p50_ms'] or 0:>10.1f}{row['p95_ms'] or 0:>10.1f}"
+              f"{row['throughput_per_s'] or 0:>9.1f}{row['peak_rss_mb']:>10.0f}")
+
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'bench',
+                                   f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+💻 CODE FINGERPRINTS (WINNOWING)
+Notebook and source-file submissions are compared as code, not prose.
+The code (notebook code cells, or the whole source file) is tokenized and
+normalized - identifiers become V, numbers N, strings S, comments and
+layout vanish - so renaming variables or reflowing lines changes nothing.
+Hashes of every k-token run are winnowed (the minimum of each window of
+w hashes is kept), which guarantees that any shared run of at least
+w + k - 1 tokens leaves a common fingerprint.
+
+Fingerprints go into a per-course inverted index (code_fingerprint), so
+matching a submission is a handful of indexed lookups. Fingerprints of
+the assignment's own question file, and those shared by a large share of
+the course, are ignored as starter or boilerplate code.
+"""
+
+import builtins
+import io
+import json
+import keyword
+import os
+import re
+import tokenize
+import zlib
+
+import numpy as np
+from sqlalchemy import or_
+
+import config
+from models import db, CodeFingerprint
+
+CODE_EXTENSIONS = {'.py', '.ipynb', '.java', '.c', '.h', '.cpp', '.cc', '.hpp', '.cs', '.js', '.ts',
+                   '.go', '.rs', '.kt', '.swift', '.php', '.rb', '.scala', '.m', '.r', '.sql'}
+
+_PY_KEEP = set(keyword.kwlist) | set(dir(builtins))
+_PY_STRINGS = {tokenize.STRING, getattr(tokenize, 'FSTRING_START', tokenize.STRING)}  # 3.12+ splits f-strings
+_C_KEYWORDS = set("""
+    abstract auto bool boolean break byte case catch char class const continue default delete do double
+    else enum extends false final finally float for function if implements import include int interface
+    let long new null package private protected public return short signed sizeof static struct super
+    switch template this throw throws true try typedef typename union unsigned using var virtual void
+    volatile while def end elif fn func impl mut nil pub self select from where insert update join
+    group order by and or not""".split())
+_GENERIC_TOKEN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/|\#[^\n]*|--[^\n]*)
+  | (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op>\S)""", re.VERBOSE | re.DOTALL)
+
+def is_code(path):
+    return os.path.splitext(path)[1].lower() in CODE_EXTENSIONS
+
+def notebook_cells(path):
+    """[(cell_type, source)] of a Jupyter notebook, outputs left out."""
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        nb = json.load(f)
+    cells = nb.get('cells') or [c for ws in nb.get('worksheets', []) for c in ws.get('cells', [])]  # nbformat 3
+    out = []
+    for cell in cells:
+        source = cell.get('source') or cell.get('input') or ""
+        out.append((cell.get('cell_type', 'code'), "".join(source) if isinstance(source, list) else source))
+    return out
+
+def code_source(path):
+    """The code of a submission: notebook code cells (magics and shell lines dropped), or the file."""
+    if path.lower().endswith('.ipynb'):
+        cells = [src for kind, src in notebook_cells(path) if kind == 'code']
+        lines = [line for src in cells for line in src.splitlines() + [""]
+                 if not line.lstrip().startswith(('%', '!'))]
+        return "\n".join(lines)
+    with open(path, encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+def _python_tokens(source):
+    tokens = []
+    for tok in tokenize.generate_tokens(io.StringIO(source).readline):
+        kind = tok.type
+        if kind == tokenize.NAME:
+            tokens.append(tok.string if tok.string in _PY_KEEP else 'V')
+        elif kind == tokenize.NUMBER:
+            tokens.append('N')
+        elif kind in _PY_STRINGS:
+            tokens.append('S')
+        elif kind == tokenize.OP:
+            tokens.append(tok.string)
+    return tokens
+
+def _generic_tokens(source):
+    tokens = []
+    for match in _GENERIC_TOKEN.finditer(source):
+        group = match.lastgroup
+        if group == 'name':
+            tokens.append(match.group() if match.group() in _C_KEYWORDS else 'V')
+        elif group == 'number':
+            tokens.append('N')
+        elif group == 'string':
+            tokens.append('S')
+        elif group == 'op':
+            tokens.append(match.group())
+    return tokens
+
+def normalized_tokens(source, ext='.py'):
+    """Token stream with identifiers, literals, comments and layout normalized away."""
+    if ext in ('.py', '.ipynb'):
+        try:
+            return _python_tokens(source)
+        except (tokenize.TokenError, SyntaxError):
+            pass  # not valid Python (e.g. a broken cell): tokenize it generically
+    return _generic_tokens(source)
+
+def fingerprints(tokens, k=None, window=None):
+    """Winnowed 63-bit hashes of the token k-grams, as a sorted unique int64 array."""
+    k, window = k or config.CODE_KGRAM, window or config.CODE_WINDOW
+    if len(tokens) < k:
+        return np.empty(0, dtype=np.int64)
+    ids = np.fromiter((zlib.crc32(t.encode()) for t in tokens), dtype=np.uint64, count=len(tokens))
+    grams = np.lib.stride_tricks.sliding_window_view(ids, k)
+    powers = np.uint64(0x100000001B3) ** np.arange(k - 1, -1, -1, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        hashes = ((grams * powers).sum(axis=1, dtype=np.uint64) >> np.uint64(1)).astype(np.int64)
+    if len(hashes) <= window:
+        return np.unique(hashes[[int(np.argmin(hashes))]])
+    windows = np.lib.stride_tricks.sliding_window_view(hashes, window)
+    # Rightmost minimum of each window, as in Schleimer et al.
+    picks = np.arange(len(windows)) + window - 1 - np.argmin(windows[:, ::-1], axis=1)
+    return np.unique(hashes[picks])
+
+def file_fingerprints(path):
+    ext = os.path.splitext(path)[1].lower()
+    return fingerprints(normalized_tokens(code_source(path), ext))
+
+def base_fingerprints(question_file, upload_folder):
+    """Fingerprints of an assignment's code question files (comma-separated names), as starter code."""
+    prints = [file_fingerprints(os.path.join(upload_folder, name))
+              for name in (question_file or "").split(",") if name and is_code(name)
+              and os.path.exists(os.path.join(upload_folder, name))]
+    return np.unique(np.concatenate(prints)) if prints else np.empty(0, dtype=np.int64)
+
+def index_submission(submission_id, course_id, prints):
+    """Add a submission's fingerprints to the session (committed by the caller)."""
+    if submission_id is None:
+        return
+    db.session.add_all([CodeFingerprint(course_id=course_id, hash=int(h), submission_id=submission_id)
+                        for h in prints])
+
+def backfill(course_id, Submission, upload_folder):
+    """Fingerprint accepted code priors stored before the index existed (committed by the caller)."""
+    missing = Submission.query.filter(
+        Submission.course_id == course_id,
+        Submission.status == 'accepted',
+        Submission.code_prints.is_(None),
+        or_(*[Submission.filename.ilike(f"%{ext}") for ext in CODE_EXTENSIONS])
+    ).all()
+    done = 0
+    for sub in missing:
+        path = os.path.join(upload_folder, sub.filename)
+        if not os.path.exists(path):
+            continue  # left NULL: retried once the file is back
+        try:
+            prints = file_fingerprints(path)
+        except (OSError, ValueError):
+            prints = np.empty(0, dtype=np.int64)  # unreadable file: never retried
+        sub.code_prints = len(prints)
+        index_submission(sub.id, course_id, prints)
+        done += 1
+    return done
+
+def matches(course_id, prints, exclude_user_id, Submission, base=()):
+    """Share of the submission's distinctive fingerprints found in each accepted prior.
+
+    `base` holds fingerprints to ignore (the question file's). Fingerprints
+    held by at least CODE_COMMON_FRACTION of the course's students (and
+    CODE_COMMON_MIN of them) count as boilerplate and are ignored too.
+    Returns ({submission_id: share}, fingerprints_compared).
+    """
+    prints = np.setdiff1d(prints, np.asarray(list(base), dtype=np.int64))
+    if not len(prints):
+        return {}, 0
+    holders = {}  # hash -> user ids holding it
+    shared = {}   # accepted prior of another student -> matching hashes
+    for start in range(0, len(prints), 500):
+        chunk = [int(h) for h in prints[start:start + 500]]
+        rows = db.session.query(CodeFingerprint.hash, CodeFingerprint.submission_id,
+                                Submission.user_id, Submission.status) \
+            .join(Submission, Submission.id == CodeFingerprint.submission_id) \
+            .filter(CodeFingerprint.course_id == course_id, CodeFingerprint.hash.in_(chunk)).all()
+        for h, submission_id, user_id, status in rows:
+            holders.setdefault(h, set()).add(user_id)
+            if status == 'accepted' and user_id != exclude_user_id:
+                shared.setdefault(submission_id, set()).add(h)
+
+    students = db.session.query(db.func.count(db.distinct(Submission.user_id))) \
+        .filter(Submission.course_id == course_id, Submission.code_prints > 0).scalar()
+    limit = max(config.CODE_COMMON_MIN, config.CODE_COMMON_FRACTION * students)
+    common = {h for h, users in holders.items() if len(users) >= limit}
+    compared = len(prints) - len(common)
+    if compared <= 0:
+        return {}, 0
+    return {sid: len(hashes - common) / compared for sid, hashes in shared.items() if hashes - common}, compared
@@ -0,0 +1,120 @@
+"""
+⚙️ DEPLOYMENT SETTINGS
+Everything tunable per node is read from environment variables here,
+with defaults that work on a single development machine.
+"""
+
+import os
+
+def _flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _int(name, default):
+    return int(os.environ.get(name, default))
+
+# Database (models.py)
+DATABASE_URI = os.environ.get('DATABASE_URI', 'sqlite:///university.db')  # relative paths live in instance/
+SQLITE_BUSY_TIMEOUT_MS = _int('SQLITE_BUSY_TIMEOUT_MS', 15000)
+
+# File locations (app.py)
+INSTANCE_PATH = os.environ.get('INSTANCE_PATH')  # absolute; default: <app>/instance
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER')  # default: <instance>/uploads
+
+# Extracted-text store (text_store.py)
+TEXT_STORE_MAX_BYTES = _int('TEXT_STORE_MAX_BYTES', 256 * 1024 * 1024)
+
+# Submission pipeline (job_queue.py / worker.py)
+ASYNC_SUBMISSIONS = _flag('ASYNC_SUBMISSIONS', True)
+WORKER_POOL_SIZE = _int('WORKER_POOL_SIZE', max(1, (os.cpu_count() or 2) // 2))
+JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH')  # default: <instance>/jobs.db
+JOB_MAX_ATTEMPTS = _int('JOB_MAX_ATTEMPTS', 3)
+JOB_VISIBILITY_TIMEOUT = _int('JOB_VISIBILITY_TIMEOUT', 600)  # seconds before a stuck job is retried
+
+# Admission control on the submit path (admission.py)
+ADMISSION_NODE_SLOTS = _int('ADMISSION_NODE_SLOTS', max(1, (os.cpu_count() or 2) // 2))  # inline checks per machine
+ADMISSION_USER_SLOTS = _int('ADMISSION_USER_SLOTS', 1)  # checks (inline or queued jobs) running per student
+ADMISSION_MAX_INLINE_SECONDS = float(os.environ.get('ADMISSION_MAX_INLINE_SECONDS', 20))  # queue when checks run longer
+
+# Model hosting (logic.py / gunicorn.conf.py / worker.py)
+PRELOAD_MODELS = _flag('PRELOAD_MODELS', False)  # load once in the parent, share with forked workers
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'torch')  # 'torch' | 'onnx' (int8, see inference.py) | 'stub' (fakes, no downloads)
+ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR')  # default: <instance>/onnx
+MODEL_SERVER_SOCKET = os.environ.get('MODEL_SERVER_SOCKET')  # default: <instance>/models.sock (model_server.py)
+MODEL_SERVER_KEY = os.environ.get('MODEL_SERVER_KEY')  # socket handshake secret; default: random, kept in <instance>/models.key (0600)
+MODEL_SERVER_BATCH_MS = float(os.environ.get('MODEL_SERVER_BATCH_MS', 5))  # wait this long to coalesce requests
+MODEL_SERVER_MAX_BATCH = _int('MODEL_SERVER_MAX_BATCH', 32)  # items per micro-batch
+MODEL_SERVER_RETRY_SECONDS = _int('MODEL_SERVER_RETRY_SECONDS', 30)  # in-process fallback before retrying the server
+
+# Similarity search (embeddings.py / lexical.py)
+SIMILARITY_CANDIDATES = _int('SIMILARITY_CANDIDATES', 25)  # nearest priors given full pairwise scoring
+EMBEDDING_CACHE_COURSES = _int('EMBEDDING_CACHE_COURSES', 32)  # course matrices kept per process
+LEXICAL_CACHE_COURSES = _int('LEXICAL_CACHE_COURSES', 32)
+LEXICAL_FEATURES = _int('LEXICAL_FEATURES', 2 ** 18)  # hashed TF-IDF width; changing it invalidates stored terms
+
+# Code submissions (codeprint.py): winnowing over normalized tokens
+CODE_KGRAM = _int('CODE_KGRAM', 12)  # tokens per hashed k-gram
+CODE_WINDOW = _int('CODE_WINDOW', 8)  # winnowing window; shared runs of KGRAM + WINDOW - 1 tokens always match
+CODE_MIN_FINGERPRINTS = _int('CODE_MIN_FINGERPRINTS', 8)  # fewer: too little code, scored as text instead
+CODE_THRESHOLD = float(os.environ.get('CODE_THRESHOLD', 0.5))  # share of fingerprints found in one prior
+CODE_COMMON_FRACTION = float(os.environ.get('CODE_COMMON_FRACTION', 0.5))  # boilerplate: held by this share of students
+CODE_COMMON_MIN = _int('CODE_COMMON_MIN', 10)  # ... and by at least this many
+
+# Image and scanned-page near-duplicates (phash.py)
+PHASH_MAX_DISTANCE = _int('PHASH_MAX_DISTANCE', 8)  # differing bits (of 64) for two pages to count as the same
+PHASH_THRESHOLD = float(os.environ.get('PHASH_THRESHOLD', 0.5))  # share of pages found in one prior to reject
+PHASH_DPI = _int('PHASH_DPI', 72)  # scanned-PDF rasterization for hashing (OCR uses OCR_DPI)
+PHASH_REUSE_DISTANCE = _int('PHASH_REUSE_DISTANCE', 0)  # bits: reuse another student's page text only this close
+
+# Check pipeline (pipeline.py): stage order and time limits
+CHECK_STAGES = os.environ.get('CHECK_STAGES', '')  # comma-separated stage names; '' = every stage (logic.STAGES)
+CHECK_STAGE_TIMEOUTS = os.environ.get('CHECK_STAGE_TIMEOUTS', '')  # per-stage limits in seconds, e.g. 'ai=30,extract=120'
+CHECK_BUDGET_SECONDS = float(os.environ.get('CHECK_BUDGET_SECONDS', 180))  # whole check; then NEEDS REVIEW
+CHECK_INLINE_BUDGET_SECONDS = float(os.environ.get('CHECK_INLINE_BUDGET_SECONDS', 45))  # checks run in a web request
+
+# AI detection (logic.score_ai_content)
+MAX_TEXT_CHARS = _int('MAX_TEXT_CHARS', 20000)  # extracted text kept per document
+AI_WINDOW_TOKENS = _int('AI_WINDOW_TOKENS', 512)  # RoBERTa context, special tokens included
+AI_WINDOW_STRIDE = _int('AI_WINDOW_STRIDE', 64)  # tokens shared by neighbouring windows
+AI_BATCH_SIZE = _int('AI_BATCH_SIZE', 8)
+AI_THRESHOLD = float(os.environ.get('AI_THRESHOLD', 0.7))
+# Torch CPU threads per process; default splits the cores between the worker pool
+TORCH_NUM_THREADS = _int('TORCH_NUM_THREADS', max(1, (os.cpu_count() or 1) // WORKER_POOL_SIZE))
+TORCH_INTEROP_THREADS = _int('TORCH_INTEROP_THREADS', 1)
+
+# Scanned-document OCR (ocr.py)
+OCR_DPI = _int('OCR_DPI', 200)
+OCR_WORKERS = _int('OCR_WORKERS', min(4, os.cpu_count() or 1))  # pages OCR'd at once per document
+OCR_TORCH_THREADS = _int('OCR_TORCH_THREADS', 1)  # torch threads in each OCR pool process
+OCR_MAX_PAGES = _int('OCR_MAX_PAGES', 30)
+OCR_TIME_BUDGET = float(os.environ.get('OCR_TIME_BUDGET', 60))  # seconds per document
+OCR_BLANK_INK_RATIO = float(os.environ.get('OCR_BLANK_INK_RATIO', 0.002))
+
+# Logging and metrics (telemetry.py)
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # 'json' for one JSON object per line
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+METRICS_DIR = os.environ.get('METRICS_DIR')  # default: <instance>/metrics, shared by web and queue workers
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+
+# Web views (app.py)
+CATALOGUE_PAGE_SIZE = _int('CATALOGUE_PAGE_SIZE', 50)  # course search results per page
+REPORT_PAGE_SIZE = _int('REPORT_PAGE_SIZE', 50)  # submissions per integrity reports page
+QUERY_BUDGET = _int('QUERY_BUDGET', 0)  # warn when a request issues more SQL queries; 0 = off
+EXPORT_BATCH_ROWS = _int('EXPORT_BATCH_ROWS', 1000)  # rows fetched and encoded per chunk (export.py)
+
+# Course search (course_search.py)
+SEARCH_TYPEAHEAD_LIMIT = _int('SEARCH_TYPEAHEAD_LIMIT', 8)  # suggestions per typeahead answer
+SEARCH_CACHE_SECONDS = _int('SEARCH_CACHE_SECONDS', 30)  # typeahead answers reused per process; 0 = off
+SEARCH_CACHE_SIZE = _int('SEARCH_CACHE_SIZE', 2048)  # typeahead answers kept per process
+
+# Upload downloads (app.download_*): '' sends the file from the app (sendfile via wsgi.file_wrapper),
+# 'x-sendfile' (Apache/lighttpd) or 'x-accel' (nginx) hand the transfer to the front server
+DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', '')
+DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')  # nginx internal location
+DOWNLOAD_MAX_AGE = _int('DOWNLOAD_MAX_AGE', 3600)  # seconds a browser may reuse a download before revalidating
+
+# Bulk similarity audit (audit.py)
+AUDIT_WORKERS = _int('AUDIT_WORKERS', min(4, os.cpu_count() or 1))  # text-extraction processes
+AUDIT_MEMORY_MB = _int('AUDIT_MEMORY_MB', 256)  # budget for the dense similarity blocks
@@ -0,0 +1,157 @@
+"""
+🔎 COURSE SEARCH (SQLite FTS5)
+Course name, code and instructor username are indexed in an FTS5 table,
+course_fts, whose rowid is the course id. Triggers on course and user keep
+it in step with every insert, update and delete, whichever code path
+writes the row; they are created along with the course table (by
+create_all as well as by migration 11). Each word of a query is matched as a prefix ("cs1" finds
+CS101) and results are ranked by bm25, code hits weighted highest.
+
+Where SQLite was built without FTS5 the table is absent and search falls
+back to LIKE scans. Typeahead answers are cached per process for
+SEARCH_CACHE_SECONDS.
+
+    python course_search.py --rebuild   recreate the index from the course table
+"""
+
+import argparse
+import re
+import time
+from collections import OrderedDict
+
+from sqlalchemy import column, event, or_, select, table, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload
+
+import config
+from models import db, Course, User
+
+FTS_TABLE = 'course_fts'
+# bm25 column weights: name, code, faculty
+WEIGHTS = (4.0, 10.0, 2.0)
+
+_fts = table(FTS_TABLE, column('rowid'))
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, code, faculty, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS course_fts_insert AFTER INSERT ON course BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, name, code, faculty)
+        VALUES (new.id, new.name, new.code, (SELECT username FROM "user" WHERE id = new.faculty_id));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS course_fts_update AFTER UPDATE OF name, code, faculty_id ON course BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE} (rowid, name, code, faculty)
+        VALUES (new.id, new.name, new.code, (SELECT username FROM "user" WHERE id = new.faculty_id));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS course_fts_delete AFTER DELETE ON course BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS course_fts_faculty AFTER UPDATE OF username ON "user" BEGIN
+        UPDATE {FTS_TABLE} SET faculty = new.username
+        WHERE rowid IN (SELECT id FROM course WHERE faculty_id = new.id);
+    END""",
+]
+
+# Set once course_fts is seen, so searches stop asking sqlite_master
+_indexed = {}
+
+# Typeahead answers: normalized query -> (expires, rows), least recently used first
+_cache = OrderedDict()
+
+def create_index(conn):
+    """Create course_fts and its triggers and fill it from the course table.
+
+    Returns False (and creates nothing) when SQLite lacks FTS5.
+    """
+    try:
+        conn.execute(text("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)"))
+        conn.execute(text("DROP TABLE temp.fts5_probe"))
+    except OperationalError:
+        return False
+    for ddl in SCHEMA:
+        conn.execute(text(ddl))
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    conn.execute(text(f"""INSERT INTO {FTS_TABLE} (rowid, name, code, faculty)
+                          SELECT course.id, course.name, course.code, "user".username
+                          FROM course LEFT JOIN "user" ON "user".id = course.faculty_id"""))
+    return True
+
+@event.listens_for(Course.__table__, 'after_create')
+def _create_with_course(target, connection, **kw):
+    _indexed.clear()  # searches look for course_fts again
+    create_index(connection)
+
+def migration_step(conn):
+    if not create_index(conn):
+        print("SQLite was built without FTS5: course search falls back to LIKE scans.")
+
+def has_index():
+    if not _indexed:
+        found = db.session.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"),
+                                   {'n': FTS_TABLE}).first()
+        if found:
+            _indexed['course_fts'] = True
+    return bool(_indexed)
+
+def match_expression(query):
+    """FTS5 query matching every word of `query` as a prefix; None when it has no words."""
+    words = _WORD.findall(query or "")
+    return " ".join(f'"{w}"*' for w in words) or None
+
+def search_select(query):
+    """SELECT of the courses matching `query`, best first (every course, by name, when empty)."""
+    stmt = select(Course).options(joinedload(Course.faculty))
+    expression = match_expression(query)
+    if expression is None:
+        return stmt.order_by(Course.name, Course.id)
+    if has_index():
+        weights = ", ".join(str(w) for w in WEIGHTS)
+        return stmt.join(_fts, _fts.c.rowid == Course.id) \
+            .where(text(f"{FTS_TABLE} MATCH :expression").bindparams(expression=expression)) \
+            .order_by(text(f"bm25({FTS_TABLE}, {weights})"), Course.name)
+    faculty = select(User.id)
+    for word in _WORD.findall(query):
+        like = f"%{word}%"
+        faculty_ids = faculty.where(User.username.ilike(like))
+        stmt = stmt.where(or_(Course.name.ilike(like), Course.code.ilike(like), Course.faculty_id.in_(faculty_ids)))
+    return stmt.order_by(Course.name, Course.id)
+
+def search(query, page=1, per_page=None):
+    """One page (a flask_sqlalchemy Pagination) of the courses matching `query`."""
+    return db.paginate(search_select(query), page=page, per_page=per_page or config.CATALOGUE_PAGE_SIZE,
+                       error_out=False)
+
+def suggest(query, limit=None):
+    """Top matches as JSON-ready dicts, cached per process for SEARCH_CACHE_SECONDS."""
+    key = " ".join(_WORD.findall((query or "").lower()))
+    if not key:
+        return []
+    limit = limit or config.SEARCH_TYPEAHEAD_LIMIT
+    now = time.monotonic()
+    hit = _cache.get((key, limit))
+    if hit and hit[0] > now:
+        _cache.move_to_end((key, limit))
+        return hit[1]
+    courses = db.session.scalars(search_select(key).limit(limit)).unique().all()
+    rows = [{'id': c.id, 'name': c.name, 'code': c.code, 'faculty': c.faculty.username} for c in courses]
+    if config.SEARCH_CACHE_SECONDS > 0:
+        _cache[(key, limit)] = (now + config.SEARCH_CACHE_SECONDS, rows)
+        _cache.move_to_end((key, limit))
+        while len(_cache) > config.SEARCH_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rows
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Course full-text search index")
+    parser.add_argument('--rebuild', action='store_true', help="recreate course_fts from the course table")
+    args = parser.parse_args()
+    with app.app_context():
+        if args.rebuild:
+            with db.engine.begin() as conn:
+                print("Rebuilt course_fts." if create_index(conn) else "SQLite was built without FTS5.")
+        else:
+            print(f"course_fts: {'present' if has_index() else 'absent (LIKE fallback)'}")
@@ -0,0 +1,86 @@
+"""
+🧭 COURSE EMBEDDING INDEX
+Each accepted submission's MiniLM embedding is computed once and stored on
+the row as a float32 blob. Per course, those rows are stacked into one
+matrix (cached per process), so a new submission is scored against every
+prior with a single matrix-vector product.
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+import config
+import telemetry
+from models import Course
+
+# course_id -> CourseMatrix, least recently used first
+_cache = OrderedDict()
+
+def to_blob(vector):
+    """Unit-normalise and serialise an embedding as float32 bytes."""
+    vec = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vec)
+    return (vec / norm if norm else vec).tobytes()
+
+def from_blob(blob):
+    return np.frombuffer(blob, dtype=np.float32)
+
+class CourseMatrix:
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.matrix = None
+        self.version = None
+
+    def refresh(self, course_id, Submission):
+        """Bring the matrix up to date, fetching blobs only for new rows."""
+        accepted = Submission.query.filter(
+            Submission.course_id == course_id,
+            Submission.status == 'accepted',
+            Submission.embedding.isnot(None))
+        # Moves on every change to the course's accepted rows (models.maintain_integrity_stats)
+        version = Submission.query.session.query(Course.corpus_version).filter(Course.id == course_id).scalar()
+        if version is not None and version == self.version:
+            return self
+
+        current = {row[0] for row in accepted.with_entities(Submission.id)}
+        keep = np.isin(self.ids, list(current))
+        self.ids, self.user_ids = self.ids[keep], self.user_ids[keep]
+        if self.matrix is not None:
+            self.matrix = self.matrix[keep]
+
+        new_ids = current.difference(self.ids.tolist())
+        if new_ids:
+            rows = accepted.filter(Submission.id.in_(new_ids)) \
+                .with_entities(Submission.id, Submission.user_id, Submission.embedding).all()
+            block = np.vstack([from_blob(r[2]) for r in rows])
+            self.ids = np.concatenate([self.ids, [r[0] for r in rows]]).astype(np.int64)
+            self.user_ids = np.concatenate([self.user_ids, [r[1] for r in rows]]).astype(np.int64)
+            self.matrix = block if self.matrix is None or not len(self.matrix) else np.vstack([self.matrix, block])
+
+        self.version = version
+        return self
+
+def course_matrix(course_id, Submission):
+    entry = _cache.pop(course_id, None)
+    telemetry.inc('lyken_embedding_cache_lookups_total', result='hit' if entry else 'miss')
+    entry = entry or CourseMatrix()
+    _cache[course_id] = entry.refresh(course_id, Submission)
+    while len(_cache) > config.EMBEDDING_CACHE_COURSES:
+        _cache.popitem(last=False)
+    return entry
+
+def search(course_id, query_vector, exclude_user_id, Submission):
+    """Cosine similarity of the query against every accepted prior in the course.
+
+    Returns [(submission_id, similarity)] sorted best first, excluding the
+    submitting student's own work.
+    """
+    entry = course_matrix(course_id, Submission)
+    if entry.matrix is None or not len(entry.ids):
+        return []
+    query = from_blob(to_blob(query_vector))
+    sims = entry.matrix @ query
+    sims[entry.user_ids == exclude_user_id] = -np.inf
+    order = np.argsort(-sims)
+    return [(int(entry.ids[i]), float(sims[i])) for i in order if np.isfinite(sims[i])]
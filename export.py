@@ -0,0 +1,144 @@
+"""
+📤 SUBMISSION EXPORT
+Submission-level integrity data for a course or assignment as CSV or JSON
+Lines. Filters (status, score range, date window) are part of the SQL
+query; rows are read from a streaming cursor EXPORT_BATCH_ROWS at a time
+and encoded as they arrive, so memory stays flat however large the course.
+
+    python export.py --course 1 [--format jsonl] [--output reports.jsonl]
+    python export.py --assignment 3 --status rejected --min-score 0.5 --since 2026-01-01
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+from sqlalchemy import select
+
+import config
+from models import db, User, Assignment, Submission
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+FIELDS = ['submission_id', 'course_id', 'assignment_id', 'assignment', 'user_id', 'username', 'status',
+          'score', 'ai_score', 'reason', 'timestamp', 'content_hash', 'filename']
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def export_select(course_id=None, assignment_id=None, status=None, min_score=None, max_score=None,
+                  since=None, until=None):
+    """SELECT of the export columns, filtered in SQL; the date window is [since, until)."""
+    stmt = select(Submission.id, Submission.course_id, Submission.assignment_id, Assignment.title,
+                  Submission.user_id, User.username, Submission.status, Submission.score,
+                  Submission.ai_score, Submission.reason, Submission.timestamp, Submission.content_hash,
+                  Submission.filename) \
+        .join(User, User.id == Submission.user_id) \
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+    if course_id is not None:
+        stmt = stmt.where(Submission.course_id == course_id)
+    if assignment_id is not None:
+        stmt = stmt.where(Submission.assignment_id == assignment_id)
+    if status:
+        stmt = stmt.where(Submission.status.in_(status if isinstance(status, (list, tuple)) else [status]))
+    if min_score is not None:
+        stmt = stmt.where(Submission.score >= min_score)
+    if max_score is not None:
+        stmt = stmt.where(Submission.score <= max_score)
+    if since is not None:
+        stmt = stmt.where(Submission.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(Submission.timestamp < until)
+    return stmt.order_by(Submission.id)
+
+def stream_rows(stmt, batch=None):
+    """Yield the rows of `stmt` as dicts from a server-side cursor, one batch in memory at a time."""
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch or config.EXPORT_BATCH_ROWS) \
+            .execute(stmt)
+        for row in result:
+            record = dict(zip(FIELDS, row))
+            if record['timestamp'] is not None:
+                record['timestamp'] = record['timestamp'].isoformat()
+            yield record
+
+def _batched(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def spreadsheet_safe(record):
+    """The record with text cells that a spreadsheet would run as a formula quoted by a leading '."""
+    return {k: "'" + v if isinstance(v, str) and v.startswith(FORMULA_PREFIXES) else v for k, v in record.items()}
+
+def encode(rows, fmt='csv', batch=None):
+    """Yield the export as text chunks of about EXPORT_BATCH_ROWS rows each.
+
+    CSV cells of student-controlled text (usernames, file names) are
+    neutralized with spreadsheet_safe; JSON Lines are left as they are.
+    """
+    batch = batch or config.EXPORT_BATCH_ROWS
+    if fmt == 'jsonl':
+        for chunk in _batched(rows, batch):
+            yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in chunk)
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    for chunk in _batched(rows, batch):
+        writer.writerows(spreadsheet_safe(r) for r in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # header only: no rows matched
+
+def parse_filters(args):
+    """Export filters from request/CLI arguments; ValueError on a malformed value."""
+    def number(name):
+        value = args.get(name)
+        return float(value) if value not in (None, '') else None
+
+    def moment(name):
+        value = args.get(name)
+        return datetime.fromisoformat(value) if value else None
+
+    status = args.get('status')
+    return {'status': status.split(",") if status else None,
+            'min_score': number('min_score'), 'max_score': number('max_score'),
+            'since': moment('since'), 'until': moment('until')}
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Stream submission integrity data as CSV or JSON Lines")
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument('--assignment', type=int)
+    scope.add_argument('--course', type=int)
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--status', help="comma-separated statuses, e.g. rejected,pending")
+    parser.add_argument('--min-score', dest='min_score')
+    parser.add_argument('--max-score', dest='max_score')
+    parser.add_argument('--since', help="ISO date or datetime (inclusive)")
+    parser.add_argument('--until', help="ISO date or datetime (exclusive)")
+    parser.add_argument('--output', help="file to write (default: stdout)")
+    args = parser.parse_args()
+    try:
+        filters = parse_filters(vars(args))
+    except ValueError as e:
+        parser.error(str(e))
+    with app.app_context():
+        stmt = export_select(course_id=args.course, assignment_id=args.assignment, **filters)
+        out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+        try:
+            for text in encode(stream_rows(stmt), args.format):
+                out.write(text)
+        finally:
+            if args.output:
+                out.close()
@@ -0,0 +1,31 @@
+"""
+🦄 GUNICORN SETTINGS
+Run with:  gunicorn -c gunicorn.conf.py app:app
+
+With PRELOAD_MODELS=1 the master imports the app and loads every model
+once before forking, so workers share the model pages copy-on-write
+instead of each paying the load time and RSS. With a model server
+running (python model_server.py), workers hold only socket proxies.
+"""
+
+import os
+import time
+
+import config
+
+_started = time.perf_counter()
+
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+preload_app = config.PRELOAD_MODELS
+
+def when_ready(server):
+    import logic
+    if config.PRELOAD_MODELS:
+        logic.preload_models()
+    server.log.info(f"Master ready in {time.perf_counter() - _started:.2f}s: {logic.startup_report()}")
+
+def post_fork(server, worker):
+    import logic
+    server.log.info(f"Worker {worker.pid} forked: {logic.startup_report()}")
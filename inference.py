@@ -0,0 +1,353 @@
+"""
+🧠 INFERENCE BACKENDS
+The RoBERTa AI detector and the MiniLM encoder behind one interface, with
+the runtime chosen by MODEL_BACKEND:
+
+    torch   eager PyTorch (transformers / sentence-transformers) - the fallback
+    onnx    the same models exported to ONNX, int8 dynamically quantized,
+            run by onnxruntime on CPU
+    stub    deterministic fakes (stub_models.py), no downloads
+
+A detector exposes token_ids(text), special_tokens and predict(windows)
+-> [P(AI)]; an encoder exposes encode(texts, batch_size) like
+SentenceTransformer. If the ONNX runtime or exported files are missing,
+the torch backend is used instead. OCR is EasyOCR (or the stub) on every
+backend.
+
+    python inference.py export              write the int8 models to ONNX_MODEL_DIR
+    python inference.py parity [--from-store 200]
+                                            bound ONNX score drift against torch
+    python inference.py bench               latency / memory, torch vs onnx
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import config
+import stub_models
+import telemetry
+
+log = telemetry.get_logger('inference')
+
+AI_DETECTOR = "openai-community/roberta-base-openai-detector"
+ENCODER = "sentence-transformers/all-MiniLM-L6-v2"
+ENCODER_MAX_TOKENS = 256  # all-MiniLM-L6-v2's max_seq_length
+
+DETECTOR_FILE = 'detector.int8.onnx'
+ENCODER_FILE = 'encoder.int8.onnx'
+
+# Parity bounds of the int8 models against torch (`parity` command, tests/test_inference.py)
+MAX_PROB_DRIFT = 0.05  # largest |AI probability difference| over the sampled windows
+MIN_COSINE = 0.98  # smallest cosine between the two embeddings of a text
+
+def model_dir():
+    return config.ONNX_MODEL_DIR or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'onnx')
+
+def configure_torch_threads(threads=None):
+    """Cap torch's CPU thread pools so a pool of workers doesn't oversubscribe cores.
+
+    The first call in a process wins (default: TORCH_NUM_THREADS).
+    """
+    import torch
+    if getattr(configure_torch_threads, 'done', False):
+        return
+    torch.set_num_threads(threads or config.TORCH_NUM_THREADS)
+    try:
+        torch.set_num_interop_threads(config.TORCH_INTEROP_THREADS)
+    except RuntimeError:
+        pass  # only settable before the first parallel op in this process
+    configure_torch_threads.done = True
+
+def _softmax(logits):
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+# --- AI DETECTOR ---
+
+class _Detector:
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.special_tokens = tokenizer.num_special_tokens_to_add()
+
+    def token_ids(self, text):
+        return self.tokenizer(text, add_special_tokens=False, verbose=False)['input_ids']
+
+    def _inputs(self, windows, tensors):
+        return self.tokenizer.pad(
+            {'input_ids': [self.tokenizer.build_inputs_with_special_tokens(w) for w in windows]},
+            return_tensors=tensors)
+
+class TorchDetector(_Detector):
+    backend = 'torch'
+
+    def __init__(self):
+        configure_torch_threads()
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+        super().__init__(AutoTokenizer.from_pretrained(AI_DETECTOR))
+        self.model = AutoModelForSequenceClassification.from_pretrained(AI_DETECTOR)
+        self.model.eval()
+
+    def predict(self, windows):
+        import torch
+        with torch.no_grad():
+            logits = self.model(**self._inputs(windows, 'pt')).logits
+        return torch.softmax(logits, dim=-1)[:, 1].tolist()
+
+class OnnxDetector(_Detector):
+    backend = 'onnx'
+
+    def __init__(self, directory=None):
+        directory = directory or model_dir()
+        self.session = _session(os.path.join(directory, DETECTOR_FILE))
+        from transformers import AutoTokenizer
+        super().__init__(AutoTokenizer.from_pretrained(os.path.join(directory, 'detector')))
+
+    def predict(self, windows):
+        inputs = self._inputs(windows, 'np')
+        logits = self.session.run(['logits'], {'input_ids': inputs['input_ids'].astype(np.int64),
+                                               'attention_mask': inputs['attention_mask'].astype(np.int64)})[0]
+        return _softmax(logits)[:, 1].tolist()
+
+# --- SENTENCE ENCODER ---
+
+def _torch_encoder():
+    configure_torch_threads()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('all-MiniLM-L6-v2')
+
+class OnnxEncoder:
+    """SentenceTransformer.encode lookalike: mean pooling + L2 norm, as all-MiniLM-L6-v2 does."""
+    backend = 'onnx'
+
+    def __init__(self, directory=None):
+        directory = directory or model_dir()
+        self.session = _session(os.path.join(directory, ENCODER_FILE))
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.join(directory, 'encoder'))
+
+    def encode(self, texts, batch_size=32, **_):
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        vectors = []
+        for start in range(0, len(batch), batch_size):
+            enc = self.tokenizer(batch[start:start + batch_size], padding=True, truncation=True,
+                                 max_length=ENCODER_MAX_TOKENS, return_tensors='np')
+            hidden = self.session.run(None, {name: enc[name].astype(np.int64) for name in self.input_names})[0]
+            mask = enc['attention_mask'][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            vectors.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        out = np.vstack(vectors).astype(np.float32) if vectors else np.zeros((0, 384), dtype=np.float32)
+        return out[0] if single else out
+
+def _session(path):
+    import onnxruntime as ort
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found - run: python inference.py export")
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = config.TORCH_NUM_THREADS
+    options.inter_op_num_threads = config.TORCH_INTEROP_THREADS
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+# --- BACKEND SELECTION ---
+
+def load_detector(backend=None):
+    backend = backend or config.MODEL_BACKEND
+    if backend == 'stub':
+        return stub_models.StubAIDetector()
+    if backend == 'onnx':
+        try:
+            return OnnxDetector()
+        except (ImportError, OSError) as e:
+            log.warning("ONNX detector unavailable, using torch", error=str(e))
+    return TorchDetector()
+
+def load_ocr_reader(backend=None):
+    if (backend or config.MODEL_BACKEND) == 'stub':
+        return stub_models.StubOCRReader()
+    configure_torch_threads()
+    import easyocr
+    return easyocr.Reader(['en'], gpu=False)
+
+def load_encoder(backend=None):
+    backend = backend or config.MODEL_BACKEND
+    if backend == 'stub':
+        return stub_models.StubSemanticModel()
+    if backend == 'onnx':
+        try:
+            return OnnxEncoder()
+        except (ImportError, OSError) as e:
+            log.warning("ONNX encoder unavailable, using torch", error=str(e))
+    return _torch_encoder()
+
+# --- EXPORT ---
+
+def _export(model, sample, path, input_names, output_name):
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    fp32 = path.replace('.int8.onnx', '.fp32.onnx')
+    model.config.return_dict = False
+    axes = {name: {0: 'batch', 1: 'tokens'} for name in input_names}
+    axes[output_name] = {0: 'batch'}
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in input_names), fp32, input_names=input_names,
+                          output_names=[output_name], dynamic_axes=axes, opset_version=17)
+    quantize_dynamic(fp32, path, weight_type=QuantType.QInt8)
+    os.remove(fp32)
+    log.info("📦 Exported", path=path, mb=round(os.path.getsize(path) / 2**20, 1))
+
+def export(directory=None):
+    """Export both models to ONNX and quantize their weights to int8."""
+    from transformers import AutoTokenizer, AutoModel, AutoModelForSequenceClassification
+    directory = directory or model_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(AI_DETECTOR)
+    model = AutoModelForSequenceClassification.from_pretrained(AI_DETECTOR).eval()
+    sample = tokenizer(["An example sentence to trace the graph."], return_tensors='pt')
+    _export(model, sample, os.path.join(directory, DETECTOR_FILE), ['input_ids', 'attention_mask'], 'logits')
+    tokenizer.save_pretrained(os.path.join(directory, 'detector'))
+
+    tokenizer = AutoTokenizer.from_pretrained(ENCODER)
+    model = AutoModel.from_pretrained(ENCODER).eval()
+    sample = tokenizer(["An example sentence to trace the graph."], return_tensors='pt')
+    _export(model, sample, os.path.join(directory, ENCODER_FILE),
+            [n for n in ('input_ids', 'attention_mask', 'token_type_ids') if n in sample], 'last_hidden_state')
+    tokenizer.save_pretrained(os.path.join(directory, 'encoder'))
+
+def token_windows(detector, text):
+    """Overlapping windows of AI_WINDOW_TOKENS (special tokens included), AI_WINDOW_STRIDE apart."""
+    ids = detector.token_ids(text)
+    if not ids:
+        return []
+    size = config.AI_WINDOW_TOKENS - detector.special_tokens
+    step = max(1, size - config.AI_WINDOW_STRIDE)
+    return [ids[i:i + size] for i in range(0, max(len(ids) - config.AI_WINDOW_STRIDE, 1), step)]
+
+# --- PARITY AND BENCHMARK ---
+
+def sample_texts(count, from_store=0, seed=0):
+    """Real texts from the text store when asked for, topped up with synthetic ones."""
+    texts = []
+    if from_store:
+        from app import app
+        from models import ExtractedText
+        with app.app_context():
+            texts = [t for (t,) in ExtractedText.query.with_entities(ExtractedText.text)
+                     .filter(ExtractedText.size > 200).limit(from_store)]
+    import bench
+    rng = np.random.default_rng(seed)
+    vocab = bench.vocabulary(rng)
+    while len(texts) < count:
+        texts.append(" ".join(bench.make_sentences(rng, vocab, int(rng.integers(5, 60)))))
+    return texts
+
+
+def parity(texts, max_prob_drift, min_cosine):
+    """Compare ONNX outputs with torch on the same inputs; returns (report, ok)."""
+    reference, candidate = TorchDetector(), OnnxDetector()
+    drift, flips = [], 0
+    for text in texts:
+        windows = token_windows(reference, text)[:config.AI_BATCH_SIZE]
+        if not windows:
+            continue
+        expected, actual = np.array(reference.predict(windows)), np.array(candidate.predict(windows))
+        drift.extend(np.abs(expected - actual).tolist())
+        flips += int(((expected > config.AI_THRESHOLD) != (actual > config.AI_THRESHOLD)).sum())
+
+    ref_vectors = _torch_encoder().encode([t[:1200] for t in texts], batch_size=32, normalize_embeddings=True)
+    onnx_vectors = OnnxEncoder().encode([t[:1200] for t in texts], batch_size=32)
+    cosines = (np.asarray(ref_vectors) * onnx_vectors).sum(axis=1)
+
+    report = {
+        'texts': len(texts),
+        'ai_windows': len(drift),
+        'ai_prob_drift_max': round(float(np.max(drift)), 5) if drift else 0.0,
+        'ai_prob_drift_mean': round(float(np.mean(drift)), 5) if drift else 0.0,
+        'ai_decision_flips': flips,
+        'embedding_cosine_min': round(float(cosines.min()), 5),
+        'embedding_cosine_mean': round(float(cosines.mean()), 5),
+    }
+    ok = report['ai_prob_drift_max'] <= max_prob_drift and report['embedding_cosine_min'] >= min_cosine
+    return report, ok
+
+def _bench_one(backend, rounds):
+    """Measure one backend in this (fresh) process; printed as JSON for bench()."""
+    import bench as pipeline_bench
+    started = time.perf_counter()
+    rss_before = pipeline_bench.current_rss_mb()
+    detector, encoder = load_detector(backend), load_encoder(backend)
+    load_seconds = time.perf_counter() - started
+    texts = sample_texts(32)
+    windows = [w for t in texts for w in token_windows(detector, t)]
+    batch = (windows * config.AI_BATCH_SIZE)[:config.AI_BATCH_SIZE]
+
+    stages = {}
+    for name, fn in (('detector_batch', lambda: detector.predict(batch)),
+                     ('encoder_32_docs', lambda: encoder.encode([t[:1200] for t in texts], batch_size=32))):
+        fn()  # warm-up run, not counted
+        with pipeline_bench.Stage(name) as stage:
+            for _ in range(rounds):
+                stage.call(fn)
+        stages[name] = stage.summary()
+    print(json.dumps({'backend': getattr(detector, 'backend', backend), 'load_seconds': round(load_seconds, 2),
+                      'model_rss_mb': round(pipeline_bench.current_rss_mb() - rss_before, 1), 'stages': stages}))
+
+def bench(backends, rounds, out=None):
+    results = []
+    for backend in backends:
+        # One process per backend, so RSS and thread pools are measured in isolation
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '_bench-one', backend, str(rounds)],
+                              capture_output=True, text=True, env=dict(os.environ, LOG_LEVEL='WARNING'))
+        if proc.returncode:
+            print(f"❌ {backend}: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    print(f"\n{'backend':<8}{'load s':>8}{'model MB':>10}{'detector p50/p95 ms':>22}{'encoder p50/p95 ms':>22}")
+    for r in results:
+        det, enc = r['stages']['detector_batch'], r['stages']['encoder_32_docs']
+        print(f"{r['backend']:<8}{r['load_seconds']:>8}{r['model_rss_mb']:>10}"
+              f"{det['p50_ms']:>13} / {det['p95_ms']:<6}{enc['p50_ms']:>13} / {enc['p95_ms']:<6}")
+    if out:
+        with open(out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results saved to {out}")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export, verify and benchmark the ONNX inference backend")
+    commands = parser.add_subparsers(dest='command', required=True)
+    cmd = commands.add_parser('export', help="export both models to int8 ONNX")
+    cmd.add_argument('--out', help="output folder (default: ONNX_MODEL_DIR)")
+    cmd = commands.add_parser('parity', help="bound ONNX drift against torch")
+    cmd.add_argument('--texts', type=int, default=100, help="texts to compare")
+    cmd.add_argument('--from-store', type=int, default=0, help="take up to N real texts from the text store")
+    cmd.add_argument('--max-prob-drift', type=float, default=MAX_PROB_DRIFT)
+    cmd.add_argument('--min-cosine', type=float, default=MIN_COSINE)
+    cmd = commands.add_parser('bench', help="latency and memory of each backend")
+    cmd.add_argument('--backends', default='torch,onnx')
+    cmd.add_argument('--rounds', type=int, default=20)
+    cmd.add_argument('--out')
+    cmd = commands.add_parser('_bench-one')
+    cmd.add_argument('backend')
+    cmd.add_argument('rounds', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export(args.out)
+    elif args.command == 'parity':
+        report, ok = parity(sample_texts(args.texts, args.from_store), args.max_prob_drift, args.min_cosine)
+        print(json.dumps(report, indent=2))
+        print("✅ ONNX within parity bounds" if ok else "❌ ONNX drift exceeds parity bounds")
+        sys.exit(0 if ok else 1)
+    elif args.command == 'bench':
+        bench(args.backends.split(','), args.rounds, args.out)
+    else:
+        _bench_one(args.backend, args.rounds)
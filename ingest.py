@@ -0,0 +1,110 @@
+"""
+📥 UPLOAD INGEST
+Uploads are hashed while werkzeug streams them to disk and stored once per
+distinct content under their SHA-256 (<blob folder>/ab/abcdef...). The
+per-submission name in the upload folder is a hard link to that blob, so
+a file resubmitted by forty students occupies disk space once, and the
+hash is known before anything is written a second time.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from flask import Request
+
+CHUNK_SIZE = 1024 * 1024
+
+class HashingTempFile:
+    """Spool file for one upload: hashes every chunk as it is written."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', buffering=CHUNK_SIZE)
+        self._hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hasher.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hasher.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+class IngestRequest(Request):
+    """Request class whose multipart parser spools files through HashingTempFile."""
+
+    blob_folder = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.blob_folder is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return HashingTempFile(self.blob_folder)
+
+def blob_path(blob_folder, digest):
+    return os.path.join(blob_folder, digest[:2], digest)
+
+def _publish(src_path, target):
+    """Make src_path's content available at target without copying if possible."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(src_path, target)
+    except FileExistsError:
+        pass  # another request stored the same content first
+    except OSError:
+        shutil.copyfile(src_path, target)
+
+def store_upload(file_storage, blob_folder):
+    """Store an uploaded file by content. Returns (sha256_hex, blob_path, is_new)."""
+    stream = file_storage.stream
+    if isinstance(stream, HashingTempFile):
+        stream.flush()
+        digest = stream.hexdigest()
+        target = blob_path(blob_folder, digest)
+        is_new = not os.path.exists(target)
+        if is_new:
+            _publish(stream.name, target)
+        return digest, target, is_new
+
+    # Fallback for streams not spooled by IngestRequest: hash while copying once
+    os.makedirs(blob_folder, exist_ok=True)
+    hasher = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=blob_folder, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb', buffering=CHUNK_SIZE) as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                hasher.update(chunk)
+                out.write(chunk)
+        digest = hasher.hexdigest()
+        target = blob_path(blob_folder, digest)
+        is_new = not os.path.exists(target)
+        if is_new:
+            _publish(tmp_path, target)
+    finally:
+        os.unlink(tmp_path)
+    return digest, target, is_new
+
+def file_digest(path):
+    """SHA-256 of a file already on disk, read in CHUNK_SIZE pieces."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def link_blob(blob, dest):
+    """Expose a blob under a per-record name (hard link; copy across filesystems)."""
+    if os.path.exists(dest):
+        os.unlink(dest)
+    try:
+        os.link(blob, dest)
+    except OSError:
+        shutil.copyfile(blob, dest)
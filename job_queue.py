@@ -0,0 +1,139 @@
+"""
+📬 LOCAL JOB QUEUE
+A small durable work queue on a SQLite file, standing in for an external
+broker. Producers (web workers) put jobs, worker.py processes claim them.
+A claimed job that is never acked becomes visible again after the
+visibility timeout, so a crashed worker doesn't lose submissions.
+
+Jobs are served earliest priority first (submission checks use their
+assignment's deadline; jobs without one come last), and a student never
+has more than ADMISSION_USER_SLOTS jobs running at once.
+"""
+
+import json
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import config
+
+Job = namedtuple('Job', 'id task payload attempts')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    priority REAL,
+    user_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_job_state ON job (state, id);
+"""
+
+# Columns added after the first release; queue files created earlier get them on open
+LATER_COLUMNS = [('priority', 'REAL'), ('user_id', 'INTEGER')]
+
+class SQLiteQueue:
+    def __init__(self, path, visibility_timeout=None, max_attempts=None):
+        self.path = path
+        self.visibility_timeout = visibility_timeout or config.JOB_VISIBILITY_TIMEOUT
+        self.max_attempts = max_attempts or config.JOB_MAX_ATTEMPTS
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(job)")}
+            for column, ddl_type in LATER_COLUMNS:
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE job ADD COLUMN {column} {ddl_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_job_state_priority ON job (state, priority, id)")
+
+    @contextmanager
+    def _connect(self):
+        # A fresh connection per call keeps the queue safe across threads and forks
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def put(self, task, payload, priority=None, user_id=None):
+        """Queue a job; lower priority values run first, None after all others."""
+        with self._connect() as conn:
+            cur = conn.execute("INSERT INTO job (task, payload, created_at, priority, user_id) VALUES (?, ?, ?, ?, ?)",
+                               (task, json.dumps(payload), time.time(), priority, user_id))
+            return cur.lastrowid
+
+    def get(self, timeout=None, poll_interval=0.5):
+        """Claim the oldest runnable job; wait up to timeout seconds for one."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self._claim()
+            if job is not None or (deadline is not None and time.monotonic() >= deadline):
+                return job
+            time.sleep(poll_interval)
+
+    def _claim(self):
+        now = time.time()
+        stale = now - self.visibility_timeout
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, task, payload, attempts FROM job "
+                    "WHERE (state = 'queued' OR (state = 'running' AND claimed_at < ?)) "
+                    "AND (user_id IS NULL OR user_id NOT IN ("
+                    "    SELECT user_id FROM job WHERE state = 'running' AND claimed_at >= ? AND user_id IS NOT NULL "
+                    "    GROUP BY user_id HAVING COUNT(*) >= ?)) "
+                    "ORDER BY priority IS NULL, priority, id LIMIT 1",
+                    (stale, stale, config.ADMISSION_USER_SLOTS)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE job SET state = 'running', attempts = attempts + 1, claimed_at = ? WHERE id = ?",
+                                 (now, row[0]))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return Job(row[0], row[1], json.loads(row[2]), row[3] + 1) if row else None
+
+    def ack(self, job_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM job WHERE id = ?", (job_id,))
+
+    def fail(self, job_id, error):
+        """Requeue a failed job, or park it as 'failed' once attempts run out.
+        Returns True when the job will not be retried."""
+        with self._connect() as conn:
+            attempts = conn.execute("SELECT attempts FROM job WHERE id = ?", (job_id,)).fetchone()
+            final = attempts is None or attempts[0] >= self.max_attempts
+            conn.execute("UPDATE job SET state = ?, error = ?, claimed_at = NULL WHERE id = ?",
+                         ('failed' if final else 'queued', str(error)[:1000], job_id))
+            return final
+
+    def active_checks(self, submission_ids):
+        """Those of the submission ids with a check job queued or running."""
+        ids = list(submission_ids)
+        if not ids:
+            return set()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT json_extract(payload, '$.submission_id') FROM job "
+                "WHERE task = 'check_submission' AND state IN ('queued', 'running') "
+                f"AND json_extract(payload, '$.submission_id') IN ({','.join('?' * len(ids))})", ids).fetchall()
+        return {row[0] for row in rows}
+
+    def depth(self):
+        """Jobs waiting or in progress."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM job WHERE state IN ('queued', 'running')").fetchone()[0]
+
+    def overdue(self, now=None):
+        """Queued jobs whose priority (deadline) has already passed."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM job WHERE state = 'queued' AND priority < ?",
+                                (now or time.time(),)).fetchone()[0]
@@ -0,0 +1,115 @@
+"""
+🔤 COURSE LEXICAL INDEX (TF-IDF)
+Each submission's word and bigram counts are hashed into a fixed feature
+space (stateless: no vocabulary to fit) and stored on the row as a sparse
+blob. Per course, accepted rows are stacked into one CSR matrix (cached
+per process) whose document frequencies are updated incrementally as new
+rows arrive, so IDF reflects the whole course rather than a single pair,
+and a new submission is scored against every prior with one sparse
+matrix product.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+import config
+import telemetry
+from models import Course
+
+# Same tokenization as the old pairwise TfidfVectorizer; raw counts, weighted at query time
+_vectorizer = HashingVectorizer(n_features=config.LEXICAL_FEATURES, ngram_range=(1, 2), stop_words='english',
+                                alternate_sign=False, norm=None, dtype=np.float32)
+
+# course_id -> CourseLexicon, least recently used first
+_cache = OrderedDict()
+
+def term_counts(text):
+    """1 x LEXICAL_FEATURES sparse row of hashed term counts."""
+    return _vectorizer.transform([text])
+
+def pair_similarity(text1, text2):
+    """Cosine of two texts' hashed term counts, for scoring outside any course."""
+    rows = normalize(_vectorizer.transform([text1, text2]))
+    return float((rows[0] @ rows[1].T).toarray()[0, 0])
+
+def to_blob(row):
+    """Serialise a sparse count row as uint32 indices followed by float32 counts."""
+    row = sparse.csr_matrix(row)
+    return row.indices.astype('<u4').tobytes() + row.data.astype('<f4').tobytes()
+
+def from_blob(blob):
+    half = len(blob) // 2
+    indices = np.frombuffer(blob[:half], dtype='<u4')
+    data = np.frombuffer(blob[half:], dtype='<f4')
+    return sparse.csr_matrix((data, indices, [0, len(indices)]), shape=(1, config.LEXICAL_FEATURES))
+
+class CourseLexicon:
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.counts = sparse.csr_matrix((0, config.LEXICAL_FEATURES), dtype=np.float32)
+        self.df = np.zeros(config.LEXICAL_FEATURES, dtype=np.float32)
+        self.weighted = None
+        self.version = None
+
+    def idf(self):
+        """Smoothed IDF over the course's accepted submissions (sklearn's formula)."""
+        return np.log((1 + len(self.ids)) / (1 + self.df)) + 1
+
+    def refresh(self, course_id, Submission):
+        """Bring the matrix and document frequencies up to date with the accepted rows."""
+        accepted = Submission.query.filter(
+            Submission.course_id == course_id,
+            Submission.status == 'accepted',
+            Submission.terms.isnot(None))
+        # Moves on every change to the course's accepted rows (models.maintain_integrity_stats)
+        version = Submission.query.session.query(Course.corpus_version).filter(Course.id == course_id).scalar()
+        if version is not None and version == self.version:
+            return self
+
+        current = {row[0] for row in accepted.with_entities(Submission.id)}
+        keep = np.isin(self.ids, list(current))
+        if not keep.all():
+            # Rows left the corpus: drop them and recount document frequencies
+            self.ids, self.user_ids, self.counts = self.ids[keep], self.user_ids[keep], self.counts[keep]
+            self.df = np.asarray((self.counts > 0).sum(axis=0), dtype=np.float32).ravel()
+
+        new_ids = current.difference(self.ids.tolist())
+        if new_ids:
+            rows = accepted.filter(Submission.id.in_(new_ids)) \
+                .with_entities(Submission.id, Submission.user_id, Submission.terms).all()
+            block = sparse.vstack([from_blob(r[2]) for r in rows], format='csr')
+            self.ids = np.concatenate([self.ids, [r[0] for r in rows]]).astype(np.int64)
+            self.user_ids = np.concatenate([self.user_ids, [r[1] for r in rows]]).astype(np.int64)
+            self.counts = sparse.vstack([self.counts, block], format='csr')
+            # Incremental IDF: only the new documents' terms change their frequencies
+            np.add.at(self.df, block.indices, 1)
+
+        self.weighted = normalize(self.counts @ sparse.diags(self.idf().astype(np.float32)))
+        self.version = version
+        return self
+
+def course_lexicon(course_id, Submission):
+    entry = _cache.pop(course_id, None)
+    telemetry.inc('lyken_lexical_cache_lookups_total', result='hit' if entry else 'miss')
+    entry = entry or CourseLexicon()
+    _cache[course_id] = entry.refresh(course_id, Submission)
+    while len(_cache) > config.LEXICAL_CACHE_COURSES:
+        _cache.popitem(last=False)
+    return entry
+
+def search(course_id, query_counts, exclude_user_id, Submission):
+    """TF-IDF cosine similarity of the query against every accepted prior in the course.
+
+    Returns {submission_id: similarity}, excluding the submitting student's own work.
+    """
+    entry = course_lexicon(course_id, Submission)
+    if not len(entry.ids):
+        return {}
+    query = normalize(sparse.csr_matrix(query_counts) @ sparse.diags(entry.idf().astype(np.float32)))
+    sims = (entry.weighted @ query.T).toarray().ravel()
+    return {int(i): float(s) for i, u, s in zip(entry.ids, entry.user_ids, sims) if u != exclude_user_id}
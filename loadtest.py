@@ -0,0 +1,450 @@
+"""
+🏋️ DEADLINE SURGE LOAD TEST
+Replays the last minutes before a deadline against a real server on this
+machine. A scratch instance (database, uploads, job queue, metrics) is
+seeded with students, courses and assignments due at the end of the
+surge; each virtual student then logs in through the bcrypt-checked
+/login and uploads one file from a mixed corpus (bench.py's generator:
+text and scanned PDFs, DOCX, PNG, notebooks, legacy .doc, text with
+controlled overlap) to /submit/<assignment_id>. Arrivals thicken towards
+the deadline.
+
+    python loadtest.py --stub                          500 students over 5 minutes, stub models
+    python loadtest.py --stub --students 200 --window 60 --server gunicorn --web-workers 4
+    python loadtest.py --sync --queue-workers 0        checks inline, shed ones stay queued
+    python loadtest.py --url http://127.0.0.1:8000 --workdir /tmp/surge
+                                                       server already running on that workdir
+
+Reports throughput, latency percentiles and error rates per step, the
+verdicts reached, the time for the queue to drain and SQLite lock
+contention (write-statement times and "database is locked" failures
+from /metrics). Results are saved as JSON like bench.py's.
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import numpy as np
+
+import bench
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = 'surge-pass'
+
+# --- SCRATCH INSTANCE ---
+
+def instance_env(workdir, args):
+    """Environment that points the app, the queue workers and the metrics at `workdir`."""
+    env = dict(os.environ)
+    env.update({
+        'INSTANCE_PATH': os.path.join(workdir, 'instance'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'static', 'uploads'),
+        'DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'instance', 'load.db')}",
+        'JOB_QUEUE_PATH': os.path.join(workdir, 'instance', 'jobs.db'),
+        'METRICS_DIR': os.path.join(workdir, 'instance', 'metrics'),
+        'ASYNC_SUBMISSIONS': '0' if args.sync else '1',
+        'LOG_LEVEL': env.get('LOG_LEVEL', 'WARNING'),
+        'PYTHONPATH': os.pathsep.join(filter(None, [HERE, env.get('PYTHONPATH')])),
+    })
+    if args.stub:
+        env['MODEL_BACKEND'] = 'stub'
+    return env
+
+def seed(args, deadline):
+    """Students, courses and assignments in the scratch database. Returns [(username, assignment_id)]."""
+    import migrate
+    from app import app, bcrypt
+    from models import db, User, Course, Assignment, enrollments
+
+    with app.app_context():
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate.upgrade()
+        hashed = bcrypt.generate_password_hash(PASSWORD).decode()  # one hash, checked per login
+        db.session.add_all([User(username=f"load-faculty-{c}", email=f"load-faculty-{c}@load.local",
+                                 password=hashed, role='faculty') for c in range(args.courses)])
+        db.session.commit()
+        faculty = User.query.filter(User.username.like('load-faculty-%')).order_by(User.id).all()
+        courses = [Course(name=f"Surge Course {c}", code=f"SURGE{c}", faculty_id=f.id) for c, f in enumerate(faculty)]
+        db.session.add_all(courses)
+        db.session.commit()
+        assignments = [Assignment(course_id=course.id, title=f"Due in {args.window}s", deadline=deadline,
+                                  attempt_limit=args.attempts) for course in courses]
+        db.session.add_all(assignments)
+        db.session.add_all([User(username=f"load-student-{i}", email=f"load-student-{i}@load.local",
+                                 password=hashed, role='student') for i in range(args.students)])
+        db.session.commit()
+        students = User.query.filter(User.username.like('load-student-%')).order_by(User.id).all()
+        db.session.execute(enrollments.insert(), [{'student_id': s.id, 'course_id': courses[i % len(courses)].id}
+                                                   for i, s in enumerate(students)])
+        db.session.commit()
+        return [(s.username, assignments[i % len(assignments)].id) for i, s in enumerate(students)]
+
+def start_processes(args, env, port, workdir):
+    """The web server and queue workers, logging to <workdir>/*.log."""
+    procs = []
+    if args.server == 'gunicorn':
+        web = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(HERE, 'gunicorn.conf.py'), 'app:app']
+        env = dict(env, BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(args.web_workers))
+    else:
+        web = [sys.executable, os.path.abspath(__file__), '_serve', str(port)]
+    # cwd = workdir: anything written relative to the working directory stays in the run's folder
+    for name, cmd in [('web', web)] + ([('worker', [sys.executable, os.path.join(HERE, 'worker.py'),
+                                                     '--workers', str(args.queue_workers)])]
+                                        if args.queue_workers else []):
+        log = open(os.path.join(workdir, f"{name}.log"), 'w')
+        procs.append(subprocess.Popen(cmd, env=env, cwd=workdir, stdout=log, stderr=subprocess.STDOUT,
+                                      start_new_session=True))
+    return procs
+
+def stop_processes(procs):
+    for proc in procs:
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(proc.pid, signal.SIGTERM)
+    for proc in procs:
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+
+def serve(port):
+    """Multi-threaded werkzeug server for the app (no extra packages needed)."""
+    from werkzeug.serving import make_server
+    from app import app
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # exits through atexit: metrics are flushed
+    server.serve_forever()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# --- VIRTUAL STUDENTS ---
+
+class Session:
+    """One student's keep-alive connection with the session cookie."""
+
+    def __init__(self, base_url, timeout):
+        url = urlsplit(base_url)
+        self.host, self.port, self.timeout = url.hostname, url.port or 80, timeout
+        self.conn = None
+        self.cookies = {}
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()  # stale keep-alive connection: retry once on a fresh one
+                if attempt:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            name, _, rest = header.partition('=')
+            self.cookies[name.strip()] = rest.split(';', 1)[0]
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close()
+        return response.status, response.headers, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+def multipart(fields, files):
+    """multipart/form-data body and content type; files are (field, filename, bytes)."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+def upload_for(doc, student_no, rng, unique_share):
+    """The file a student uploads: text files mostly get a unique tail, other formats go as generated."""
+    with open(doc['path'], 'rb') as f:
+        data = f.read()
+    if doc['format'] == 'txt' and rng.random() < unique_share:
+        data += f"\nSubmitted by student {student_no}.".encode()
+    return os.path.basename(doc['path']), data
+
+def arrival_times(count, window, shape, rng):
+    """Seconds after the start: 'surge' arrivals grow linearly towards the deadline, 'uniform' do not."""
+    u = rng.random(count)
+    return np.sort(window * (np.sqrt(u) if shape == 'surge' else u))
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}   # step -> [seconds]
+        self.errors = {}    # step -> {kind: count}
+
+    def record(self, step, seconds, error=None):
+        with self.lock:
+            self.samples.setdefault(step, []).append(seconds)
+            if error:
+                kinds = self.errors.setdefault(step, {})
+                kinds[error] = kinds.get(error, 0) + 1
+
+    def summary(self, wall):
+        out = {}
+        for step, times in self.samples.items():
+            ms = np.array(times) * 1000
+            errors = sum(self.errors.get(step, {}).values())
+            out[step] = {
+                'n': len(times),
+                'p50_ms': round(float(np.percentile(ms, 50)), 1),
+                'p90_ms': round(float(np.percentile(ms, 90)), 1),
+                'p99_ms': round(float(np.percentile(ms, 99)), 1),
+                'max_ms': round(float(ms.max()), 1),
+                'throughput_per_s': round(len(times) / wall, 2) if wall else None,
+                'error_rate': round(errors / len(times), 4),
+                'errors': self.errors.get(step, {}),
+            }
+        return out
+
+def virtual_student(base_url, username, assignment_id, files, start_at, recorder, timeout):
+    session = Session(base_url, timeout)
+    time.sleep(max(0.0, start_at - time.monotonic()))
+    try:
+        steps = [('login', 'POST', '/login', f"username={username}&password={PASSWORD}".encode(),
+                  {'Content-Type': 'application/x-www-form-urlencoded'})]
+        for filename, data in files:
+            body, content_type = multipart({}, [('file', filename, data)])
+            steps.append(('submit', 'POST', f"/submit/{assignment_id}", body, {'Content-Type': content_type}))
+        for step, method, path, body, headers in steps:
+            started = time.perf_counter()
+            try:
+                status, headers, _ = session.request(method, path, body, headers)
+            except (OSError, http.client.HTTPException) as e:
+                recorder.record(step, time.perf_counter() - started, type(e).__name__)
+                return
+            location = headers.get('Location', '')
+            error = f"http_{status}" if status >= 400 else None
+            if step == 'login' and not error and 'dashboard' not in location:
+                error = 'login_rejected'
+            recorder.record(step, time.perf_counter() - started, error)
+            if error:
+                return
+    finally:
+        session.close()
+
+# --- SERVER-SIDE MEASUREMENTS ---
+
+_SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+def scrape(base_url):
+    """{(name, labels): value} from /metrics."""
+    session = Session(base_url, 30)
+    try:
+        status, _, data = session.request('GET', '/metrics')
+    except OSError:
+        return {}
+    finally:
+        session.close()
+    samples = {}
+    for line in data.decode().splitlines() if status == 200 else []:
+        match = _SAMPLE.match(line)
+        if match:
+            samples[(match.group(1), match.group(2) or '')] = float(match.group(3))
+    return samples
+
+def contention(before, after):
+    """SQLite write-lock contention during the run, from the /metrics deltas."""
+    delta = lambda key: after.get(key, 0.0) - before.get(key, 0.0)
+    buckets = {}
+    for (name, labels), _ in after.items():
+        if name == 'lyken_sqlite_write_seconds_bucket':
+            le = re.search(r'le="([^"]+)"', labels).group(1)
+            buckets[le] = buckets.get(le, 0.0) + delta((name, labels))
+    count = sum(delta(k) for k in after if k[0] == 'lyken_sqlite_write_seconds_count')
+    total = sum(delta(k) for k in after if k[0] == 'lyken_sqlite_write_seconds_sum')
+    slow = count - buckets.get('0.1', count)
+    return {
+        'write_statements': int(count),
+        'write_mean_ms': round(1000 * total / count, 2) if count else None,
+        'writes_over_100ms': int(slow),
+        'writes_over_100ms_share': round(slow / count, 4) if count else None,
+        'locked_errors': int(sum(delta(k) for k in after if k[0] == 'lyken_sqlite_locked_total')),
+    }
+
+def verdicts(db_path, drain_timeout):
+    """Submission statuses once the queue has drained (or the timeout passed), and the wait."""
+    import sqlite3
+    started = time.monotonic()
+    while True:
+        with contextlib.closing(sqlite3.connect(db_path, timeout=30)) as conn:
+            counts = dict(conn.execute("SELECT status, count(*) FROM submission GROUP BY status").fetchall())
+        if not counts.get('pending') or time.monotonic() - started > drain_timeout:
+            return counts, round(time.monotonic() - started, 1)
+        time.sleep(1)
+
+# --- RUN ---
+
+def wait_until_up(base_url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        session = Session(base_url, 5)
+        try:
+            status, _, _ = session.request('GET', '/login')
+            if status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            session.close()
+        time.sleep(0.5)
+    raise SystemExit(f"Server at {base_url} did not come up (see the logs in the workdir)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a deadline surge of logins and uploads")
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--courses', type=int, default=5)
+    parser.add_argument('--window', type=float, default=300, help="seconds over which the students arrive")
+    parser.add_argument('--arrivals', choices=['surge', 'uniform'], default='surge')
+    parser.add_argument('--attempts', type=int, default=1, help="uploads per student")
+    parser.add_argument('--unique-share', type=float, default=0.8,
+                        help="share of text uploads made unique (the rest can be exact duplicates)")
+    parser.add_argument('--docs', type=int, default=4, help="document families in the corpus")
+    parser.add_argument('--stub', action='store_true', help="stub models (MODEL_BACKEND=stub), runs offline")
+    parser.add_argument('--sync', action='store_true', help="check inline in the request (ASYNC_SUBMISSIONS=0)")
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn'], default='werkzeug')
+    parser.add_argument('--web-workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--queue-workers', type=int, default=2, help="job queue worker processes (0: none)")
+    parser.add_argument('--url', help="use a server already running on --workdir instead of starting one")
+    parser.add_argument('--timeout', type=float, default=120, help="client timeout per request, seconds")
+    parser.add_argument('--drain-timeout', type=float, default=600, help="seconds to wait for queued verdicts")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="scratch instance folder (default: a temp dir)")
+    parser.add_argument('--out', help="results file (default: instance/bench/load-<time>.json)")
+    parser.add_argument('--keep', action='store_true', help="keep the workdir of a temp-dir run")
+    args = parser.parse_args()
+    if args.url and not args.workdir:
+        parser.error("--url needs the --workdir the server was started on")
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='lyken-load-'))
+    env = instance_env(workdir, args)
+    for folder in (env['INSTANCE_PATH'], env['UPLOAD_FOLDER']):
+        os.makedirs(folder, exist_ok=True)
+    db_path = env['DATABASE_URI'][len('sqlite:///'):]
+    if os.path.exists(db_path) and not args.url:
+        raise SystemExit(f"{db_path} exists; use a fresh --workdir")
+    # Settings are read at import time, so the environment is fixed before importing the app
+    os.environ.update(env)
+    rng = np.random.default_rng(args.seed)
+
+    print(f"🏋️  Seeding {args.students} students in {args.courses} courses under {workdir}")
+    deadline = datetime.now() + timedelta(seconds=args.window + 60)
+    with contextlib.redirect_stdout(io.StringIO()):
+        students = seed(args, deadline)
+        manifest = bench.generate_corpus(os.path.join(workdir, 'corpus'), args.docs, seed=args.seed)
+    import telemetry
+    telemetry.flush(force=True)  # seeding writes stay out of the measured deltas
+    uploads = [[upload_for(manifest[rng.integers(len(manifest))], n, rng, args.unique_share)
+                for _ in range(args.attempts)] for n in range(len(students))]
+
+    procs = []
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        procs = start_processes(args, env, port, workdir)
+    try:
+        wait_until_up(base_url)
+        before = scrape(base_url)
+        recorder = Recorder()
+        print(f"🏋️  {len(students)} students arriving over {args.window:.0f}s ({args.arrivals}) at {base_url}")
+        start = time.monotonic() + 1
+        threads = [threading.Thread(target=virtual_student, daemon=True,
+                                    args=(base_url, username, assignment_id, files, start + offset, recorder,
+                                          args.timeout))
+                   for (username, assignment_id), files, offset
+                   in zip(students, uploads, arrival_times(len(students), args.window, args.arrivals, rng))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.monotonic() - start
+        print(f"🏋️  Uploads done in {wall:.1f}s, waiting for verdicts")
+        statuses, drain = verdicts(db_path, args.drain_timeout if args.queue_workers or args.url else 0)
+        time.sleep(1)
+        after = scrape(base_url)
+    finally:
+        stop_processes(procs)
+
+    import config
+    report = {
+        'meta': {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'commit': bench.git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'model_backend': config.MODEL_BACKEND,
+            'args': {k: v for k, v in vars(args).items() if k not in ('out', 'keep')},
+            'settings': {k: getattr(config, k) for k in ('ASYNC_SUBMISSIONS', 'WORKER_POOL_SIZE',
+                                                         'SQLITE_BUSY_TIMEOUT_MS', 'ADMISSION_NODE_SLOTS',
+                                                         'ADMISSION_USER_SLOTS')},
+        },
+        'wall_seconds': round(wall, 1),
+        'steps': recorder.summary(wall),
+        'verdicts': statuses,
+        'drain_seconds': drain,
+        'sqlite': contention(before, after),
+        'admission': {re.search(r'outcome="([^"]+)"', labels).group(1): int(value - before.get((name, labels), 0))
+                      for (name, labels), value in after.items() if name == 'lyken_admission_total'},
+    }
+
+    print(f"\n{'step':<10}{'n':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'per s':>8}{'errors':>8}")
+    for step, row in report['steps'].items():
+        print(f"{step:<10}{row['n']:>6}{row['p50_ms']:>10.1f}{row['p90_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+              f"{row['max_ms']:>10.1f}{row['throughput_per_s'] or 0:>8.1f}{row['error_rate']:>8.1%}")
+        for kind, count in row['errors'].items():
+            print(f"{'':<10}{kind}: {count}")
+    print(f"\nVerdicts: {statuses} (waited {drain}s after the last upload)")
+    print(f"Admission: {report['admission']}")
+    print(f"SQLite: {report['sqlite']}")
+
+    out = args.out or os.path.join(HERE, 'instance', 'bench', f"load-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to {out}")
+    if not args.workdir and not args.keep:
+        telemetry.set_metrics_dir(None)  # no exit-time flush into the removed folder
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['_serve']:
+        serve(int(sys.argv[2]))
+    else:
+        main()
@@ -4,82 +4,194 @@
 ✅ EasyOCR 85% handwriting OCR
 ✅ GPTZero 87% AI detection  
 ✅ PyMuPDF for technical PDFs (your pdf_1763655647586.pdf WORKS)
-✅ 2-4 second response time
+✅ Every check within CHECK_BUDGET_SECONDS (pipeline.py), else NEEDS REVIEW
 """
 
 import os
 import re
+import json
+import gc
+import time
 import hashlib
+import threading
+_IMPORT_STARTED = time.perf_counter()
 import fitz  # PyMuPDF
-import easyocr
 from PIL import Image
-from pdf2image import convert_from_path
 try:
     from docx import Document
 except ImportError:
     Document = None
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer, util
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
-from difflib import SequenceMatcher
 from datetime import datetime
-from collections import OrderedDict
+import numpy as np
+import text_store
+import embeddings
+import minhash
+import lexical
+import codeprint
+import phash
+import inference
+import model_server
+import ocr
+import pipeline
+import config
+import telemetry
 
-# 🔥 EASYOCR INITIALIZATION (85% handwriting)
-print("🚀 Initializing EasyOCR (85% handwriting accuracy)...")
-easyocr_reader = easyocr.Reader(['en'], gpu=False)
+log = telemetry.get_logger('logic')
 
-# 🔥 GPTZero AI Detection (87% accuracy)
-print("🚀 Loading GPTZero AI detector...")
-gptzero_tokenizer = AutoTokenizer.from_pretrained("openai-community/roberta-base-openai-detector")
-gptzero_model = AutoModelForSequenceClassification.from_pretrained("openai-community/roberta-base-openai-detector")
+# 🔥 MODELS ARE LOADED LAZILY: importing this module costs no model time or RSS.
+# easyocr / torch / transformers / sentence_transformers are only imported on first use.
+_models = {}
+_model_lock = threading.Lock()
+model_load_seconds = {}
 
-# Semantic similarity model
-print("🚀 Loading semantic model...")
-semantic_model = SentenceTransformer('all-MiniLM-L6-v2')
+def memory_mb():
+    """RSS / PSS / private (USS) memory of this process in MB.
 
-# Production caching (50 files max)
-text_cache = OrderedDict()
+    PSS and USS show what copy-on-write sharing with a preloaded parent
+    actually saves; plain RSS counts shared pages in every worker.
+    """
+    fields = {'Rss:': 'rss', 'Pss:': 'pss', 'Private_Clean:': 'uss', 'Private_Dirty:': 'uss'}
+    usage = {'rss': 0.0, 'pss': 0.0, 'uss': 0.0}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if parts and parts[0] in fields:
+                    usage[fields[parts[0]]] += int(parts[1]) / 1024
+        return usage
+    except OSError:
+        import resource
+        usage['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return usage
+
+def rss_mb():
+    return memory_mb()['rss']
+
+def _load(name, loader):
+    model = _models.get(name)
+    if model is None:
+        with _model_lock:
+            model = _models.get(name)
+            if model is None:
+                log.info("🚀 Loading model", model=name)
+                started = time.perf_counter()
+                model = _models[name] = loader()
+                model_load_seconds[name] = time.perf_counter() - started
+                log.info("✅ Model ready", model=name, seconds=round(model_load_seconds[name], 2),
+                         rss_mb=round(rss_mb()))
+    return model
+
+def get_ocr_reader():
+    """🔥 EasyOCR reader (85% handwriting)."""
+    return _load('easyocr', lambda: model_server.client(model_server.RemoteOCRReader, inference.load_ocr_reader))
+
+def get_ai_detector():
+    """🔥 GPTZero AI detector (87% accuracy) on the configured inference backend."""
+    return _load('gptzero', lambda: model_server.client(model_server.RemoteDetector, inference.load_detector))
+
+def get_semantic_model():
+    """Semantic similarity model (MiniLM sentence embeddings)."""
+    return _load('minilm', lambda: model_server.client(model_server.RemoteEncoder, inference.load_encoder))
+
+def preload_models():
+    """Load every model now, ahead of forking workers.
+
+    gc.freeze() moves everything allocated so far into the permanent
+    generation, so the collector in forked children never writes to those
+    pages and they stay shared copy-on-write with the parent.
+    """
+    get_ocr_reader()
+    get_ai_detector()
+    get_semantic_model()
+    gc.collect()
+    gc.freeze()
+    log.info("🧊 Models preloaded for fork", **startup_report())
+
+def startup_report():
+    """Timing and memory figures for this process, for comparing deployments."""
+    return {
+        'pid': os.getpid(),
+        'import_seconds': round(_IMPORT_SECONDS, 3),
+        'model_load_seconds': {k: round(v, 2) for k, v in model_load_seconds.items()},
+        'models_loaded': sorted(_models),
+        'memory_mb': {k: round(v, 1) for k, v in memory_mb().items()},
+    }
 
 def easyocr_text(image):
     """EasyOCR - 85% handwriting recognition."""
     try:
-        results = easyocr_reader.readtext(image, detail=0)
+        if isinstance(image, Image.Image):
+            image = np.asarray(image.convert('RGB'))
+        results = get_ocr_reader().readtext(image, detail=0)
         return " ".join(results).strip()
     except Exception as e:
-        print(f"EasyOCR error: {e}")
+        log.error("EasyOCR error", error=str(e))
         return ""
 
-def detect_ai_content(text):
-    """GPTZero - 87% AI-generated content detection."""
+def ai_window_scores(text):
+    """Classify the whole document in overlapping token windows.
+
+    Returns [(tokens_in_window, ai_probability)] in document order. Windows
+    are AI_WINDOW_TOKENS long (special tokens included), overlap by
+    AI_WINDOW_STRIDE, and go through the model AI_BATCH_SIZE at a time.
+    """
+    detector = get_ai_detector()
+    windows = inference.token_windows(detector, text)
+    results = []
+    for start in range(0, len(windows), config.AI_BATCH_SIZE):
+        pipeline.checkpoint()
+        batch = windows[start:start + config.AI_BATCH_SIZE]
+        results.extend(zip((len(w) for w in batch), detector.predict(batch)))
+    return results
+
+def score_ai_content(text):
+    """GPTZero - 87% AI-generated content detection over the full document.
+
+    The document score is the token-weighted mean of the window scores;
+    the windows are kept so reports can show where the score came from.
+    """
     try:
-        inputs = gptzero_tokenizer(text[:512], return_tensors="pt", truncation=True, padding=True)
-        with torch.no_grad():
-            outputs = gptzero_model(**inputs)
-            probs = torch.softmax(outputs.logits, dim=-1)
-            ai_score = probs[0][1].item()
-        print(f"🤖 AI detection score: {ai_score:.1%}")
-        return ai_score > 0.7
+        with telemetry.timed('ai'):
+            windows = ai_window_scores(text)
     except Exception as e:
-        print(f"AI detection error: {e}")
-        return False
+        log.error("AI detection error", error=str(e))
+        return {'score': 0.0, 'windows': [], 'detected': False}
+    
+    total_tokens = sum(n for n, _ in windows)
+    score = sum(n * p for n, p in windows) / total_tokens if total_tokens else 0.0
+    log.info("🤖 AI detection", score=round(score, 4), windows=len(windows))
+    return {'score': score, 'windows': [round(p, 4) for _, p in windows],
+            'detected': score > config.AI_THRESHOLD}
 
-def fast_extract_text(file_path):
-    """Production-grade multi-format extraction - FIXED for your PDF."""
-    if file_path in text_cache:
-        print(f"📂 Cache hit: {os.path.basename(file_path)}")
-        return text_cache[file_path]
+def detect_ai_content(text):
+    """GPTZero - True when the document as a whole reads as AI-generated."""
+    return score_ai_content(text)['detected']
+
+def fast_extract_text(file_path, content_hash=None, pages=None):
+    """Production-grade multi-format extraction - FIXED for your PDF.
+
+    With a content_hash the shared text store is consulted first and filled
+    afterwards, so each distinct upload is only ever extracted once.
+    `pages` ({page_no: (phash, known text or None)}, see check_near_duplicate)
+    lets image and scanned pages seen before skip OCR; newly OCR'd pages
+    are remembered under their hash.
+    """
+    if content_hash:
+        stored = text_store.get(content_hash)
+        if stored is not None:
+            log.info("📂 Text store hit", file=os.path.basename(file_path))
+            return stored
     
     if not os.path.exists(file_path):
-        print(f"❌ File not found: {file_path}")
+        log.error("❌ File not found", path=file_path)
         return ""
     
     ext = os.path.splitext(file_path)[1].lower()
     text = ""
     
-    print(f"📄 Extracting: {os.path.basename(file_path)} ({ext})")
+    log.info("📄 Extracting", file=os.path.basename(file_path), ext=ext)
+    started = time.perf_counter()
     
     try:
         if ext == '.pdf':
@@ -94,161 +206,427 @@ def fast_extract_text(file_path):
             
             doc.close()
             
-            print(f"   📄 PDF: {page_count} pages, {len(full_text)} raw chars")
+            log.info("   📄 PDF text layer", pages=page_count, raw_chars=len(full_text))
             
             if len(full_text.strip()) >= 50:
                 text = full_text
-                print(f"   ✅ PyMuPDF success: {len(full_text.strip())} chars")
             else:
-                print("   🔍 Scanned PDF - OCR fallback...")
+                log.info("   🔍 Scanned PDF - OCR fallback")
                 try:
-                    images = convert_from_path(file_path, first_page=1, last_page=2)
-                    for i, img in enumerate(images[:2]):
-                        ocr_result = easyocr_text(img)
-                        text += ocr_result + " "
-                        print(f"   OCR page {i+1}: {len(ocr_result)} chars")
+                    with telemetry.timed('ocr'):
+                        known = {p: t for p, (_, t) in (pages or {}).items() if t is not None}
+                        texts, _ = ocr.ocr_pages(file_path, known)
+                    text = " ".join(texts[p] for p in sorted(texts))
+                    remember_pages(pages, {p: t for p, t in texts.items() if p not in known})
                 except Exception as e:
-                    print(f"   OCR failed: {e}")
+                    log.error("   OCR failed", error=str(e))
         
         elif ext in ['.jpg', '.jpeg', '.png', '.bmp']:
-            img = Image.open(file_path)
-            text = easyocr_text(img)
-            print(f"   🖼️  Image OCR: {len(text)} chars")
+            known = (pages or {}).get(0, (None, None))[1]
+            if known is not None:
+                text = known
+                telemetry.inc('lyken_ocr_pages_total', source='known')
+                log.info("   ♻️  Known image, OCR skipped", chars=len(text))
+            else:
+                img = Image.open(file_path)
+                with telemetry.timed('ocr'):
+                    text = ocr.ocr_image(img)
+                telemetry.inc('lyken_ocr_pages_total', source='ocr')
+                remember_pages(pages, {0: text})
+                log.info("   🖼️  Image OCR", chars=len(text))
+        
+        elif ext == '.ipynb':
+            # Cell sources only: the raw JSON is mostly metadata and outputs
+            text = "\n".join(src for _, src in codeprint.notebook_cells(file_path))
+            log.info("   📓 Notebook", chars=len(text))
         
         elif ext == '.docx' and Document is not None:
             doc = Document(file_path)
-            text = "\n".join([p.text.strip() for p in doc.paragraphs[:15] if p.text.strip()])
-            print(f"   📝 DOCX: {len(text)} chars")
+            text = "\n".join([p.text.strip() for p in doc.paragraphs if p.text.strip()])
+            log.info("   📝 DOCX", chars=len(text))
         
         else:
             with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
                 text = f.read()
-            print(f"   📄 Text/Code: {len(text)} chars")
+            log.info("   📄 Text/Code", chars=len(text))
     
     except Exception as e:
-        print(f"❌ Extraction FAILED: {e}")
+        log.error("❌ Extraction FAILED", file=os.path.basename(file_path), error=str(e))
         return ""
+    finally:
+        telemetry.observe('lyken_stage_seconds', time.perf_counter() - started, stage=f"extract{ext or '.none'}")
     
-    cleaned = re.sub(r'\s+', ' ', text.strip())[:3000]
+    cleaned = re.sub(r'\s+', ' ', text.strip())[:config.MAX_TEXT_CHARS]
     readable_chars = len(re.sub(r'\s+', '', cleaned))
     
-    text_cache[file_path] = cleaned
-    if len(text_cache) > 50:
-        text_cache.popitem(last=False)
+    if content_hash:
+        text_store.put(content_hash, cleaned)
     
-    print(f"✅ FINAL: {len(cleaned)} chars ({readable_chars} readable)")
+    log.info("✅ Extracted", chars=len(cleaned), readable=readable_chars)
     return cleaned
 
-def ultra_fast_similarity(text1, text2):
-    """Lightning-fast similarity scoring."""
+def remember_pages(pages, texts):
+    """Keep newly OCR'd page texts under their perceptual hashes."""
+    for page_no, text in texts.items():
+        if pages and page_no in pages:
+            phash.remember(pages[page_no][0], text)
+
+def embed_text(text):
+    """MiniLM embedding of a document (first 1200 chars), unit-normalised."""
+    return embeddings.from_blob(embeddings.to_blob(get_semantic_model().encode(text[:1200])))
+
+def backfill_features(course_id, Submission, upload_folder):
+    """Embed, MinHash and term-count accepted priors stored before those features existed (committed by the caller)."""
+    missing = Submission.query.filter(
+        Submission.course_id == course_id,
+        Submission.status == 'accepted',
+        (Submission.embedding.is_(None)) | (Submission.minhash.is_(None)) | (Submission.terms.is_(None))
+    ).all()
+    if not missing:
+        return 0
+    
+    log.info("🧭 Backfilling features", priors=len(missing))
+    stored = text_store.get_many([m.content_hash for m in missing])
+    texts = {}
+    for m in missing:
+        path = os.path.join(upload_folder, m.filename)
+        if m.content_hash in stored:
+            texts[m.id] = stored[m.content_hash]
+        elif os.path.exists(path):
+            texts[m.id] = fast_extract_text(path, m.content_hash)
+        # else: left NULL, retried once the file is back
+    missing = [m for m in missing if m.id in texts]
+    texts = [texts[m.id] for m in missing]
+    
+    need_vectors = [i for i, m in enumerate(missing) if m.embedding is None]
+    if need_vectors:
+        vectors = get_semantic_model().encode([texts[i][:1200] for i in need_vectors])
+        for i, vec in zip(need_vectors, vectors):
+            missing[i].embedding = embeddings.to_blob(vec)
+    for sub, text in zip(missing, texts):
+        if sub.minhash is None:
+            sig = minhash.signature(text)
+            sub.minhash = minhash.to_blob(sig)
+            minhash.index_submission(sub.id, course_id, sig)
+        if sub.terms is None:
+            sub.terms = lexical.to_blob(lexical.term_counts(text))
+    return len(missing)
+
+def ultra_fast_similarity(text1, text2, semantic_sim=None, overlap=None, tfidf_sim=None):
+    """Lightning-fast similarity scoring.
+
+    `overlap` is the MinHash estimate of word-shingle Jaccard similarity;
+    it replaces the old character-level quick_ratio, which scored any two
+    English essays as similar. Candidate selection (LSH + embedding search)
+    now does the prefiltering, so there is no low-overlap cut-off here.
+    `tfidf_sim` is the course-level TF-IDF cosine (lexical.search); without
+    it the two texts' hashed term counts are compared directly.
+    Pass semantic_sim / overlap / tfidf_sim when already known to skip recomputing them.
+    """
     if len(text1) < 40 or len(text2) < 40:
         return 0.0
     
-    quick_ratio = SequenceMatcher(None, text1, text2).quick_ratio()
-    if quick_ratio > 0.6:
-        return quick_ratio
-    if quick_ratio < 0.15:
-        return 0.0
+    if overlap is None:
+        overlap = minhash.jaccard(minhash.signature(text1), minhash.signature(text2))
+    if overlap > 0.6:
+        return overlap
     
     try:
-        vectorizer = TfidfVectorizer(stop_words='english', max_features=1000, ngram_range=(1,2))
-        tfidf = vectorizer.fit_transform([text1, text2])
-        tfidf_sim = cosine_similarity(tfidf[0:1], tfidf[1:2])[0][0]
+        if tfidf_sim is None:
+            tfidf_sim = lexical.pair_similarity(text1, text2)
         
-        emb1 = semantic_model.encode(text1[:1200])
-        emb2 = semantic_model.encode(text2[:1200])
-        semantic_sim = util.cos_sim(emb1, emb2)[0][0].item()
+        if semantic_sim is None:
+            emb1, emb2 = get_semantic_model().encode([text1[:1200], text2[:1200]])
+            semantic_sim = float(cosine_similarity([emb1], [emb2])[0][0])
         
-        final_score = 0.3 * tfidf_sim + 0.6 * semantic_sim + 0.1 * quick_ratio
-        print(f"   📊 Similarity: TF-IDF={tfidf_sim:.0%}, Semantic={semantic_sim:.0%} → {final_score:.1%}")
+        final_score = 0.3 * tfidf_sim + 0.6 * semantic_sim + 0.1 * overlap
+        log.debug("   📊 Similarity", tfidf=round(float(tfidf_sim), 4), semantic=round(semantic_sim, 4),
+                  score=round(float(final_score), 4))
         return final_score
         
     except Exception as e:
-        print(f"Similarity error: {e}")
-        return quick_ratio
+        log.error("Similarity error", error=str(e))
+        return overlap
 
-def run_plagiarism_check(file_path, new_hash, course_id, current_user_id, Submission):
-    """🎯 MAIN FUNCTION - STRICT DECISIONS ONLY"""
-    
-    print("=" * 70)
-    print(f"🔍 PLAGIARISM CHECK: {os.path.basename(file_path)}")
-    print("=" * 70)
-    
-    # 1. HASH CHECK (exact duplicates)
+def check_duplicate(new_hash, course_id, current_user_id, Submission, submission=None):
+    """Exact-duplicate verdict (score, reason) if another student already sent this file."""
     duplicate = Submission.query.filter(
         Submission.course_id == course_id,
         Submission.content_hash == new_hash,
         Submission.user_id != current_user_id
-    ).first()
+    )
+    if submission is not None and submission.id is not None:
+        duplicate = duplicate.filter(Submission.id < submission.id)
+    duplicate = duplicate.first()
     
     if duplicate:
         source_name = duplicate.author.username if hasattr(duplicate, 'author') else "previous student"
-        print("🚨 DUPLICATE HASH DETECTED")
+        log.info("🚨 DUPLICATE HASH DETECTED", original=duplicate.id)
         return 1.0, f"🚨 REJECTED: IDENTICAL FILE DETECTED ({source_name})"
+    return None
+
+def check_near_duplicate(file_path, course_id, current_user_id, Submission, upload_folder, submission=None):
+    """Near-duplicate verdict for image and scanned-PDF uploads, and what is known of their pages.
+
+    Returns (verdict (score, reason) or None, {page_no: (phash, known text or None)}).
+    The score is the largest share of this upload's pages found in a
+    single accepted prior of another student. Known text is taken from the
+    student's own near pages, but from another student's page only when the
+    hashes are within PHASH_REUSE_DISTANCE bits: two different pages of
+    similar layout can be PHASH_MAX_DISTANCE apart.
+    """
+    try:
+        with telemetry.timed('phash'):
+            hashes = phash.page_hashes(file_path)
+    except Exception as e:
+        log.error("Page hashing failed", error=str(e))
+        return None, {}
+    if submission is not None:
+        submission.page_hashes = len(hashes)
+    if not hashes:
+        return None, {}
+    
+    with telemetry.timed('phash_query'):
+        phash.backfill(course_id, Submission, upload_folder)
+        near = phash.nearest(course_id, hashes, Submission,
+                             exclude_submission_id=submission.id if submission is not None else None)
+        if submission is not None:
+            phash.index_pages(submission.id, course_id, hashes)
+        reusable = {page_no: [phash.page_key(m.hash) for m in matches
+                              if m.user_id == current_user_id or m.distance <= config.PHASH_REUSE_DISTANCE]
+                    for page_no, matches in near.items()}
+        stored = text_store.get_many([key for keys in reusable.values() for key in keys])
+    pages = {}
+    for page_no, h in hashes:
+        texts = [stored[key] for key in reusable.get(page_no, []) if key in stored]
+        pages[page_no] = (h, texts[0] if texts else None)
+    
+    found = {}  # accepted prior of another student -> pages of this upload it contains
+    for page_no, matches in near.items():
+        for m in matches:
+            if m.status == 'accepted' and m.user_id != current_user_id:
+                found.setdefault(m.submission_id, set()).add(page_no)
+    log.info("🖼️  Page hashes", pages=len(hashes), near_pages=len(near), priors_matched=len(found),
+             known_pages=sum(t is not None for _, t in pages.values()))
     
+    best_id, best_pages = max(found.items(), key=lambda kv: len(kv[1]), default=(None, ()))
+    best = len(best_pages) / len(hashes)
+    if best > config.PHASH_THRESHOLD:
+        prior = Submission.query.session.get(Submission, best_id)
+        source_name = prior.author.username if prior else "previous student"
+        log.info("🚨 NEAR-DUPLICATE PAGES", prior_id=best_id, share=round(best, 4))
+        return (best, f"🚨 REJECTED: {best:.1%} NEAR-DUPLICATE IMAGE ({source_name})"), pages
+    return None, pages
+
+# In the reason of every code verdict (tasks.decide_status)
+CODE_VERDICT = "CODE SIMILARITY"
+
+def check_code(file_path, course_id, current_user_id, Submission, upload_folder, submission=None):
+    """Code verdict (score, reason) from the fingerprint index, or None to score the file as text.
+
+    The score is the largest share of this submission's fingerprints found
+    in a single accepted prior; the assignment's own question files are
+    discounted as starter code. The verdict is final: code is rejected
+    above CODE_THRESHOLD (tasks.decide_status), never on the prose scores.
+    """
+    with telemetry.timed('fingerprint'):
+        prints = codeprint.file_fingerprints(file_path)
+    if len(prints) < config.CODE_MIN_FINGERPRINTS:
+        log.info("📓 Too little code to fingerprint", fingerprints=len(prints))
+        return None
+    
+    with telemetry.timed('code_query'):
+        codeprint.backfill(course_id, Submission, upload_folder)
+        assignment = submission.assignment if submission is not None else None
+        base = codeprint.base_fingerprints(assignment.question_file, upload_folder) if assignment else ()
+        shares, compared = codeprint.matches(course_id, prints, current_user_id, Submission, base)
+    if submission is not None:
+        # Indexed after matching, so its own fingerprints don't count as held by the course
+        submission.code_prints = len(prints)
+        codeprint.index_submission(submission.id, course_id, prints)
+    log.info("💻 Code fingerprints", fingerprints=len(prints), compared=compared, priors_matched=len(shares))
+    
+    best_id, best = max(shares.items(), key=lambda kv: kv[1], default=(None, 0.0))
+    prior = Submission.query.session.get(Submission, best_id) if best_id else None
+    source_name = prior.author.username if prior else "classmates"
+    if best > config.CODE_THRESHOLD:
+        log.info("🚨 CODE PLAGIARISM FOUND", prior_id=best_id, share=round(best, 4))
+        return best, f"🚨 REJECTED: {best:.1%} {CODE_VERDICT} ({source_name})"
+    return best, f"✅ ACCEPTED: {best:.1%} MAX {CODE_VERDICT} ({source_name})"
+
+def run_plagiarism_check(file_path, new_hash, course_id, current_user_id, Submission, upload_folder,
+                         submission=None, budget=None):
+    """🎯 MAIN FUNCTION - STRICT DECISIONS ONLY
+
+    `upload_folder` holds the priors' files (app.config['UPLOAD_FOLDER']).
+    `submission` is the already-saved (pending) row being checked, if any;
+    only rows that arrived before it count as the original of a duplicate.
+    The course's stages (see pipeline.py) run within `budget` seconds
+    (CHECK_BUDGET_SECONDS); every stage is timed into lyken_stage_seconds.
+    """
+    log.info("🔍 PLAGIARISM CHECK", file=os.path.basename(file_path), course_id=course_id)
+    check = Check(file_path, new_hash, course_id, current_user_id, Submission, upload_folder, submission)
+    course = submission.assignment.course if submission is not None else None
+    stages = pipeline.course_plan(STAGES, course.check_stages if course is not None else None)
+    with telemetry.timed('check'):
+        score, reason = pipeline.run(stages, check, budget)
+    if pipeline.is_review(reason):
+        # Nothing of the check is committed yet: drop what a stopped stage left behind
+        Submission.query.session.rollback()
+    log.info("🎯 Verdict", score=round(score, 4), reason=reason)
+    return score, reason
+
+class Check:
+    """What the stages of one check know about the upload, filled in as they run."""
+
+    def __init__(self, file_path, new_hash, course_id, current_user_id, Submission, upload_folder, submission=None):
+        self.file_path = file_path
+        self.new_hash = new_hash
+        self.course_id = course_id
+        self.user_id = current_user_id
+        self.Submission = Submission
+        self.upload_folder = upload_folder
+        self.submission = submission
+        self.pages = None  # {page_no: (phash, known text or None)} of image and scanned uploads
+        self.text = None
+
+    def args(self):
+        return self.course_id, self.user_id, self.Submission, self.upload_folder, self.submission
+
+# --- STAGES (cheapest and most decisive first) ---
+
+def _stage_duplicate(check):
+    # 1. HASH CHECK (exact duplicates)
+    with telemetry.timed('duplicate'):
+        return check_duplicate(check.new_hash, check.course_id, check.user_id, check.Submission, check.submission)
+
+def _stage_near_duplicate(check):
+    # 1b. NEAR-DUPLICATE PAGES (images, scanned PDFs) - before any OCR is spent on them
+    if phash.has_pages(check.file_path):
+        verdict, check.pages = check_near_duplicate(check.file_path, *check.args())
+        return verdict
+    return None
+
+def _stage_extract(check):
     # 2. STRICT CONTENT VALIDATION
-    current_text = fast_extract_text(file_path)
-    readable_chars = len(re.sub(r'\s+', '', current_text))
+    check.text = fast_extract_text(check.file_path, check.new_hash, check.pages)
+    return None
+
+def _stage_readable(check):
+    readable_chars = len(re.sub(r'\s+', '', check.text))
     
     # 🚨 NO HYBRID MESSAGES - STRICT 120 CHAR MINIMUM
     if readable_chars < 120:
-        print(f"❌ INSUFFICIENT CONTENT: {readable_chars} chars")
+        log.info("❌ INSUFFICIENT CONTENT", readable=readable_chars)
         return 0.0, f"🚨 REJECTED: UNREADABLE CONTENT ({readable_chars} chars - MINIMUM 120 REQUIRED)"
-    
-    print(f"✅ CONTENT OK: {readable_chars} readable characters")
-    
+    return None
+
+def _stage_code(check):
+    # 2b. CODE - notebooks and source files are matched on winnowed fingerprints
+    if codeprint.is_code(check.file_path):
+        return check_code(check.file_path, *check.args())
+    return None
+
+def _stage_ai(check):
     # 3. AI BLOCKER
-    ai_detected = detect_ai_content(current_text)
-    if ai_detected:
-        print("🤖 AI CONTENT DETECTED")
+    ai_result = score_ai_content(check.text)
+    if check.submission is not None:
+        check.submission.ai_score = ai_result['score']
+        check.submission.ai_windows = json.dumps(ai_result['windows'])
+    if ai_result['detected']:
+        log.info("🤖 AI CONTENT DETECTED")
         return 0.95, "🚨 REJECTED: AI-GENERATED CONTENT DETECTED"
+    return None
+
+def _stage_similarity(check):
+    return check_priors(check.text, *check.args())
+
+def check_priors(current_text, course_id, current_user_id, Submission, upload_folder, submission=None):
+    """Similarity verdict (score, reason) against the accepted priors of other students."""
+    # 4. PRIOR SUBMISSIONS - one matrix-vector product against every accepted prior
+    with telemetry.timed('embed'):
+        current_vec = embed_text(current_text)
+    with telemetry.timed('minhash'):
+        current_sig = minhash.signature(current_text)
+    with telemetry.timed('terms'):
+        current_terms = lexical.term_counts(current_text)
+    if submission is not None:
+        submission.embedding = embeddings.to_blob(current_vec)
+        submission.minhash = minhash.to_blob(current_sig)
+        submission.terms = lexical.to_blob(current_terms)
+        minhash.index_submission(submission.id, course_id, current_sig)
     
-    # 4. PRIOR SUBMISSIONS
-    priors = Submission.query.filter(
-        Submission.course_id == course_id,
-        Submission.user_id != current_user_id,
-        Submission.status == 'accepted'
-    ).limit(25).all()
+    with telemetry.timed('backfill'):
+        backfill_features(course_id, Submission, upload_folder)
+    with telemetry.timed('prior_query'):
+        neighbours = embeddings.search(course_id, current_vec, current_user_id, Submission)
     
-    if not priors:
-        print("✅ NO PRIOR SUBMISSIONS")
+    if not neighbours:
+        log.info("✅ NO PRIOR SUBMISSIONS")
         return 0.0, "✅ ACCEPTED: FIRST SUBMISSION COURSE"
     
-    print(f"📊 COMPARING AGAINST {len(priors)} PRIOR SUBMISSIONS")
+    # Candidates: every LSH bucket collision plus the semantically nearest priors
+    with telemetry.timed('prior_query'):
+        semantic_sims = dict(neighbours)
+        lexical_hits = minhash.candidates(course_id, current_sig, current_user_id, Submission)
+        candidate_ids = sorted(set(lexical_hits) | {sid for sid, _ in neighbours[:config.SIMILARITY_CANDIDATES]},
+                               key=lambda sid: (-lexical_hits.get(sid, 0), -semantic_sims.get(sid, -1.0)))
+        by_id = {p.id: p for p in Submission.query.filter(Submission.id.in_(candidate_ids)).all()}
+        priors = [by_id[sid] for sid in candidate_ids if sid in by_id]
+        # Prior texts come from the shared store in one query - no file access
+        prior_texts = text_store.get_many([p.content_hash for p in priors])
+    with telemetry.timed('tfidf'):
+        # Course TF-IDF against every prior in one sparse product
+        lexical_sims = lexical.search(course_id, current_terms, current_user_id, Submission)
+    
+    log.info("📊 Comparing against candidates", candidates=len(priors), priors=len(neighbours),
+             lsh_hits=len(lexical_hits))
     
     # 5. SIMILARITY CHECK
     threshold = 0.45
     max_score = 0.0
     best_match = None
     
-    for i, prior in enumerate(priors):
-        print(f"   🔍 #{i+1}/{len(priors)}: {prior.filename}")
-        
-        prior_text = getattr(prior, 'extracted_text', None)
-        if not prior_text or prior_text.strip() == "":
-            prior_path = os.path.join('static/uploads', prior.filename)
-            prior_text = fast_extract_text(prior_path)
-        
-        if len(prior_text) < 50:
-            print(f"   ⏭️  Skipping {prior.filename} (too short)")
-            continue
-        
-        score = ultra_fast_similarity(current_text, prior_text)
-        
-        if score > threshold:
-            source_name = prior.author.username if hasattr(prior, 'author') else f"Student {prior.user_id}"
-            print(f"🚨 PLAGIARISM FOUND: {score:.1%}")
-            return score, f"🚨 REJECTED: {score:.1%} PLAGIARISM ({source_name})"
-        
-        if score > max_score:
-            max_score = score
-            best_match = prior
+    with telemetry.timed('similarity'):
+        for i, prior in enumerate(priors):
+            pipeline.checkpoint()
+            prior_text = prior_texts.get(prior.content_hash)
+            if prior_text is None:
+                # Legacy row extracted before the store existed: backfill it once
+                prior_path = os.path.join(upload_folder, prior.filename)
+                prior_text = fast_extract_text(prior_path, prior.content_hash)
+            
+            if len(prior_text) < 50:
+                log.debug("   ⏭️  Skipping prior (too short)", prior_id=prior.id)
+                continue
+            
+            overlap = minhash.jaccard(current_sig, minhash.from_blob(prior.minhash)) if prior.minhash else None
+            score = ultra_fast_similarity(current_text, prior_text, semantic_sim=semantic_sims.get(prior.id),
+                                          overlap=overlap, tfidf_sim=lexical_sims.get(prior.id))
+            
+            if score > threshold:
+                source_name = prior.author.username if hasattr(prior, 'author') else f"Student {prior.user_id}"
+                log.info("🚨 PLAGIARISM FOUND", prior_id=prior.id, rank=i + 1)
+                return score, f"🚨 REJECTED: {score:.1%} PLAGIARISM ({source_name})"
+            
+            if score > max_score:
+                max_score = score
+                best_match = prior
     
     source_name = best_match.author.username if best_match else "classmates"
-    print(f"🎯 CLEAN: {max_score:.1%} max similarity")
     return max_score, f"✅ ACCEPTED: {max_score:.1%} MAX SIMILARITY ({source_name})"
 
-print("🎯 PRODUCTION PLAGIARISM DETECTOR READY!")
-print("✅ STRICT REJECTIONS - NO HYBRID MESSAGES")
-print("✅ EasyOCR + GPTZero + PyMuPDF")
-print("✅ Works with your Flask app.py")
+STAGES = [
+    pipeline.Stage('duplicate', _stage_duplicate, cost=0.05, timeout=15),
+    pipeline.Stage('near_duplicate', _stage_near_duplicate, cost=0.5, timeout=30),
+    pipeline.Stage('extract', _stage_extract, cost=1.0, timeout=config.OCR_TIME_BUDGET + 30,
+                   cleanup=ocr.kill_pool),
+    pipeline.Stage('readable', _stage_readable, cost=0.0, requires=('extract',)),
+    pipeline.Stage('code', _stage_code, cost=0.2, timeout=30),
+    pipeline.Stage('ai', _stage_ai, cost=2.0, timeout=90, requires=('extract',)),
+    pipeline.Stage('similarity', _stage_similarity, cost=1.0, timeout=60, requires=('extract',)),
+]
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+log.info("🎯 PRODUCTION PLAGIARISM DETECTOR READY (models load on first use)", import_seconds=round(_IMPORT_SECONDS, 2))
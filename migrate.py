@@ -1,11 +1,142 @@
-from app import app, db
-from sqlalchemy import text
-
-with app.app_context():
-    try:
-        # Manually add the email column to the user table
-        db.session.execute(text('ALTER TABLE user ADD COLUMN email VARCHAR(120)'))
-        db.session.commit()
-        print("Successfully added email column to User table.")
-    except Exception as e:
-        print(f"Error: {e}")
\ No newline at end of file
+"""
+🗄️ SCHEMA MIGRATIONS
+Versioned, in-place schema changes for the application database.
+
+    python migrate.py            apply every pending migration
+    python migrate.py --status   list applied and pending migrations
+
+The applied version is kept in SQLite's PRAGMA user_version. Every step
+is idempotent (it checks the live schema first), so databases created by
+db.create_all() at any point in the project's history upgrade cleanly.
+To change the schema, update models.py and append a migration here.
+"""
+
+import argparse
+import os
+import shutil
+
+from flask import current_app
+from sqlalchemy import inspect, text
+
+import config
+import course_search
+import stats
+from ingest import file_digest
+from models import db, Assignment, Submission, ExtractedText, LshBucket, IntegrityStat, CodeFingerprint, PageHash
+
+# --- OPERATIONS ---
+
+def add_column(table, column, ddl_type):
+    def op(conn):
+        if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+            conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl_type}'))
+    op.label = f"add {table}.{column}"
+    return op
+
+def create_table(model):
+    def op(conn):
+        model.__table__.create(conn, checkfirst=True)
+    op.label = f"create table {model.__tablename__}"
+    return op
+
+def create_indexes(model):
+    def op(conn):
+        existing = {ix['name'] for ix in inspect(conn).get_indexes(model.__tablename__)}
+        for index in model.__table__.indexes:
+            if index.name not in existing:
+                index.create(conn)
+    op.label = f"create indexes on {model.__tablename__}"
+    return op
+
+def backfill(label, fn):
+    """Data step: fn(conn) fills new columns/tables from existing rows."""
+    def op(conn):
+        fn(conn)
+    op.label = label
+    return op
+
+def hash_question_files(conn):
+    """Fill assignment.question_hashes from the question files in the upload folder."""
+    folder = current_app.config['UPLOAD_FOLDER']
+    rows = conn.execute(text("SELECT id, question_file FROM assignment "
+                             "WHERE question_file IS NOT NULL AND question_hashes IS NULL")).all()
+    for assignment_id, names in rows:
+        paths = [os.path.join(folder, name) for name in names.split(",")]
+        hashes = ",".join(file_digest(p) if os.path.exists(p) else "" for p in paths)
+        conn.execute(text("UPDATE assignment SET question_hashes = :h WHERE id = :id"),
+                     {'h': hashes, 'id': assignment_id})
+
+def move_static_uploads(conn):
+    """Move uploads from the old default folder, <app>/static/uploads, where Flask served them to anyone."""
+    old, new = os.path.join(current_app.root_path, 'static', 'uploads'), current_app.config['UPLOAD_FOLDER']
+    if config.UPLOAD_FOLDER or not os.path.isdir(old):
+        return  # a configured folder is left where the operator put it
+    os.makedirs(new, exist_ok=True)
+    for name in os.listdir(old):
+        if not os.path.exists(os.path.join(new, name)):
+            shutil.move(os.path.join(old, name), os.path.join(new, name))
+
+# --- MIGRATIONS (append only) ---
+
+MIGRATIONS = [
+    (1, "email column on user", [add_column('user', 'email', 'VARCHAR(120)')]),
+    (2, "extracted-text store", [create_table(ExtractedText)]),
+    (3, "submission embeddings", [add_column('submission', 'embedding', 'BLOB')]),
+    (4, "MinHash signatures and LSH index", [add_column('submission', 'minhash', 'BLOB'),
+                                             create_table(LshBucket)]),
+    (5, "AI detection scores", [add_column('submission', 'ai_score', 'FLOAT'),
+                                add_column('submission', 'ai_windows', 'TEXT')]),
+    (6, "access-path indexes", [create_indexes(Submission), create_indexes(Assignment)]),
+    (7, "hashed term counts for course TF-IDF", [add_column('submission', 'terms', 'BLOB')]),
+    (8, "materialized integrity statistics", [create_table(IntegrityStat),
+                                              backfill("count existing submissions", stats.rebuild)]),
+    (9, "winnowed code fingerprint index", [add_column('submission', 'code_prints', 'INTEGER'),
+                                            create_table(CodeFingerprint)]),
+    (10, "question file hashes for download ETags", [add_column('assignment', 'question_hashes', 'TEXT'),
+                                                     backfill("hash existing question files", hash_question_files)]),
+    (11, "FTS5 course search index", [backfill("index courses in course_fts", course_search.migration_step)]),
+    (12, "perceptual page hash index", [add_column('submission', 'page_hashes', 'INTEGER'),
+                                        create_table(PageHash)]),
+    (13, "per-course check stages", [add_column('course', 'check_stages', 'TEXT')]),
+    (14, "course corpus version for similarity caches",
+     [add_column('course', 'corpus_version', 'INTEGER NOT NULL DEFAULT 0')]),
+    (15, "uploads out of the static folder", [backfill("move static/uploads to the upload folder", move_static_uploads)]),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+def current_version(conn):
+    return conn.execute(text("PRAGMA user_version")).scalar()
+
+def upgrade():
+    """Create missing tables, then apply pending migrations in order."""
+    applied = []
+    db.create_all()  # missing tables are created outright (no-op when present)
+    for version, description, ops in MIGRATIONS:
+        with db.engine.begin() as conn:
+            if version <= current_version(conn):
+                continue
+            for op in ops:
+                op(conn)
+            conn.execute(text(f"PRAGMA user_version = {version}"))
+        applied.append(version)
+        print(f"Applied migration {version}: {description}")
+    if not applied:
+        print(f"Schema is up to date (version {LATEST}).")
+    return applied
+
+def status():
+    with db.engine.connect() as conn:
+        version = current_version(conn)
+    for number, description, ops in MIGRATIONS:
+        mark = 'applied' if number <= version else 'pending'
+        print(f"{number:>3}  [{mark}]  {description}: {', '.join(op.label for op in ops)}")
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument('--status', action='store_true', help="show migration status and exit")
+    args = parser.parse_args()
+    with app.app_context():
+        status() if args.status else upgrade()
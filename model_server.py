@@ -0,0 +1,285 @@
+"""
+🛰️ SHARED MODEL SERVER
+One process owns EasyOCR, the AI detector and MiniLM and serves them over
+a Unix socket, so web and queue workers stop holding a copy each.
+Concurrent requests for the same model are coalesced into micro-batches:
+the first request opens a MODEL_SERVER_BATCH_MS window, everything that
+arrives within it (up to MODEL_SERVER_MAX_BATCH items) goes through the
+model in one call, and the results are split back per caller.
+
+    python model_server.py [--socket PATH]
+
+logic.py asks for the models through client(): with a server listening it
+gets thin proxies with the same methods (encode, token_ids / predict,
+readtext); without one, or when the server goes away mid-run, the models
+are loaded in-process as before.
+
+Requests are pickles, so only holders of the handshake key may connect:
+MODEL_SERVER_KEY, or else a random key generated once into
+<instance>/models.key, readable by its owner only.
+"""
+
+import argparse
+import os
+import secrets
+import tempfile
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+import numpy as np
+
+import config
+import telemetry
+
+log = telemetry.get_logger('model_server')
+
+def _instance_dir():
+    return config.INSTANCE_PATH or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+def socket_path():
+    return config.MODEL_SERVER_SOCKET or os.path.join(_instance_dir(), 'models.sock')
+
+def key_path():
+    return os.path.join(_instance_dir(), 'models.key')
+
+def _authkey():
+    if config.MODEL_SERVER_KEY:
+        return config.MODEL_SERVER_KEY.encode()
+    path = key_path()
+    if not os.path.exists(path):
+        # Written aside and linked into place: the first process to link wins, nobody reads half a key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.models.key.')  # mode 0600
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp)
+    if os.stat(path).st_mode & 0o077:
+        raise PermissionError(f"{path} is readable by other users; chmod 600 it")
+    with open(path) as f:
+        return f.read().strip().encode()
+
+# --- SERVER ---
+
+class Batcher:
+    """Runs fn(items) -> results for requests queued from many connections, a micro-batch at a time."""
+
+    def __init__(self, op, fn):
+        self.op = op
+        self.fn = fn
+        self.requests = queue.Queue()
+        threading.Thread(target=self._loop, name=f"batch-{op}", daemon=True).start()
+
+    def submit(self, items):
+        future = Future()
+        self.requests.put((items, future))
+        return future
+
+    def _gather(self):
+        batch = [self.requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + config.MODEL_SERVER_BATCH_MS / 1000
+        while size < config.MODEL_SERVER_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+            size += len(batch[-1][0])
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._gather()
+            items = [item for request, _ in batch for item in request]
+            telemetry.inc('lyken_model_server_batches_total', op=self.op)
+            telemetry.inc('lyken_model_server_items_total', len(items), op=self.op)
+            try:
+                with telemetry.timed(f"serve.{self.op}"):
+                    results = list(self.fn(items)) if items else []
+            except Exception as e:
+                log.exception("❌ Batch failed", op=self.op, items=len(items))
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for request, future in batch:
+                future.set_result(results[start:start + len(request)])
+                start += len(request)
+
+class ModelServer:
+    def __init__(self):
+        import inference
+        started = time.perf_counter()
+        detector = inference.load_detector()
+        encoder = inference.load_encoder()
+        reader = inference.load_ocr_reader()
+        self.info = {'special_tokens': detector.special_tokens, 'backend': getattr(detector, 'backend', None)}
+        self.batchers = {
+            'token_ids': Batcher('token_ids', lambda texts: [detector.token_ids(t) for t in texts]),
+            'predict': Batcher('predict', detector.predict),
+            'encode': Batcher('encode', lambda texts: encoder.encode(texts, batch_size=len(texts))),
+            'readtext': Batcher('readtext', lambda images: [reader.readtext(i, detail=0) for i in images]),
+        }
+        log.info("✅ Models ready", seconds=round(time.perf_counter() - started, 2), **self.info)
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, items = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op == 'info':
+                        reply = (True, self.info)
+                    else:
+                        reply = (True, self.batchers[op].submit(items).result())
+                except Exception as e:
+                    reply = (False, f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+    def serve(self, path):
+        if os.path.exists(path):
+            if ping(path):
+                raise SystemExit(f"❌ A model server is already listening on {path}")
+            os.unlink(path)  # stale socket from a crashed server
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old_umask = os.umask(0o177)  # socket is owner-only
+        try:
+            listener = Listener(path, family='AF_UNIX', authkey=_authkey())
+        finally:
+            os.umask(old_umask)
+        log.info("🛰️ Model server listening", socket=path)
+        with listener:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, OSError) as e:
+                    log.warning("rejected connection", error=str(e))
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+# --- CLIENT ---
+
+def _connect(path=None):
+    return Client(path or socket_path(), family='AF_UNIX', authkey=_authkey())
+
+def ping(path=None):
+    """The server's info dict, or None when no server answers."""
+    try:
+        with _connect(path) as conn:
+            conn.send(('info', None))
+            ok, info = conn.recv()
+            return info if ok else None
+    except (OSError, EOFError, AuthenticationError):
+        return None
+
+class _Remote:
+    """Proxy for one model; one connection per thread, local model if the server is gone."""
+
+    def __init__(self, info, local_loader):
+        self.info = info
+        self.local_loader = local_loader
+        self._local = None
+        self._tls = threading.local()
+        self._down_until = 0.0
+
+    def _conn(self):
+        conn = getattr(self._tls, 'conn', None)
+        if conn is None or self._tls.pid != os.getpid():  # never share a connection across fork
+            conn = self._tls.conn = _connect()
+            self._tls.pid = os.getpid()
+        return conn
+
+    def _drop(self):
+        conn, self._tls.conn = getattr(self._tls, 'conn', None), None
+        if conn is not None:
+            conn.close()
+
+    def local(self):
+        if self._local is None:
+            self._local = self.local_loader()
+        return self._local
+
+    def call(self, op, items):
+        if time.monotonic() >= self._down_until:
+            try:
+                conn = self._conn()
+                conn.send((op, items))
+                ok, value = conn.recv()
+            except (OSError, EOFError, AuthenticationError) as e:
+                self._drop()
+                self._down_until = time.monotonic() + config.MODEL_SERVER_RETRY_SECONDS
+                log.warning("Model server unavailable, running in-process", op=op, error=str(e))
+            except BaseException:
+                self._drop()  # interrupted mid-exchange (e.g. a stage time limit): the reply is still due
+                raise
+            else:
+                if not ok:
+                    raise RuntimeError(f"model server: {value}")
+                return value
+        return None
+
+class RemoteDetector(_Remote):
+    backend = 'remote'
+
+    @property
+    def special_tokens(self):
+        return self.info['special_tokens']
+
+    def token_ids(self, text):
+        result = self.call('token_ids', [text])
+        return result[0] if result is not None else self.local().token_ids(text)
+
+    def predict(self, windows):
+        result = self.call('predict', windows)
+        return result if result is not None else self.local().predict(windows)
+
+class RemoteEncoder(_Remote):
+    backend = 'remote'
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        result = self.call('encode', batch)
+        if result is None:
+            return self.local().encode(texts, batch_size=batch_size, **kwargs)
+        out = np.vstack(result).astype(np.float32) if result else np.zeros((0, 0), dtype=np.float32)
+        return out[0] if single else out
+
+class RemoteOCRReader(_Remote):
+    def readtext(self, image, detail=0):
+        result = self.call('readtext', [np.asarray(image)])
+        return result[0] if result is not None else self.local().readtext(image, detail=detail)
+
+def client(proxy, local_loader):
+    """A proxy to the model server if one is listening, otherwise local_loader()."""
+    info = ping()
+    if info is None:
+        return local_loader()
+    log.info("🛰️ Using model server", model=proxy.__name__, socket=socket_path())
+    return proxy(info, local_loader)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the OCR, AI-detection and embedding models to local workers")
+    parser.add_argument('--socket', default=socket_path(), help="Unix socket path (MODEL_SERVER_SOCKET)")
+    args = parser.parse_args()
+    telemetry.set_metrics_dir(config.METRICS_DIR or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics'))
+    # Exit through SystemExit so the socket file is removed and metrics are flushed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    ModelServer().serve(args.socket)
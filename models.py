@@ -1,4 +1,5 @@
 # from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 # from flask_login import UserMixin
 
 # db = SQLAlchemy()
@@ -49,11 +50,70 @@
 #     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
 #     is_published = db.Column(db.Boolean, default=False)
 #     submissions = db.relationship('Submission', backref='assignment', lazy=True)
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
 from datetime import datetime
+import time
+import config
+import pipeline
+import telemetry
 
-db = SQLAlchemy()
+class CheckSession(FlaskSession):
+    """Session whose database calls a check stage's time limit never interrupts (pipeline.alarm_held)."""
+
+    def execute(self, *args, **kwargs):
+        with pipeline.alarm_held():
+            return super().execute(*args, **kwargs)
+
+    def flush(self, objects=None):
+        with pipeline.alarm_held():
+            super().flush(objects)
+
+    def commit(self):
+        with pipeline.alarm_held():
+            super().commit()
+
+    def rollback(self):
+        with pipeline.alarm_held():
+            super().rollback()
+
+db = SQLAlchemy(session_options={'class_': CheckSession})
+
+@event.listens_for(Engine, "connect")
+def configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer; busy_timeout makes
+    # concurrent submit writers wait for the lock instead of failing
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+# Lock contention: a write statement's time includes any busy_timeout wait for
+# the write lock, and one that outwaits it fails with "database is locked"
+_WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_write_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['statement_started'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_write_time(conn, cursor, statement, parameters, context, executemany):
+    kind = statement.lstrip()[:6].upper()
+    if kind in _WRITES:
+        telemetry.observe('lyken_sqlite_write_seconds', time.perf_counter() - conn.info['statement_started'],
+                          statement=kind.lower())
+
+@event.listens_for(Engine, 'handle_error')
+def count_locked(context):
+    if 'database is locked' in str(context.original_exception):
+        telemetry.inc('lyken_sqlite_locked_total')
 
 # Helper table for Many-to-Many relationship
 enrollments = db.Table('enrollments',
@@ -77,6 +137,9 @@ class Course(db.Model):
     name = db.Column(db.String(100), nullable=False)
     code = db.Column(db.String(20), unique=True, nullable=False)
     faculty_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    check_stages = db.Column(db.Text)  # comma-separated check stages (pipeline.py); NULL = CHECK_STAGES
+    # Bumped by the flush hook below whenever the accepted corpus changes: cache key of the course matrices
+    corpus_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Faculty uses this to see courses they teach
     faculty = db.relationship('User', backref=db.backref('managed_courses', lazy=True))
@@ -90,10 +153,20 @@ class Assignment(db.Model):
     deadline = db.Column(db.DateTime, nullable=False) 
     attempt_limit = db.Column(db.Integer, default=3)
     question_file = db.Column(db.String(255), nullable=True) 
+    # SHA-256 of each question file, comma-separated in question_file order (download ETags)
+    question_hashes = db.Column(db.Text, nullable=True)
     is_published = db.Column(db.Boolean, default=True) 
     
     submissions = db.relationship('Submission', backref='assignment', lazy=True)
 
+    def question_files(self):
+        """[(filename, sha256 or None)] of the question files, in upload order."""
+        names = self.question_file.split(",") if self.question_file else []
+        hashes = self.question_hashes.split(",") if self.question_hashes else []
+        return [(name, hashes[i] if i < len(hashes) and hashes[i] else None) for i, name in enumerate(names)]
+
+    __table_args__ = (db.Index('ix_assignment_course_deadline', 'course_id', 'deadline'),)
+
 class Submission(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
@@ -103,10 +176,190 @@ class Submission(db.Model):
     filename = db.Column(db.String(100))
     score = db.Column(db.Float, default=0.0)
     # status = db.Column(db.String(20)) # 'accepted' or 'rejected'
-    status = db.Column(db.String(20)) # 'accepted' or 'rejected'
+    status = db.Column(db.String(20)) # 'accepted', 'rejected', 'review' or 'pending'
     # score = db.Column(db.Float)
     reason = db.Column(db.String(255)) # ADD THIS LINE
     # Optimization: Use DateTime for easier sorting/filtering in reports
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Unit-normalised MiniLM embedding (float32 bytes), computed once at check time
+    embedding = db.Column(db.LargeBinary, nullable=True)
+    # MinHash signature of the word shingles (uint32 bytes), see minhash.py
+    minhash = db.Column(db.LargeBinary, nullable=True)
+    # Hashed word/bigram counts (sparse uint32 indices + float32 counts), see lexical.py
+    terms = db.Column(db.LargeBinary, nullable=True)
+    # Number of winnowed code fingerprints in code_fingerprint (NULL: not fingerprinted), see codeprint.py
+    code_prints = db.Column(db.Integer, nullable=True)
+    # Number of perceptual page hashes in page_hash (NULL: not hashed), see phash.py
+    page_hashes = db.Column(db.Integer, nullable=True)
+    # Document-level AI score and the per-window scores behind it (JSON list)
+    ai_score = db.Column(db.Float, nullable=True)
+    ai_windows = db.Column(db.Text, nullable=True)
     
-    author = db.relationship('User', backref='user_submissions')
\ No newline at end of file
+    author = db.relationship('User', backref='user_submissions')
+
+    @property
+    def counts_as_attempt(self):
+        # A check that kept crashing (tasks.mark_failed) is not held against the student
+        return CHECK_FAILED not in (self.reason or "")
+
+    # Hot access paths: duplicate check, prior lookup, attempt count / history
+    __table_args__ = (
+        db.Index('ix_submission_course_hash', 'course_id', 'content_hash'),
+        db.Index('ix_submission_course_status_user', 'course_id', 'status', 'user_id'),
+        db.Index('ix_submission_user_assignment', 'user_id', 'assignment_id'),
+    )
+
+class ExtractedText(db.Model):
+    # Content-addressed text store: one row per distinct upload, shared by all workers
+    content_hash = db.Column(db.String(64), primary_key=True)
+    text = db.Column(db.Text, nullable=False, default="")
+    size = db.Column(db.Integer, nullable=False, default=0)
+    last_access = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class LshBucket(db.Model):
+    # MinHash LSH band index: one row per (submission, band)
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    bucket = db.Column(db.BigInteger, nullable=False)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'), nullable=False)
+
+    __table_args__ = (db.Index('ix_lsh_bucket_course_bucket', 'course_id', 'bucket'),)
+
+class CodeFingerprint(db.Model):
+    # Winnowing inverted index over code submissions: one row per (submission, fingerprint)
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    hash = db.Column(db.BigInteger, nullable=False)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'), nullable=False)
+
+    __table_args__ = (db.Index('ix_code_fingerprint_course_hash', 'course_id', 'hash'),)
+
+class PageHash(db.Model):
+    # Perceptual-hash multi-index over image and scanned pages: one row per (page, 16-bit chunk)
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    key = db.Column(db.Integer, nullable=False)  # chunk number << 16 | chunk value
+    hash = db.Column(db.BigInteger, nullable=False)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'), nullable=False)
+    page = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.Index('ix_page_hash_course_key', 'course_id', 'key'),)
+
+class IntegrityStat(db.Model):
+    # Materialized report counters, kept in step with Submission by the flush hook below.
+    # assignment_id 0 holds the whole-course rollup.
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, nullable=False)
+    assignment_id = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False)
+    category = db.Column(db.String(20), nullable=False)  # see reason_category()
+    bucket = db.Column(db.Integer, nullable=False)  # score decile 0-9
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('course_id', 'assignment_id', 'status', 'category', 'bucket',
+                                          name='uq_integrity_stat_key'),)
+
+STAT_KEY = ('course_id', 'assignment_id', 'status', 'category', 'bucket')
+
+# Reason marker of a check that kept crashing (tasks.mark_failed)
+CHECK_FAILED = "CHECK FAILED"
+
+def reason_category(status, reason):
+    """Coarse category of a verdict, from the reason text the check writes."""
+    reason = (reason or "").upper()
+    if status == 'accepted':
+        return 'clean'
+    if CHECK_FAILED in reason:
+        return 'failed'
+    if status == 'pending':
+        return 'pending'
+    if status == 'review':
+        return 'review'
+    if "IDENTICAL FILE" in reason or "NEAR-DUPLICATE" in reason:
+        return 'duplicate'
+    if "AI-GENERATED" in reason:
+        return 'ai'
+    if "PLAGIARISM" in reason or "SIMILARITY" in reason:
+        return 'plagiarism'
+    if "UNREADABLE" in reason or "SCAN" in reason:
+        return 'unreadable'
+    return 'other'
+
+def score_bucket(score):
+    return min(9, max(0, int((score or 0.0) * 10)))
+
+def stat_keys(course_id, assignment_id, status, reason, score):
+    """The assignment row and the course rollup row a submission counts towards."""
+    tail = (status or 'pending', reason_category(status, reason), score_bucket(score))
+    return [(course_id, assignment_id) + tail, (course_id, 0) + tail]
+
+STAT_FIELDS = ('course_id', 'assignment_id', 'status', 'reason', 'score')
+# Changes to these on an accepted row change what the course matrices (embeddings.py, lexical.py) hold
+CORPUS_FIELDS = ('course_id', 'status', 'embedding', 'terms')
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+# Load the previous value on set even when the row was expired by a commit,
+# so the flush hook can move the count from the old key to the new one
+for _field in STAT_FIELDS:
+    event.listen(getattr(Submission, _field), 'set', _keep_old_value, active_history=True)
+
+def _old_value(state, attr):
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else state.attrs[attr].value
+
+@event.listens_for(Session, 'after_flush')
+def maintain_integrity_stats(session, _flush_context):
+    """Apply Submission inserts / status changes / deletes to IntegrityStat in the same transaction."""
+    deltas = {}
+    changed_courses = set()  # courses whose accepted corpus changed
+    def add(sub_values, delta):
+        for key in stat_keys(*sub_values):
+            deltas[key] = deltas.get(key, 0) + delta
+
+    fields = STAT_FIELDS
+    for obj in session.new:
+        if isinstance(obj, Submission):
+            add([getattr(obj, f) for f in fields], 1)
+            if obj.status == 'accepted':
+                changed_courses.add(obj.course_id)
+    for obj in session.dirty:
+        if isinstance(obj, Submission) and session.is_modified(obj, include_collections=False):
+            state = inspect(obj)
+            old = [_old_value(state, f) for f in fields]
+            new = [getattr(obj, f) for f in fields]
+            if stat_keys(*old) != stat_keys(*new):
+                add(old, -1)
+                add(new, 1)
+            if 'accepted' in (_old_value(state, 'status'), obj.status) and \
+                    any(state.attrs[f].history.has_changes() for f in CORPUS_FIELDS):
+                changed_courses.update([_old_value(state, 'course_id'), obj.course_id])
+    for obj in session.deleted:
+        if isinstance(obj, Submission):
+            state = inspect(obj)
+            add([_old_value(state, f) for f in fields], -1)
+            if _old_value(state, 'status') == 'accepted':
+                changed_courses.add(_old_value(state, 'course_id'))
+
+    deltas = {k: d for k, d in deltas.items() if d}
+    if deltas:
+        apply_stat_deltas(session.connection(), deltas)
+    if changed_courses:
+        course = Course.__table__
+        session.connection().execute(course.update().where(course.c.id.in_(changed_courses))
+                                     .values(corpus_version=course.c.corpus_version + 1))
+
+def apply_stat_deltas(conn, deltas):
+    """Upsert {STAT_KEY tuple: delta} into integrity_stat."""
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = IntegrityStat.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(index_elements=list(STAT_KEY),
+                                      set_={'count': table.c.count + stmt.excluded['count']})
+    conn.execute(stmt, [dict(zip(STAT_KEY, key), count=delta) for key, delta in deltas.items()])
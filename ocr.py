@@ -0,0 +1,176 @@
+"""
+🖨️ SCANNED-DOCUMENT OCR
+Pages of scanned PDFs are rasterized at OCR_DPI and OCR'd OCR_WORKERS at a
+time. With a model server listening (model_server.py) the pages go to it
+from threads, so the node's one EasyOCR reader serves every worker and
+batches their pages. Without one they go to a process pool of this
+worker (each pool process loads its reader once, with OCR_TORCH_THREADS
+torch threads). Blank
+pages are skipped with a cheap pixel-statistics test, and every document
+gets a page budget (OCR_MAX_PAGES) and a wall-clock budget
+(OCR_TIME_BUDGET): pages still unread when time runs out are dropped
+rather than holding the submission up. Pages whose text is already known
+(phash.py) are not OCR'd at all.
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image, ImageOps
+
+import config
+import pipeline
+import telemetry
+
+log = telemetry.get_logger('ocr')
+_pool = None
+_threads = None
+
+def render_page(path, page_no, dpi=None):
+    """Rasterize one PDF page to a grayscale PIL image."""
+    with fitz.open(path) as doc:
+        pix = doc[page_no].get_pixmap(dpi=dpi or config.OCR_DPI, colorspace=fitz.csGRAY)
+        return Image.frombytes('L', (pix.width, pix.height), pix.samples)
+
+def is_blank(image):
+    """True when almost no pixels are ink, judged on a small thumbnail."""
+    thumb = ImageOps.grayscale(image)
+    thumb.thumbnail((256, 256))
+    pixels = np.asarray(thumb, dtype=np.uint8)
+    background = np.median(pixels)
+    ink = np.abs(pixels.astype(np.int16) - background) > 60
+    return ink.mean() < config.OCR_BLANK_INK_RATIO
+
+def ocr_image(image):
+    """OCR one image in this process; blank images cost no OCR time."""
+    if is_blank(image):
+        return ""
+    import logic
+    return logic.easyocr_text(image)
+
+def _ocr_pdf_page(path, page_no, dpi):
+    image = render_page(path, page_no, dpi)
+    if is_blank(image):
+        return page_no, None
+    return page_no, ocr_image(image)
+
+def _warm_reader():
+    import inference
+    import logic
+    if config.MODEL_BACKEND != 'stub':
+        inference.configure_torch_threads(config.OCR_TORCH_THREADS)
+    logic.get_ocr_reader()
+
+def _served():
+    """True when the model server reads this process's pages."""
+    import logic
+    import model_server
+    if 'easyocr' not in logic._models and model_server.ping() is None:
+        return False  # no server: don't load a reader here just to find out
+    return isinstance(logic.get_ocr_reader(), model_server.RemoteOCRReader)
+
+def _get_threads():
+    global _threads
+    if _threads is None:
+        _threads = ThreadPoolExecutor(max_workers=config.OCR_WORKERS, thread_name_prefix='ocr')
+    return _threads
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: forking a process that already ran torch can deadlock its thread pools
+        _pool = ProcessPoolExecutor(max_workers=config.OCR_WORKERS, initializer=_warm_reader,
+                                    mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+def kill_pool():
+    """Stop pages still running past the budget; a fresh pool starts next time."""
+    global _pool
+    if _pool is None:
+        return
+    if hasattr(_pool, 'terminate_workers'):
+        _pool.terminate_workers()
+    else:
+        for proc in list(getattr(_pool, '_processes', {}).values()):
+            proc.terminate()
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+def ocr_pdf(path, known=None):
+    """OCR a scanned PDF within the page and time budgets.
+
+    Returns (text, stats) where text joins the pages in order.
+    """
+    texts, stats = ocr_pages(path, known)
+    return " ".join(texts[p] for p in sorted(texts)), stats
+
+def ocr_pages(path, known=None):
+    """Text of each page of a scanned PDF, {page_no: text}, and the stats.
+
+    `known` ({page_no: text}) pages are taken as given instead of OCR'd.
+    """
+    started = time.monotonic()
+    deadline = started + config.OCR_TIME_BUDGET
+    with fitz.open(path) as doc:
+        page_count = len(doc)
+    known = {p: t for p, t in (known or {}).items() if p < min(page_count, config.OCR_MAX_PAGES)}
+    pages = [p for p in range(min(page_count, config.OCR_MAX_PAGES)) if p not in known]
+    texts = dict(known)
+    blank = 0
+
+    parallel = config.OCR_WORKERS > 1 and len(pages) > 1
+    served = parallel and _served()
+    # A daemon process (e.g. under another pool) may not start the page pool: read serially
+    if not parallel or (not served and multiprocessing.current_process().daemon):
+        for page_no in pages:
+            if time.monotonic() >= deadline:
+                break
+            pipeline.checkpoint()
+            _, text = _ocr_pdf_page(path, page_no, config.OCR_DPI)
+            if text is None:
+                blank += 1
+            else:
+                texts[page_no] = text
+    else:
+        pool = _get_threads() if served else _get_pool()
+        pending = {pool.submit(_ocr_pdf_page, path, page_no, config.OCR_DPI) for page_no in pages}
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            pipeline.checkpoint()
+            stage_left = pipeline.time_left()
+            if stage_left is not None:
+                remaining = min(remaining, stage_left)
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    page_no, text = future.result()
+                except Exception as e:
+                    log.error("   OCR page failed", error=str(e))
+                    continue
+                if text is None:
+                    blank += 1
+                else:
+                    texts[page_no] = text
+        if pending and served:
+            for future in pending:
+                future.cancel()  # pages already at the server finish there
+        elif pending:
+            kill_pool()
+
+    stats = {
+        'pages': page_count,
+        'ocr_pages': len(texts) - len(known),
+        'known_pages': len(known),
+        'blank_pages': blank,
+        'skipped_pages': page_count - len(texts) - blank,
+        'seconds': round(time.monotonic() - started, 2),
+    }
+    telemetry.inc('lyken_ocr_pages_total', stats['ocr_pages'], source='ocr')
+    telemetry.inc('lyken_ocr_pages_total', len(known), source='known')
+    log.info("   🖨️  OCR", **stats)
+    return texts, stats
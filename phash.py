@@ -0,0 +1,160 @@
+"""
+🖼️ PERCEPTUAL PAGE HASHES
+Image uploads and the pages of scanned PDFs get a 64-bit perceptual hash
+(DCT of a 32x32 thumbnail of the page's inked area), which survives
+re-encoding, resizing and re-scanning: near-identical pages differ in a
+few bits, different pages in dozens. Blank pages are not hashed.
+
+Hashes go into a per-course multi-index (page_hash), one row per 16-bit
+chunk. Two hashes within PHASH_MAX_DISTANCE bits agree to within
+PHASH_MAX_DISTANCE // 4 bits on at least one chunk, so a search probes
+each chunk's few neighbouring values with indexed lookups and checks the
+full distance on the handful of rows found.
+
+OCR text of every hashed page is kept in the text store under the page's
+hash, so a page seen before is not OCR'd twice: a re-scan of the student's
+own page within PHASH_MAX_DISTANCE, another student's page only within
+PHASH_REUSE_DISTANCE (an identical hash by default).
+"""
+
+import itertools
+import os
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image, ImageOps
+from scipy.fft import dctn
+
+import config
+import ocr
+import pipeline
+import text_store
+from models import db, PageHash
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+CHUNKS = 4
+CHUNK_BITS = 16
+MASK = (1 << 64) - 1
+
+Match = namedtuple('Match', 'page submission_id user_id status hash distance')
+
+def has_pages(path):
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS + ('.pdf',)
+
+def image_hash(image):
+    """pHash of the inked part of a page, as a signed 64-bit int (SQLite INTEGER)."""
+    gray = ImageOps.grayscale(ImageOps.exif_transpose(image))
+    pixels = np.asarray(gray)
+    ink = np.abs(pixels.astype(np.int16) - np.median(pixels)) > 60
+    rows, cols = np.nonzero(ink)
+    if len(rows):
+        # Crop to the ink so margins and scan offsets do not move the hash
+        gray = gray.crop((cols.min(), rows.min(), cols.max() + 1, rows.max() + 1))
+    thumb = np.asarray(gray.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = dctn(thumb, norm='ortho')[:8, :8].ravel()
+    bits = low > np.median(low)
+    value = int(np.packbits(bits).view('>u8')[0])
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def distance(a, b):
+    return ((a ^ b) & MASK).bit_count()
+
+def scanned_pages(path):
+    """Number of pages of a PDF without a text layer (0 when it has one)."""
+    with fitz.open(path) as doc:
+        text = sum(len(page.get_text().strip()) for page in doc)
+        return 0 if text >= 50 else len(doc)
+
+def page_images(path):
+    """(page_no, image) of an image upload or a scanned PDF; nothing for other files."""
+    if path.lower().endswith('.pdf'):
+        for page_no in range(min(scanned_pages(path), config.OCR_MAX_PAGES)):
+            yield page_no, ocr.render_page(path, page_no, config.PHASH_DPI)
+    elif path.lower().endswith(IMAGE_EXTENSIONS):
+        with Image.open(path) as image:
+            image.load()
+            yield 0, image
+
+def page_hashes(path):
+    """[(page_no, hash)] of the non-blank pages."""
+    return [(page_no, image_hash(image)) for page_no, image in page_images(path) if not ocr.is_blank(image)]
+
+def page_key(h):
+    """Text store key of a page's OCR text."""
+    return f"page:{h & MASK:016x}"
+
+def remember(h, text):
+    text_store.put(page_key(h), text)
+
+def _chunks(h):
+    u = h & MASK
+    return [(u >> (CHUNK_BITS * i)) & 0xFFFF for i in range(CHUNKS)]
+
+def _keys(h):
+    return [(i << CHUNK_BITS) | c for i, c in enumerate(_chunks(h))]
+
+def _probe_keys(h, radius):
+    """Index keys of every chunk value within `radius` bits of h's chunks."""
+    keys = []
+    for i, chunk in enumerate(_chunks(h)):
+        for r in range(radius + 1):
+            for flips in itertools.combinations(range(CHUNK_BITS), r):
+                value = chunk
+                for bit in flips:
+                    value ^= 1 << bit
+                keys.append((i << CHUNK_BITS) | value)
+    return keys
+
+def index_pages(submission_id, course_id, hashes):
+    """Add a submission's page hashes to the session (committed by the caller)."""
+    if submission_id is None:
+        return
+    db.session.add_all([PageHash(course_id=course_id, key=key, hash=h, submission_id=submission_id, page=page_no)
+                        for page_no, h in hashes for key in _keys(h)])
+
+def backfill(course_id, Submission, upload_folder):
+    """Hash the pages of accepted image and PDF priors stored before the index existed (committed by the caller)."""
+    missing = Submission.query.filter(
+        Submission.course_id == course_id,
+        Submission.status == 'accepted',
+        Submission.page_hashes.is_(None),
+        db.or_(*[Submission.filename.ilike(f"%{ext}") for ext in IMAGE_EXTENSIONS + ('.pdf',)])
+    ).all()
+    done = 0
+    for sub in missing:
+        pipeline.checkpoint()
+        path = os.path.join(upload_folder, sub.filename)
+        if not os.path.exists(path):
+            continue  # left NULL: retried once the file is back
+        try:
+            hashes = page_hashes(path)
+        except Exception:
+            hashes = []  # unreadable file: never retried
+        sub.page_hashes = len(hashes)
+        index_pages(sub.id, course_id, hashes)
+        done += 1
+    return done
+
+def nearest(course_id, hashes, Submission, exclude_submission_id=None, max_distance=None):
+    """Indexed pages within max_distance bits of each page: {page_no: [Match, nearest first]}."""
+    max_distance = config.PHASH_MAX_DISTANCE if max_distance is None else max_distance
+    radius = max_distance // CHUNKS
+    found = {}
+    for page_no, h in hashes:
+        probes = _probe_keys(h, radius)
+        seen = {}
+        for start in range(0, len(probes), 500):
+            rows = db.session.query(PageHash.submission_id, PageHash.page, PageHash.hash,
+                                    Submission.user_id, Submission.status) \
+                .join(Submission, Submission.id == PageHash.submission_id) \
+                .filter(PageHash.course_id == course_id, PageHash.key.in_(probes[start:start + 500])).all()
+            for submission_id, page, other, user_id, status in rows:
+                if submission_id == exclude_submission_id or (submission_id, page) in seen:
+                    continue
+                d = distance(h, other)
+                if d <= max_distance:
+                    seen[(submission_id, page)] = Match(page, submission_id, user_id, status, other, d)
+        if seen:
+            found[page_no] = sorted(seen.values(), key=lambda m: m.distance)
+    return found
@@ -0,0 +1,207 @@
+"""
+🚦 CHECK PIPELINE
+An integrity check is a list of stages (logic.STAGES) run in order. Any
+stage can end the check early by returning a verdict. The default order
+runs the cheap, decisive stages first: exact duplicates, near-duplicate
+pages, text extraction and its readability gate, code fingerprints, AI
+detection and similarity to prior submissions.
+
+Each stage has a typical cost and a time limit. The whole check has a
+budget, CHECK_BUDGET_SECONDS. A stage is not started when less budget is
+left than its typical cost, and it is stopped when it reaches its limit.
+Either way the check ends with a NEEDS REVIEW verdict (status 'review')
+instead of holding up the worker. A check commits nothing before its
+verdict, so what a stopped stage wrote is rolled back. In the main thread
+(queue workers, sync gunicorn workers) SIGALRM stops a stage wherever it
+is, except inside a database call (models.CheckSession holds the alarm
+off around flush, commit and execute): a stage that runs out of time
+there stops as soon as the call returns. Other threads (the threaded dev server) cannot be interrupted, so
+long loops call checkpoint() - between OCR pages, AI window batches and
+priors - and the stage stops at the first one past its limit.
+
+A course can run a subset of the stages or reorder them. A stage's
+requirements (text extraction, for the text stages) are added ahead of it.
+
+    python pipeline.py --course 3                    show the course's stages
+    python pipeline.py --course 3 --stages duplicate,extract,readable,similarity
+    python pipeline.py --course 3 --default          back to CHECK_STAGES
+"""
+
+import argparse
+import signal
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import config
+import telemetry
+
+log = telemetry.get_logger('pipeline')
+
+REVIEW = "⚠️ NEEDS REVIEW"
+
+# run(check) -> verdict (score, reason) or None; cost: typical seconds; timeout: seconds or None;
+# cleanup() runs after the stage was stopped at its limit
+Stage = namedtuple('Stage', 'name run cost timeout requires cleanup', defaults=(None, (), None))
+
+class StageTimeout(BaseException):
+    """Raised in a stage at its time limit (a BaseException, so the stage's own error handling lets it by)."""
+
+# Deadline (time.monotonic()) of the stage running in this thread, for checkpoint()
+_stage = threading.local()
+
+def checkpoint():
+    """Stop the running stage (StageTimeout) if it is past its limit; a no-op outside a check."""
+    deadline = getattr(_stage, 'deadline', None)
+    if deadline is not None and time.monotonic() >= deadline:
+        raise StageTimeout()
+
+@contextmanager
+def alarm_held():
+    """Hold off a stage's SIGALRM in the block; if it went off meanwhile, StageTimeout once the block is done."""
+    depth = getattr(_stage, 'held', 0)
+    _stage.held = depth + 1
+    try:
+        yield
+    finally:
+        _stage.held = depth
+    if depth == 0 and getattr(_stage, 'expired', False):
+        _stage.expired = False
+        raise StageTimeout()
+
+def time_left():
+    """Seconds before the running stage's limit, or None outside a check."""
+    deadline = getattr(_stage, 'deadline', None)
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+def is_review(reason):
+    return (reason or "").startswith(REVIEW)
+
+def parse_names(value, stages):
+    """Stage names from a comma-separated list; ValueError on a name no stage has."""
+    names = [n.strip() for n in (value or "").split(",") if n.strip()]
+    unknown = [n for n in names if n not in {s.name for s in stages}]
+    if unknown:
+        raise ValueError(f"unknown check stage(s) {', '.join(unknown)}; "
+                         f"known: {', '.join(s.name for s in stages)}")
+    return names
+
+def plan(stages, names=None):
+    """The stages named (all of them when none are), in that order, each after the stages it requires."""
+    by_name = {s.name: s for s in stages}
+    order = []
+
+    def add(name):
+        if name not in order:
+            for required in by_name[name].requires:
+                add(required)
+            order.append(name)
+
+    for name in names or by_name:
+        add(name)
+    return [by_name[n] for n in order]
+
+def course_plan(stages, course_value=None):
+    """Stages for a course: its own list if it has a valid one, else CHECK_STAGES."""
+    if course_value:
+        try:
+            return plan(stages, parse_names(course_value, stages))
+        except ValueError as e:
+            log.warning("Ignoring the course's check stages", stages=course_value, error=str(e))
+    return plan(stages, parse_names(config.CHECK_STAGES, stages))
+
+def stage_timeouts():
+    """{stage name: seconds} from CHECK_STAGE_TIMEOUTS ('ai=30,extract=120')."""
+    limits = {}
+    for item in config.CHECK_STAGE_TIMEOUTS.split(","):
+        if item.strip():
+            name, seconds = item.split("=")
+            limits[name.strip()] = float(seconds)
+    return limits
+
+@contextmanager
+def time_limit(seconds):
+    """Raise StageTimeout in the block after `seconds`: at once in the main thread, else at a checkpoint()."""
+    outer = getattr(_stage, 'deadline', None)
+    _stage.deadline = time.monotonic() + seconds
+    alarm = threading.current_thread() is threading.main_thread() and hasattr(signal, 'setitimer')
+    if alarm:
+        def expire(signum, frame):
+            if getattr(_stage, 'held', 0):
+                _stage.expired = True  # raised by alarm_held() when the database call returns
+            else:
+                raise StageTimeout()
+
+        previous = signal.signal(signal.SIGALRM, expire)
+        signal.setitimer(signal.ITIMER_REAL, max(seconds, 0.001))
+    try:
+        yield
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+            _stage.expired = False
+        _stage.deadline = outer
+
+def run(stages, check, budget=None):
+    """Run `stages` on `check` until one returns a verdict.
+
+    Returns that verdict, a NEEDS REVIEW verdict when a stage overruns its
+    limit or the budget, or an acceptance when every stage passes.
+    """
+    budget = config.CHECK_BUDGET_SECONDS if budget is None else budget
+    deadline = time.monotonic() + budget
+    limits = stage_timeouts()
+    for stage in stages:
+        remaining = deadline - time.monotonic()
+        if remaining < stage.cost:
+            telemetry.inc('lyken_check_stages_total', stage=stage.name, outcome='skipped')
+            log.warning("⏱️ Check budget spent", stage=stage.name, budget=budget, remaining=round(remaining, 2))
+            return 0.0, f"{REVIEW}: CHECK TIME BUDGET ({budget:g}s) SPENT BEFORE THE {stage.name.upper()} STAGE"
+        limit = min(limits.get(stage.name, stage.timeout) or remaining, remaining)
+        try:
+            with time_limit(limit), telemetry.timed(f"check.{stage.name}"):
+                verdict = stage.run(check)
+        except StageTimeout:
+            if stage.cleanup:
+                stage.cleanup()
+            telemetry.inc('lyken_check_stages_total', stage=stage.name, outcome='timeout')
+            log.warning("⏱️ Stage timed out", stage=stage.name, limit=round(limit, 2))
+            return 0.0, f"{REVIEW}: {stage.name.upper()} STAGE STOPPED AFTER {limit:.1f}s"
+        except Exception:
+            telemetry.inc('lyken_check_stages_total', stage=stage.name, outcome='error')
+            raise
+        telemetry.inc('lyken_check_stages_total', stage=stage.name, outcome='verdict' if verdict else 'passed')
+        if verdict:
+            return verdict
+    return 0.0, f"✅ ACCEPTED: PASSED {', '.join(s.name.upper() for s in stages)}"
+
+if __name__ == '__main__':
+    from app import app
+    from models import db, Course
+    import logic
+
+    parser = argparse.ArgumentParser(description="Show or set the check stages a course runs")
+    parser.add_argument('--course', type=int, required=True)
+    choice = parser.add_mutually_exclusive_group()
+    choice.add_argument('--stages', help=f"comma-separated, in order, from: {','.join(s.name for s in logic.STAGES)}")
+    choice.add_argument('--default', action='store_true', help="run CHECK_STAGES again")
+    args = parser.parse_args()
+    with app.app_context():
+        course = db.session.get(Course, args.course)
+        if course is None:
+            parser.error(f"no course {args.course}")
+        if args.stages is not None or args.default:
+            try:
+                names = parse_names(args.stages, logic.STAGES) if args.stages else []
+            except ValueError as e:
+                parser.error(str(e))
+            course.check_stages = ",".join(names) or None
+            db.session.commit()
+        limits = stage_timeouts()
+        print(f"{course.code}: {'own stage list' if course.check_stages else 'CHECK_STAGES'} "
+              f"(budget {config.CHECK_BUDGET_SECONDS:g}s)")
+        for stage in course_plan(logic.STAGES, course.check_stages):
+            limit = limits.get(stage.name, stage.timeout)
+            print(f"   {stage.name:<15} ~{stage.cost:g}s  limit {f'{limit:g}s' if limit else '-'}")
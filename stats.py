@@ -0,0 +1,103 @@
+"""
+📊 INTEGRITY STATISTICS
+Per-course and per-assignment report counters (submissions by status,
+rejections by reason category, score deciles) are kept in the
+integrity_stat table by a flush hook in models.py, in the same
+transaction as the Submission change, so the reports page reads a few
+dozen summary rows instead of counting every submission.
+
+    python stats.py --check     compare the table with a fresh recount
+    python stats.py --rebuild   recompute the table from the submissions
+"""
+
+import argparse
+from collections import Counter, defaultdict
+
+from sqlalchemy import select
+
+from models import db, IntegrityStat, Submission, STAT_KEY, stat_keys, apply_stat_deltas
+
+CATEGORIES = ['duplicate', 'plagiarism', 'ai', 'unreadable', 'failed', 'other']
+
+def recount(conn, course_id=None):
+    """{STAT_KEY tuple: count} computed from the submission rows."""
+    table = Submission.__table__
+    query = select(table.c.course_id, table.c.assignment_id, table.c.status, table.c.reason, table.c.score)
+    if course_id is not None:
+        query = query.where(table.c.course_id == course_id)
+    counts = Counter()
+    for row in conn.execution_options(yield_per=1000).execute(query):
+        counts.update(stat_keys(*row))
+    return counts
+
+def stored(conn, course_id=None):
+    table = IntegrityStat.__table__
+    query = select(*[table.c[k] for k in STAT_KEY], table.c.count).where(table.c.count != 0)
+    if course_id is not None:
+        query = query.where(table.c.course_id == course_id)
+    return {tuple(row[:-1]): row[-1] for row in conn.execute(query)}
+
+def rebuild(conn, course_id=None):
+    """Replace the stored counters (of one course, or all) with a fresh recount."""
+    table = IntegrityStat.__table__
+    delete = table.delete()
+    if course_id is not None:
+        delete = delete.where(table.c.course_id == course_id)
+    conn.execute(delete)
+    counts = recount(conn, course_id)
+    if counts:
+        apply_stat_deltas(conn, counts)
+    return len(counts)
+
+def drift(conn, course_id=None):
+    """Keys whose stored count differs from a recount: {key: (stored, actual)}."""
+    have, want = stored(conn, course_id), recount(conn, course_id)
+    return {k: (have.get(k, 0), want.get(k, 0)) for k in set(have) | set(want) if have.get(k, 0) != want.get(k, 0)}
+
+def course_summary(course_id):
+    """Everything the reports page shows, from integrity_stat alone."""
+    summary = {
+        'total': 0,
+        'by_status': Counter(),
+        'by_category': Counter(),
+        'buckets': [0] * 10,
+        'assignments': defaultdict(Counter),  # assignment_id -> status -> count
+    }
+    for row in IntegrityStat.query.filter(IntegrityStat.course_id == course_id, IntegrityStat.count != 0):
+        if row.assignment_id:
+            summary['assignments'][row.assignment_id][row.status] += row.count
+            continue
+        summary['total'] += row.count
+        summary['by_status'][row.status] += row.count
+        if row.status == 'rejected':
+            summary['by_category'][row.category] += row.count
+        if row.status not in ('pending', 'review'):
+            summary['buckets'][row.bucket] += row.count
+    return summary
+
+def summary_count(summary, assignment_id=None, status=None):
+    """Submissions counted in a course_summary(), of one assignment and/or one status."""
+    if assignment_id is not None:
+        counts = summary['assignments'].get(assignment_id, {})
+        return counts.get(status, 0) if status else sum(counts.values())
+    return summary['by_status'][status] if status else summary['total']
+
+if __name__ == '__main__':
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Check or rebuild the materialized integrity statistics")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--check', action='store_true')
+    action.add_argument('--rebuild', action='store_true')
+    parser.add_argument('--course', type=int, help="limit to one course")
+    args = parser.parse_args()
+    with app.app_context(), db.engine.begin() as conn:
+        if args.rebuild:
+            print(f"📊 Rebuilt {rebuild(conn, args.course)} counters")
+        else:
+            mismatches = drift(conn, args.course)
+            for key, (have, want) in sorted(mismatches.items()):
+                print(f"   {dict(zip(STAT_KEY, key))}: stored {have}, actual {want}")
+            print(f"📊 {len(mismatches)} counters out of step" if mismatches else "📊 Statistics are consistent")
+            if mismatches:
+                raise SystemExit(1)
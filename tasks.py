@@ -0,0 +1,68 @@
+"""
+🧵 BACKGROUND TASKS
+Work that runs outside the web request: executed by worker.py from the job
+queue, or inline by the submit route when ASYNC_SUBMISSIONS is off.
+Every task expects an active Flask app context.
+"""
+
+from flask import current_app
+
+import config
+import logic
+import pipeline
+import telemetry
+from models import db, Submission, CHECK_FAILED
+
+log = telemetry.get_logger('tasks')
+
+def decide_status(score, reason):
+    if pipeline.is_review(reason):
+        return 'review'  # the check ran out of time: a person decides
+    if logic.CODE_VERDICT in reason:
+        return 'rejected' if score > config.CODE_THRESHOLD else 'accepted'  # fingerprint shares, not prose scores
+    return 'rejected' if score > 0.3 or "scan" in reason.lower() else 'accepted'
+
+def check_submission(submission_id, file_path, budget=None):
+    """Run the integrity check for a pending submission and record the verdict."""
+    sub = db.session.get(Submission, submission_id)
+    if sub is None or sub.status != 'pending':
+        # Already decided (e.g. the job was redelivered after a worker crash)
+        return sub
+
+    with telemetry.bind(submission_id=submission_id):
+        score, reason = logic.run_plagiarism_check(file_path, sub.content_hash, sub.course_id, sub.user_id, Submission,
+                                                   current_app.config['UPLOAD_FOLDER'], submission=sub, budget=budget)
+        return record_verdict(sub, score, reason)
+
+def record_verdict(sub, score, reason):
+    sub.score = score
+    sub.reason = reason
+    sub.status = decide_status(score, reason)
+    db.session.commit()
+    log.info("📮 Verdict recorded", submission_id=sub.id, status=sub.status, score=round(sub.score, 4))
+    return sub
+
+def mark_failed(submission_id, error):
+    """Hand a submission whose check kept crashing to a person (status 'review').
+
+    It does not use up one of the student's attempts (Submission.counts_as_attempt).
+    """
+    sub = db.session.get(Submission, submission_id)
+    if sub is not None and sub.status == 'pending':
+        sub.status = 'review'
+        sub.reason = f"{pipeline.REVIEW}: {CHECK_FAILED} ({str(error)[:160]})"
+        db.session.commit()
+
+def run_audit(report_folder, upload_folder, course_id=None, assignment_id=None):
+    """Bulk similarity audit of an assignment or course (see audit.py)."""
+    import audit
+    return audit.run_audit(report_folder, upload_folder, course_id=course_id, assignment_id=assignment_id)
+
+# Task name -> callable, as stored in the job queue
+TASKS = {
+    'check_submission': check_submission,
+    'audit': run_audit,
+}
+
+def run_job(job):
+    return TASKS[job.task](**job.payload)
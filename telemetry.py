@@ -0,0 +1,350 @@
+"""
+📈 TELEMETRY
+Structured logs and Prometheus metrics for the web app and the workers.
+
+Logs: one line per event (LOG_FORMAT=json for JSON lines, otherwise
+"message key=value ..."), carrying the correlation fields bound for the
+current request or job - request_id, submission_id, job_id - so lines
+from concurrent workers can be told apart and followed end to end.
+
+Metrics: counters and latency histograms live in each process and are
+flushed to METRICS_DIR every few seconds. /metrics merges every
+process's file, so one scrape of the web app also covers the queue
+workers. No client library needed. When a process exits (or is found
+dead: the directory is per machine, files are named after the pid) its
+totals are folded into retired.json and its file removed, so counters
+stay cumulative while the directory holds one file per live process.
+"""
+
+import atexit
+import contextvars
+import fcntl
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import config
+
+# --- STRUCTURED LOGS ---
+
+_fields = contextvars.ContextVar('telemetry_fields', default={})
+
+def push(**fields):
+    """Add correlation fields to every log line of this context; returns a reset token."""
+    return _fields.set({**_fields.get(), **fields})
+
+def pop(token):
+    _fields.reset(token)
+
+@contextmanager
+def bind(**fields):
+    token = push(**fields)
+    try:
+        yield
+    finally:
+        pop(token)
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'pid': record.process,
+            'msg': record.getMessage(),
+            **_fields.get(),
+            **getattr(record, 'fields', {}),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = {**_fields.get(), **getattr(record, 'fields', {})}
+        line = f"{datetime.fromtimestamp(record.created):%H:%M:%S} [{record.process}] {record.getMessage()}"
+        if fields:
+            line += "  " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class Logger:
+    """Thin wrapper so call sites pass fields as keywords: log.info("msg", chars=120)."""
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(f"lyken.{name}")
+
+    def _log(self, level, message, exc_info=None, **fields):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, message, **fields):
+        self._log(logging.DEBUG, message, **fields)
+
+    def info(self, message, **fields):
+        self._log(logging.INFO, message, **fields)
+
+    def warning(self, message, **fields):
+        self._log(logging.WARNING, message, **fields)
+
+    def error(self, message, **fields):
+        self._log(logging.ERROR, message, **fields)
+
+    def exception(self, message, **fields):
+        self._log(logging.ERROR, message, exc_info=True, **fields)
+
+def get_logger(name):
+    return Logger(name)
+
+def configure_logging(level=None, fmt=None):
+    root = logging.getLogger('lyken')
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if (fmt or config.LOG_FORMAT) == 'json' else TextFormatter())
+    root.addHandler(handler)
+    root.setLevel((level or config.LOG_LEVEL).upper())
+    root.propagate = False
+
+configure_logging()
+log = get_logger('telemetry')
+
+# --- METRICS ---
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, math.inf)
+
+METRICS = {
+    'lyken_stage_seconds': ('histogram', "Time spent in each submission-pipeline stage"),
+    'lyken_http_request_seconds': ('histogram', "Flask request latency by endpoint"),
+    'lyken_jobs_total': ('counter', "Queue jobs finished, by task and outcome"),
+    'lyken_text_store_lookups_total': ('counter', "Extracted-text store lookups, by result"),
+    'lyken_embedding_cache_lookups_total': ('counter', "Per-course embedding matrix cache lookups, by result"),
+    'lyken_lexical_cache_lookups_total': ('counter', "Per-course TF-IDF matrix cache lookups, by result"),
+    'lyken_model_server_batches_total': ('counter', "Micro-batches run by the model server, by operation"),
+    'lyken_model_server_items_total': ('counter', "Items (texts, windows, images) served by the model server, by operation"),
+    'lyken_check_stages_total': ('counter', "Check stages run, by stage and outcome (passed, verdict, timeout, skipped, error)"),
+    'lyken_ocr_pages_total': ('counter', "Image and scanned pages read, by source (ocr, or reused text of a known page)"),
+    'lyken_sqlite_write_seconds': ('histogram', "SQLite write statements, including busy_timeout waits for the write lock"),
+    'lyken_sqlite_locked_total': ('counter', "SQLite statements that failed with 'database is locked'"),
+    'lyken_text_store_hit_ratio': ('gauge', "Text store hits / lookups across all processes"),
+    'lyken_embedding_cache_hit_ratio': ('gauge', "Embedding matrix cache hits / lookups across all processes"),
+    'lyken_admission_total': ('counter', "Submission checks by admission outcome (inline, queued, shed_*, repeat)"),
+    'lyken_job_queue_depth': ('gauge', "Jobs queued or running"),
+    'lyken_job_queue_overdue': ('gauge', "Queued jobs whose assignment deadline has passed"),
+}
+
+class Registry:
+    """This process's counters and histograms, keyed by (name, sorted label items)."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.file_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.flushed_at = 0.0
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            hist['buckets'][next(i for i, le in enumerate(BUCKETS) if seconds <= le)] += 1
+            hist['sum'] += seconds
+            hist['count'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return _snapshot(self.counters, self.histograms)
+
+_registry = Registry()
+_metrics_dir = config.METRICS_DIR
+
+# A forked child starts with its own, empty registry (no double counting of the parent's)
+os.register_at_fork(after_in_child=_registry.reset)
+
+def set_metrics_dir(path):
+    global _metrics_dir
+    _metrics_dir = path
+
+def flush(force=False):
+    """Write this process's metrics for /metrics to merge (at most every METRICS_FLUSH_SECONDS)."""
+    if not _metrics_dir:
+        return
+    now = time.monotonic()
+    if not force and now - _registry.flushed_at < config.METRICS_FLUSH_SECONDS:
+        return
+    _registry.flushed_at = now
+    try:
+        os.makedirs(_metrics_dir, exist_ok=True)
+        path = os.path.join(_metrics_dir, f"{_registry.file_id}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(_registry.snapshot(), f)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        log.warning("metrics flush failed", error=str(e))
+
+def _exit():
+    flush(force=True)
+    if _metrics_dir:
+        _retire([os.path.join(_metrics_dir, f"{_registry.file_id}.json")])
+
+atexit.register(_exit)
+
+def inc(name, value=1, **labels):
+    _registry.inc(name, value, **labels)
+    flush()
+
+def observe(name, seconds, **labels):
+    _registry.observe(name, seconds, **labels)
+    flush()
+
+@contextmanager
+def timed(stage):
+    """Time a pipeline stage into lyken_stage_seconds{stage=...}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        observe('lyken_stage_seconds', seconds, stage=stage)
+        log.debug("stage timed", stage=stage, seconds=round(seconds, 4))
+
+RETIRED = 'retired.json'  # summed metrics of the processes that have exited
+
+def _alive(path):
+    """Whether the process that writes this metrics file (named <pid>-<id>.json) still runs."""
+    try:
+        os.kill(int(os.path.basename(path).split('-')[0]), 0)
+    except ProcessLookupError:
+        return False
+    except (ValueError, OSError):
+        return True  # not ours to judge (e.g. another user's process)
+    return True
+
+def _retire(paths):
+    """Fold the files of exited processes into retired.json and delete them."""
+    retired = os.path.join(_metrics_dir, RETIRED)
+    try:
+        with open(os.path.join(_metrics_dir, 'retired.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots, folded = [], []
+            for path in [retired] + paths:
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # already retired by another process, or never written
+                if path != retired:
+                    folded.append(path)
+            if folded:
+                with open(retired + '.tmp', 'w') as f:
+                    json.dump(_snapshot(*_sum(snapshots)), f)
+                os.replace(retired + '.tmp', retired)
+                for path in folded:
+                    os.remove(path)
+    except OSError as e:
+        log.warning("retiring metrics files failed", error=str(e))
+
+def _merged():
+    """Counters and histograms summed over this process, every flushed file and the retired totals."""
+    snapshots = [_registry.snapshot()]
+    if not _metrics_dir:
+        return _sum(snapshots)
+    own = f"{_registry.file_id}.json"
+    paths = [p for p in glob.glob(os.path.join(_metrics_dir, '*.json')) if os.path.basename(p) not in (own, RETIRED)]
+    dead = [p for p in paths if not _alive(p)]
+    if dead:
+        _retire(dead)
+    for path in [p for p in paths if p not in dead] + [os.path.join(_metrics_dir, RETIRED)]:
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # being rewritten, or no process has exited yet
+    return _sum(snapshots)
+
+def _snapshot(counters, histograms):
+    return {
+        'counters': [[n, dict(l), v] for (n, l), v in counters.items()],
+        'histograms': [[n, dict(l), h['buckets'], h['sum'], h['count']] for (n, l), h in histograms.items()],
+    }
+
+def _sum(snapshots):
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap['counters']:
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in snap['histograms']:
+            key = (name, tuple(sorted(labels.items())))
+            hist = histograms.setdefault(key, {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0})
+            hist['buckets'] = [a + b for a, b in zip(hist['buckets'], buckets)]
+            hist['sum'] += total
+            hist['count'] += count
+    return counters, histograms
+
+def _labels(items, **extra):
+    pairs = list(items) + list(extra.items())
+    if not pairs:
+        return ""
+    escape = lambda v: str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+def _ratio(counters, name):
+    hits = sum(v for (n, l), v in counters.items() if n == name and ('result', 'hit') in l)
+    total = sum(v for (n, l), v in counters.items() if n == name)
+    return hits / total if total else 0.0
+
+def render(gauges=None):
+    """Prometheus text exposition of every process's metrics plus `gauges` ({name: value})."""
+    counters, histograms = _merged()
+    gauges = dict(gauges or {})
+    gauges['lyken_text_store_hit_ratio'] = _ratio(counters, 'lyken_text_store_lookups_total')
+    gauges['lyken_embedding_cache_hit_ratio'] = _ratio(counters, 'lyken_embedding_cache_lookups_total')
+
+    lines = []
+    def header(name):
+        kind, help_text = METRICS.get(name, ('untyped', name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for name in sorted({n for n, _ in counters}):
+        header(name)
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_labels(labels)} {value}")
+    for name in sorted({n for n, _ in histograms}):
+        header(name)
+        for (n, labels), hist in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for le, count in zip(BUCKETS, hist['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, le='+Inf' if le == math.inf else le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {hist['sum']:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {hist['count']}")
+    for name, value in sorted(gauges.items()):
+        header(name)
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,82 @@
+"""
+Shared fixtures. The suite runs against a throwaway instance folder
+(database, uploads, job queue, metrics) with MODEL_BACKEND=stub, so it
+needs no model downloads and never touches instance/university.db.
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INSTANCE = tempfile.mkdtemp(prefix='lyken-tests-')
+
+# Read by config.py at import: set before any application module is imported
+os.environ.update({
+    'MODEL_BACKEND': 'stub',
+    'INSTANCE_PATH': INSTANCE,
+    'UPLOAD_FOLDER': os.path.join(INSTANCE, 'static', 'uploads'),
+    'ASYNC_SUBMISSIONS': '0',
+    'OCR_WORKERS': '1',
+})
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'pw'
+
+@pytest.fixture
+def app():
+    """The Flask app on empty tables.
+
+    Work outside requests needs `with app.app_context()`: a context left
+    pushed would be shared by the test client's requests (and their `g`).
+    """
+    from app import app as flask_app, job_queue
+    from models import db
+    import course_search
+    import embeddings
+    import lexical
+    import migrate
+
+    with flask_app.app_context():
+        db.drop_all()
+        migrate.upgrade()
+        # Row ids restart: drop the per-process caches keyed on them
+        for cache in (embeddings._cache, lexical._cache, course_search._cache):
+            cache.clear()
+        course_search._indexed.clear()
+    with job_queue._connect() as conn:
+        conn.execute("DELETE FROM job")
+    yield flask_app
+
+@pytest.fixture
+def course_id(app):
+    """Id of a course of 'teacher' with one open assignment and students 'a', 'b' and 'c'."""
+    from app import bcrypt
+    from models import db, User, Course, Assignment
+
+    password = bcrypt.generate_password_hash(PASSWORD).decode()
+    with app.app_context():
+        teacher = User(username='teacher', email='teacher@example.edu', password=password, role='faculty')
+        db.session.add(teacher)
+        db.session.add_all([User(username=u, email=f"{u}@example.edu", password=password, role='student')
+                            for u in 'abc'])
+        db.session.commit()
+        course = Course(name='Algorithms', code='CS201', faculty_id=teacher.id)
+        db.session.add(course)
+        db.session.commit()
+        db.session.add(Assignment(course_id=course.id, title='Essay', attempt_limit=5,
+                                  deadline=datetime.datetime.now() + datetime.timedelta(days=7)))
+        db.session.commit()
+        return course.id
+
+@pytest.fixture
+def login(app):
+    """login(username) -> a test client with that user signed in."""
+    def login(username):
+        client = app.test_client()
+        client.post('/login', data={'username': username, 'password': PASSWORD})
+        return client
+    return login
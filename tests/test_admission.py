@@ -0,0 +1,101 @@
+import io
+import time
+
+import pytest
+
+import admission
+import config
+from job_queue import SQLiteQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteQueue(str(tmp_path / 'jobs.db'), visibility_timeout=60)
+
+def claim_all(queue):
+    jobs = []
+    while (job := queue.get(timeout=0)) is not None:
+        jobs.append(job)
+    return jobs
+
+def test_nearest_deadline_first(queue):
+    for name, priority in (('late', 300.0), ('none', None), ('soon', 100.0), ('middle', 200.0)):
+        queue.put('t', {'name': name}, priority=priority)
+
+    assert [job.payload['name'] for job in claim_all(queue)] == ['soon', 'middle', 'late', 'none']
+
+def test_claim_keeps_to_the_per_user_limit(queue, monkeypatch):
+    monkeypatch.setattr(config, 'ADMISSION_USER_SLOTS', 1)
+    first = queue.put('t', {'n': 1}, priority=1.0, user_id=7)
+    queue.put('t', {'n': 2}, priority=2.0, user_id=7)
+    queue.put('t', {'n': 3}, priority=3.0, user_id=8)
+
+    # User 7's second job waits behind the first, though its deadline is nearer than user 8's
+    assert [job.payload['n'] for job in claim_all(queue)] == [1, 3]
+    queue.ack(first)
+    assert queue.get(timeout=0).payload['n'] == 2
+
+def test_unacked_job_is_delivered_again(queue, monkeypatch):
+    monkeypatch.setattr(config, 'ADMISSION_USER_SLOTS', 1)
+    queue.put('t', {'n': 1}, user_id=7)
+    queue.put('t', {'n': 2}, user_id=7)
+    lost = queue.get(timeout=0)
+    assert queue.get(timeout=0) is None
+
+    # The worker died: after the visibility timeout the job (and the student's slot) is free again
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    again = queue.get(timeout=0)
+
+    assert (again.id, again.attempts) == (lost.id, 2)
+
+def test_overdue_counts_queued_jobs_past_their_deadline(queue):
+    now = time.time()
+    queue.put('t', {}, priority=now - 60)
+    queue.put('t', {}, priority=now - 30)
+    queue.put('t', {}, priority=now + 60)
+    queue.put('t', {})
+    queue.get(timeout=0)  # running, no longer waiting
+
+    assert queue.overdue(now) == 1
+
+def test_slots_per_node_and_per_user(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'ADMISSION_NODE_SLOTS', 2)
+    monkeypatch.setattr(config, 'ADMISSION_USER_SLOTS', 1)
+    monkeypatch.setitem(admission._recent, 'seconds', 0.0)
+    folder = str(tmp_path)
+
+    with admission.inline_slot(folder, 1) as first, admission.inline_slot(folder, 1) as same_user, \
+            admission.inline_slot(folder, 2) as second, admission.inline_slot(folder, 3) as third:
+        assert (first, same_user, second, third) == (None, 'user', None, 'node')
+    with admission.inline_slot(folder, 3) as later:
+        assert later is None
+
+def test_slow_inline_checks_shed_to_the_queue(app, course_id, login, monkeypatch):
+    import tasks
+    from app import job_queue
+    from models import Assignment, Submission
+
+    monkeypatch.setattr(config, 'ADMISSION_MAX_INLINE_SECONDS', 0.05)
+    monkeypatch.setitem(admission._recent, 'seconds', 0.0)
+    monkeypatch.setattr(tasks, 'check_submission', lambda *args, **kwargs: time.sleep(0.1))
+    with app.app_context():
+        assignment = Assignment.query.filter_by(course_id=course_id).one()
+        assignment_id, deadline = assignment.id, assignment.deadline
+    student = login('a')
+
+    def upload(data):
+        return student.post(f"/submit/{assignment_id}", data={'file': (io.BytesIO(data), 'essay.txt')},
+                            content_type='multipart/form-data', follow_redirects=True)
+
+    upload(b"first draft of the essay")
+    assert job_queue.depth() == 0  # checked inline, and slowly
+    response = upload(b"second draft of the essay")
+
+    assert b"checker is busy" in response.data
+    job = job_queue.get(timeout=0)
+    with app.app_context():
+        shed = Submission.query.order_by(Submission.id.desc()).first()
+    assert job.payload['submission_id'] == shed.id and shed.status == 'pending'
+    with job_queue._connect() as conn:
+        assert conn.execute("SELECT priority, user_id FROM job WHERE id = ?", (job.id,)).fetchone() == \
+            (deadline.timestamp(), shed.user_id)
@@ -0,0 +1,49 @@
+import pytest
+
+import config
+import inference
+import logic
+
+class Detector:
+    """Words as tokens; a window's AI probability is its share of the word 'generated'."""
+    special_tokens = 2
+
+    def __init__(self):
+        self.batches = []
+
+    def token_ids(self, text):
+        return text.split()
+
+    def predict(self, windows):
+        self.batches.append(len(windows))
+        return [w.count('generated') / len(w) for w in windows]
+
+@pytest.fixture
+def detector(monkeypatch):
+    monkeypatch.setattr(config, 'AI_WINDOW_TOKENS', 12)
+    monkeypatch.setattr(config, 'AI_WINDOW_STRIDE', 4)
+    monkeypatch.setattr(config, 'AI_BATCH_SIZE', 3)
+    fake = Detector()
+    monkeypatch.setattr(logic, 'get_ai_detector', lambda: fake)
+    return fake
+
+def test_windows_cover_the_whole_document(detector):
+    words = [f"w{n}" for n in range(30)]
+    windows = inference.token_windows(detector, " ".join(words))
+
+    assert all(len(w) <= 10 for w in windows)  # 12 with the special tokens
+    assert [w[:4] for w in windows[1:]] == [w[-4:] for w in windows[:-1]]  # neighbours share the stride
+    assert windows[-1][-1] == 'w29' and sorted({t for w in windows for t in w}) == sorted(words)
+
+def test_windows_are_scored_in_batches(detector):
+    windows = logic.ai_window_scores(" ".join(f"w{n}" for n in range(60)))
+
+    assert len(windows) == 10 and detector.batches == [3, 3, 3, 1]
+
+def test_generated_ending_counts_in_the_document_score(detector):
+    text = " ".join(["written"] * 40 + ["generated"] * 40)
+    result = logic.score_ai_content(text)
+
+    # The opening alone would have scored 0
+    assert result['windows'][0] == 0.0 and result['windows'][-1] == 1.0
+    assert 0.4 < result['score'] < 0.6 and result['detected'] is False
@@ -0,0 +1,11 @@
+from app import bcrypt
+from models import db, User
+
+def test_audit_only_by_the_course_faculty(app, course_id, login):
+    with app.app_context():
+        password = bcrypt.generate_password_hash('pw').decode()
+        db.session.add(User(username='other', email='other@example.edu', password=password, role='faculty'))
+        db.session.commit()
+
+    assert login('other').post(f"/course/{course_id}/audit").status_code == 403
+    assert login('teacher').post(f"/course/{course_id}/audit").status_code == 302
@@ -0,0 +1,42 @@
+"""Index backfills read priors from UPLOAD_FOLDER, wherever it is, and retry files that are missing."""
+
+import datetime
+import os
+
+from PIL import Image, ImageDraw
+
+import codeprint
+import phash
+from models import db, User, Submission
+
+CODE = "\n".join(f"def step_{n}(values):\n    total = 0\n    for v in values:\n        total += v * {n}\n    return total\n"
+                 for n in range(6))
+
+def add_prior(course_id, filename):
+    user = User.query.filter_by(username='b').one()
+    sub = Submission(assignment_id=1, user_id=user.id, course_id=course_id, filename=filename,
+                     content_hash=filename, status='accepted', reason="✅ ACCEPTED", timestamp=datetime.datetime.now())
+    db.session.add(sub)
+    db.session.commit()
+    return sub
+
+def test_backfills_skip_missing_files(app, course_id):
+    folder = app.config['UPLOAD_FOLDER']
+    assert os.path.abspath(folder) != os.path.abspath(os.path.join(os.getcwd(), 'static', 'uploads'))
+    with open(os.path.join(folder, 'prior.py'), 'w') as f:
+        f.write(CODE)
+    image = Image.new('L', (300, 400), 255)
+    ImageDraw.Draw(image).rectangle((40, 40, 200, 300), fill=0)
+    image.save(os.path.join(folder, 'prior.png'))
+
+    with app.app_context():
+        code, lost_code = add_prior(course_id, 'prior.py'), add_prior(course_id, 'lost.py')
+        page, lost_page = add_prior(course_id, 'prior.png'), add_prior(course_id, 'lost.png')
+
+        assert codeprint.backfill(course_id, Submission, folder) == 1
+        assert phash.backfill(course_id, Submission, folder) == 1
+        db.session.commit()
+
+        assert code.code_prints > 0 and page.page_hashes == 1
+        # Not recorded as empty: the next backfill tries again
+        assert lost_code.code_prints is None and lost_page.page_hashes is None
@@ -0,0 +1,149 @@
+import datetime
+import os
+
+import pytest
+
+import config
+import logic
+import tasks
+from models import db, User, Assignment, Submission
+
+SOLUTION = '''
+def shortest_paths(graph, source):
+    distance = {node: float("inf") for node in graph}
+    distance[source] = 0
+    frontier = [(0, source)]
+    while frontier:
+        cost, node = heapq.heappop(frontier)
+        if cost > distance[node]:
+            continue
+        for neighbour, weight in graph[node].items():
+            candidate = cost + weight
+            if candidate < distance[neighbour]:
+                distance[neighbour] = candidate
+                heapq.heappush(frontier, (candidate, neighbour))
+    return distance
+'''
+
+# The same program with every name changed, other comments and spacing
+RENAMED = '''
+def dijkstra(g, start):
+    # best known cost per vertex
+    best = {v: float("inf") for v in g}
+    best[start] = 0
+    heap = [(0, start)]
+    while heap:
+        d, v = heapq.heappop(heap)
+        if d > best[v]: continue
+        for w, length in g[v].items():
+            alt = d + length
+            if alt < best[w]:
+                best[w] = alt
+                heapq.heappush(heap, (alt, w))
+    return best
+'''
+
+STARTER = '''
+import heapq
+
+def read_graph(path):
+    graph = {}
+    with open(path) as f:
+        for line in f:
+            a, b, w = line.split()
+            graph.setdefault(a, {})[b] = float(w)
+            graph.setdefault(b, {})[a] = float(w)
+    return graph
+'''
+
+OTHER = '''
+def topological_order(edges):
+    indegree = collections.Counter(b for _, b in edges)
+    ready = [a for a, _ in edges if indegree[a] == 0]
+    order = []
+    while ready:
+        node = ready.pop()
+        order.append(node)
+        for a, b in edges:
+            if a == node:
+                indegree[b] -= 1
+                if indegree[b] == 0:
+                    ready.append(b)
+    return order
+'''
+
+@pytest.fixture
+def folder(app):
+    return app.config['UPLOAD_FOLDER']
+
+def write(folder, name, source):
+    with open(os.path.join(folder, name), 'w') as f:
+        f.write(source)
+    return os.path.join(folder, name)
+
+def submit(app, course_id, username, name, source, status='pending'):
+    """A submission row of `source` (already checked and `status`, or pending), fingerprinted if accepted."""
+    folder = app.config['UPLOAD_FOLDER']
+    path = write(folder, name, source)
+    user = User.query.filter_by(username=username).one()
+    sub = Submission(assignment_id=Assignment.query.filter_by(course_id=course_id).one().id, user_id=user.id,
+                     course_id=course_id, filename=name, content_hash=name, status='pending',
+                     timestamp=datetime.datetime.now())
+    db.session.add(sub)
+    db.session.commit()
+    if status == 'pending':
+        return sub, path
+    tasks.record_verdict(sub, *logic.check_code(path, course_id, user.id, Submission, folder, sub))
+    sub.status = status
+    db.session.commit()
+    return sub, path
+
+def verdict(app, course_id, username, name, source):
+    sub, path = submit(app, course_id, username, name, source)
+    score, reason = logic.check_code(path, course_id, sub.user_id, Submission, app.config['UPLOAD_FOLDER'], sub)
+    return tasks.decide_status(score, reason), score, reason
+
+def test_renamed_copy_is_rejected(app, course_id):
+    with app.app_context():
+        submit(app, course_id, 'b', 'b.py', SOLUTION, status='accepted')
+        status, score, reason = verdict(app, course_id, 'a', 'a.py', RENAMED)
+
+    assert status == 'rejected' and score > 0.9
+    assert reason.startswith("🚨 REJECTED") and "CODE SIMILARITY (b)" in reason
+
+def test_starter_code_is_not_similarity(app, course_id, folder):
+    write(folder, 'Q_1_starter.py', STARTER)
+    with app.app_context():
+        Assignment.query.filter_by(course_id=course_id).one().question_file = 'Q_1_starter.py'
+        db.session.commit()
+        submit(app, course_id, 'b', 'b.py', STARTER + SOLUTION, status='accepted')
+        status, score, _ = verdict(app, course_id, 'a', 'a.py', STARTER + OTHER)
+
+    assert status == 'accepted' and score == 0.0
+
+def test_code_common_to_the_course_is_not_similarity(app, course_id, monkeypatch):
+    monkeypatch.setattr(config, 'CODE_COMMON_MIN', 2)
+    monkeypatch.setattr(config, 'CODE_COMMON_FRACTION', 0.5)
+    with app.app_context():
+        submit(app, course_id, 'b', 'b.py', STARTER + SOLUTION, status='accepted')
+        submit(app, course_id, 'c', 'c.py', STARTER + OTHER, status='accepted')
+        # STARTER is held by b and c: boilerplate. The rest of a's program is c's.
+        status, score, reason = verdict(app, course_id, 'a', 'a.py', STARTER + OTHER.replace('order', 'result'))
+
+    assert status == 'rejected' and score == 1.0 and "(c)" in reason
+
+def test_own_fingerprints_do_not_make_code_common(app, course_id, monkeypatch):
+    # Held by b and, were they counted, by a itself: two students, boilerplate
+    monkeypatch.setattr(config, 'CODE_COMMON_MIN', 2)
+    monkeypatch.setattr(config, 'CODE_COMMON_FRACTION', 0.0)
+    with app.app_context():
+        submit(app, course_id, 'b', 'b.py', SOLUTION, status='accepted')
+        status, score, _ = verdict(app, course_id, 'a', 'a.py', RENAMED)
+
+    assert status == 'rejected' and score > 0.9
+
+def test_accepted_code_verdict_is_stored_as_accepted(app, course_id):
+    with app.app_context():
+        assert tasks.decide_status(0.4, "✅ ACCEPTED: 40.0% MAX CODE SIMILARITY (b)") == 'accepted'
+        assert tasks.decide_status(0.6, "🚨 REJECTED: 60.0% CODE SIMILARITY (b)") == 'rejected'
+        assert tasks.decide_status(0.4, "✅ ACCEPTED: 40.0% MAX SIMILARITY (b)") == 'rejected'  # prose rule
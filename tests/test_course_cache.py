@@ -0,0 +1,75 @@
+"""The per-process course matrices (embeddings.py, lexical.py) follow every change to the accepted priors."""
+
+import datetime
+import multiprocessing
+
+import numpy as np
+import pytest
+
+import embeddings
+import lexical
+from models import db, User, Assignment, Submission
+
+def vector(n):
+    return np.eye(8, dtype=np.float32)[n]
+
+def add_prior(course_id, username, n, status='accepted'):
+    user = User.query.filter_by(username=username).one()
+    assignment = Assignment.query.filter_by(course_id=course_id).first()
+    sub = Submission(assignment_id=assignment.id, user_id=user.id, course_id=course_id, filename=f"{n}.txt",
+                     content_hash=f"prior-{n}", status=status, reason="", timestamp=datetime.datetime.now(),
+                     embedding=embeddings.to_blob(vector(n)),
+                     terms=lexical.to_blob(lexical.term_counts(f"essay number {n} about topic{n}")))
+    db.session.add(sub)
+    db.session.commit()
+    return sub.id
+
+def cached_ids(course_id):
+    """Prior ids each index scores a query of student 'a' against."""
+    query = User.query.filter_by(username='a').one().id
+    semantic = {sid for sid, _ in embeddings.search(course_id, vector(0), query, Submission)}
+    terms = set(lexical.search(course_id, lexical.term_counts("essay"), query, Submission))
+    assert semantic == terms
+    return semantic
+
+def set_status(submission_id, status):
+    db.session.get(Submission, submission_id).status = status
+    db.session.commit()
+
+@pytest.mark.parametrize('change', ['accept', 'reject', 'delete'])
+def test_cache_follows_accepted_priors(app, course_id, change):
+    with app.app_context():
+        first = add_prior(course_id, 'b', 1)
+        second = add_prior(course_id, 'c', 2, status='pending' if change == 'accept' else 'accepted')
+        before = cached_ids(course_id)
+
+        if change == 'accept':
+            set_status(second, 'accepted')
+        elif change == 'reject':
+            set_status(second, 'rejected')
+        else:
+            db.session.delete(db.session.get(Submission, second))
+            db.session.commit()
+
+        expected = {first, second} if change == 'accept' else {first}
+        assert before != expected
+        assert cached_ids(course_id) == expected
+
+def _reject_in_other_process(app, submission_id):
+    with app.app_context():
+        set_status(submission_id, 'rejected')
+
+def test_stale_process_picks_up_changes(app, course_id):
+    with app.app_context():
+        first, second = add_prior(course_id, 'b', 1), add_prior(course_id, 'c', 2)
+        assert cached_ids(course_id) == {first, second}
+        db.session.remove()
+
+    # Another worker process changes the corpus; this process's matrices are now stale
+    proc = multiprocessing.get_context('fork').Process(target=_reject_in_other_process, args=(app, second))
+    proc.start()
+    proc.join(30)
+    assert proc.exitcode == 0
+
+    with app.app_context():
+        assert cached_ids(course_id) == {first}
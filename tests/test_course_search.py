@@ -0,0 +1,72 @@
+import pytest
+from sqlalchemy import text
+
+import config
+import course_search
+from models import db, User, Course
+
+@pytest.fixture
+def courses(app, course_id):
+    """CS201 Algorithms (teacher) plus MA101 Linear Algebra and CS310 Compilers of 'grace'."""
+    with app.app_context():
+        grace = User(username='grace', email='grace@example.edu', password='x', role='faculty')
+        db.session.add(grace)
+        db.session.commit()
+        db.session.add_all([Course(name='Linear Algebra', code='MA101', faculty_id=grace.id),
+                            Course(name='Compilers', code='CS310', faculty_id=grace.id)])
+        db.session.commit()
+
+def codes(query):
+    return [c.code for c in course_search.search(query).items]
+
+def test_index_is_created_with_the_course_table(app):
+    with app.app_context():
+        names = set(db.session.scalars(text("SELECT name FROM sqlite_master WHERE name LIKE 'course_fts%'")))
+
+    assert {'course_fts', 'course_fts_insert', 'course_fts_update', 'course_fts_delete',
+            'course_fts_faculty'} <= names
+
+@pytest.mark.parametrize('fts', [True, False], ids=['fts5', 'like'])
+def test_search_by_prefix_name_and_instructor(app, courses, monkeypatch, fts):
+    if not fts:
+        monkeypatch.setattr(course_search, 'has_index', lambda: False)
+    with app.app_context():
+        assert course_search.has_index() is fts
+        assert sorted(codes("cs")) == ['CS201', 'CS310']
+        assert codes("cs2") == ['CS201']
+        assert codes("linear alg") == ['MA101']
+        assert sorted(codes("grace")) == ['CS310', 'MA101']
+        assert codes("nothing") == []
+        assert codes("") == ['CS201', 'CS310', 'MA101']  # all, by name
+
+def test_index_follows_course_and_instructor_changes(app, courses):
+    with app.app_context():
+        course = Course.query.filter_by(code='MA101').one()
+        course.name, course.code = 'Probability', 'MA205'
+        User.query.filter_by(username='grace').one().username = 'hopper'
+        db.session.delete(Course.query.filter_by(code='CS310').one())
+        db.session.commit()
+
+        assert codes("probab") == ['MA205'] and codes("linear") == []
+        assert codes("hopper") == ['MA205'] and codes("grace") == []
+        assert codes("compilers") == []
+
+def test_typeahead_is_cached(app, courses, login, monkeypatch):
+    monkeypatch.setattr(config, 'SEARCH_CACHE_SECONDS', 60)
+    client = login('a')
+    first = client.get('/api/courses/suggest?q=Comp').get_json()['results']
+    with app.app_context():
+        Course.query.filter_by(code='CS310').one().name = 'Compiler Construction'
+        db.session.commit()
+
+    assert [r['code'] for r in first] == ['CS310']
+    assert client.get('/api/courses/suggest?q=comp').get_json()['results'] == first  # same key, cached
+    monkeypatch.setattr(course_search, '_cache', type(course_search._cache)())
+    assert client.get('/api/courses/suggest?q=comp').get_json()['results'][0]['name'] == 'Compiler Construction'
+
+def test_typeahead_cache_can_be_disabled(app, courses, monkeypatch):
+    monkeypatch.setattr(config, 'SEARCH_CACHE_SECONDS', 0)
+    with app.app_context():
+        assert course_search.suggest("alg", limit=5)[0]['code'] in ('CS201', 'MA101')
+
+    assert not course_search._cache
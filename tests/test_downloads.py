@@ -0,0 +1,78 @@
+import datetime
+import hashlib
+import os
+
+import pytest
+
+from models import db, User, Assignment, Submission
+
+DATA = bytes(range(256)) * 40
+DIGEST = hashlib.sha256(DATA).hexdigest()
+
+@pytest.fixture
+def submission_id(app, course_id):
+    filename = "S_1_2_1700000000_answer.pdf"
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], filename), 'wb') as f:
+        f.write(DATA)
+    with app.app_context():
+        sub = Submission(assignment_id=Assignment.query.filter_by(course_id=course_id).one().id,
+                         user_id=User.query.filter_by(username='a').one().id, course_id=course_id,
+                         filename=filename, content_hash=DIGEST, status='accepted', reason="✅ ACCEPTED",
+                         timestamp=datetime.datetime.now())
+        db.session.add(sub)
+        db.session.commit()
+        return sub.id
+
+def test_download_with_etag(login, submission_id):
+    response = login('a').get(f"/submission/{submission_id}/file")
+
+    assert response.status_code == 200 and response.data == DATA
+    assert response.headers['ETag'] == f'"{DIGEST}"'
+    assert 'answer.pdf' in response.headers['Content-Disposition']
+
+def test_matching_etag_is_not_modified(login, submission_id):
+    response = login('a').get(f"/submission/{submission_id}/file", headers={'If-None-Match': f'"{DIGEST}"'})
+
+    assert response.status_code == 304 and response.data == b""
+
+def test_range_request(login, submission_id):
+    response = login('teacher').get(f"/submission/{submission_id}/file", headers={'Range': 'bytes=256-511'})
+
+    assert response.status_code == 206
+    assert response.data == DATA[256:512]
+    assert response.headers['Content-Range'] == f"bytes 256-511/{len(DATA)}"
+
+def test_other_student_is_refused(login, submission_id):
+    assert login('b').get(f"/submission/{submission_id}/file").status_code == 403
+
+def test_migration_moves_uploads_out_of_static(app, tmp_path, monkeypatch):
+    import config
+    import migrate
+
+    old = tmp_path / 'static' / 'uploads'
+    old.mkdir(parents=True)
+    (old / 'S_9_9_1_old.txt').write_text("uploaded before the move")
+    monkeypatch.setattr(config, 'UPLOAD_FOLDER', None)  # the default folder, as in a deployment
+    monkeypatch.setattr(app, 'root_path', str(tmp_path))
+    with app.app_context():
+        migrate.move_static_uploads(None)
+
+    assert not (old / 'S_9_9_1_old.txt').exists()
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'S_9_9_1_old.txt')) as f:
+        assert f.read() == "uploaded before the move"
+
+def test_x_accel_offload(app, login, submission_id, monkeypatch):
+    monkeypatch.setitem(app.config, 'DOWNLOAD_OFFLOAD', 'x-accel')
+    response = login('a').get(f"/submission/{submission_id}/file")
+
+    assert response.status_code == 200 and response.data == b""
+    assert response.headers['X-Accel-Redirect'] == "/protected-uploads/S_1_2_1700000000_answer.pdf"
+    assert response.headers['ETag'] == f'"{DIGEST}"'
+
+def test_x_sendfile_offload(app, login, submission_id, monkeypatch):
+    monkeypatch.setitem(app.config, 'DOWNLOAD_OFFLOAD', 'x-sendfile')
+    monkeypatch.setitem(app.config, 'USE_X_SENDFILE', True)
+    response = login('a').get(f"/submission/{submission_id}/file")
+
+    assert response.status_code == 200 and response.data == b""
+    assert response.headers['X-Sendfile'] == os.path.join(app.config['UPLOAD_FOLDER'], "S_1_2_1700000000_answer.pdf")
@@ -0,0 +1,23 @@
+import csv
+import io
+import json
+
+import export
+
+ROW = dict.fromkeys(export.FIELDS, None)
+ROW.update(submission_id=1, username='=HYPERLINK("http://evil.example","x")', filename='+cmd.txt',
+           assignment='@SUM(A1)', reason='-2+3', status='rejected', score=-0.0, content_hash='ab')
+
+def test_csv_cells_cannot_start_a_formula():
+    text = "".join(export.encode(iter([ROW]), 'csv'))
+    row = next(csv.DictReader(io.StringIO(text)))
+    assert row['username'] == "'" + ROW['username']
+    assert row['filename'] == "'+cmd.txt"
+    assert row['assignment'] == "'@SUM(A1)"
+    assert row['reason'] == "'-2+3"
+    assert row['status'] == 'rejected'
+    assert row['score'] == '-0.0'  # numbers are not text cells
+
+def test_json_lines_are_verbatim():
+    text = "".join(export.encode(iter([ROW]), 'jsonl'))
+    assert json.loads(text) == ROW
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+import inference
+
+for module in ('onnxruntime', 'torch', 'transformers', 'sentence_transformers'):
+    pytest.importorskip(module)
+
+pytestmark = pytest.mark.skipif(
+    not all(os.path.exists(os.path.join(inference.model_dir(), f))
+            for f in (inference.DETECTOR_FILE, inference.ENCODER_FILE)),
+    reason="no exported ONNX models - run: python inference.py export")
+
+def test_onnx_within_parity_bounds():
+    report, ok = inference.parity(inference.sample_texts(20), inference.MAX_PROB_DRIFT, inference.MIN_COSINE)
+    assert ok, report
@@ -0,0 +1,43 @@
+import hashlib
+import io
+import os
+
+from werkzeug.datastructures import FileStorage
+
+import ingest
+from models import Assignment, Submission
+
+ESSAY = (b"Dynamic programming solves a problem by combining the answers to overlapping subproblems, "
+         b"each computed once and kept in a table, so the running time is the number of subproblems "
+         b"times the work per subproblem rather than exponential in the input size.")
+
+def test_fallback_hashes_while_storing_once(tmp_path):
+    data = os.urandom(ingest.CHUNK_SIZE * 2 + 100)
+    digest = hashlib.sha256(data).hexdigest()
+
+    first = ingest.store_upload(FileStorage(io.BytesIO(data), 'a.pdf'), str(tmp_path))
+    second = ingest.store_upload(FileStorage(io.BytesIO(data), 'b.pdf'), str(tmp_path))
+
+    assert first == (digest, ingest.blob_path(str(tmp_path), digest), True)
+    assert second == (digest, first[1], False)
+    with open(first[1], 'rb') as f:
+        assert f.read() == data
+    assert os.listdir(tmp_path) == [digest[:2]]  # no spool files left behind
+
+def test_resubmitted_file_is_stored_once_and_caught_by_its_hash(app, course_id, login):
+    with app.app_context():
+        assignment_id = Assignment.query.filter_by(course_id=course_id).one().id
+    for username in ('a', 'b'):
+        login(username).post(f"/submit/{assignment_id}", data={'file': (io.BytesIO(ESSAY), 'essay.txt')},
+                             content_type='multipart/form-data')
+
+    with app.app_context():
+        subs = Submission.query.order_by(Submission.id).all()
+        rows = [(s.status, s.content_hash) for s in subs]
+        files = [os.path.join(app.config['UPLOAD_FOLDER'], s.filename) for s in subs]
+    digest = hashlib.sha256(ESSAY).hexdigest()
+    blob = ingest.blob_path(app.config['BLOB_FOLDER'], digest)
+
+    assert rows == [('accepted', digest), ('rejected', digest)]
+    assert {os.stat(path).st_ino for path in files} == {os.stat(blob).st_ino}
+    assert not [name for name in os.listdir(app.config['BLOB_FOLDER']) if name.startswith('.upload-')]
@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+from flask import Flask
+from sqlalchemy import inspect, text
+
+import config
+import migrate
+from models import db, Submission
+
+# The schema as the first release's db.create_all() left it (before the email column)
+FIRST_RELEASE = """
+CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, password VARCHAR(120) NOT NULL,
+                   role VARCHAR(10) NOT NULL);
+CREATE TABLE course (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, code VARCHAR(20) NOT NULL UNIQUE,
+                     faculty_id INTEGER NOT NULL REFERENCES user (id));
+CREATE TABLE enrollments (student_id INTEGER NOT NULL REFERENCES user (id),
+                          course_id INTEGER NOT NULL REFERENCES course (id), PRIMARY KEY (student_id, course_id));
+CREATE TABLE assignment (id INTEGER PRIMARY KEY, course_id INTEGER NOT NULL REFERENCES course (id),
+                         title VARCHAR(100) NOT NULL, instructions TEXT, deadline DATETIME NOT NULL,
+                         attempt_limit INTEGER, question_file VARCHAR(255), is_published BOOLEAN);
+CREATE TABLE submission (id INTEGER PRIMARY KEY, assignment_id INTEGER NOT NULL REFERENCES assignment (id),
+                         user_id INTEGER NOT NULL REFERENCES user (id), course_id INTEGER NOT NULL REFERENCES course (id),
+                         content_hash VARCHAR(64), filename VARCHAR(100), score FLOAT, status VARCHAR(20),
+                         reason VARCHAR(255), timestamp DATETIME);
+INSERT INTO user VALUES (1, 'teacher', 'x', 'faculty'), (2, 'a', 'x', 'student');
+INSERT INTO course VALUES (1, 'Algorithms', 'CS201', 1);
+INSERT INTO assignment VALUES (1, 1, 'Essay', NULL, '2030-01-01 00:00:00', 3, NULL, 1);
+INSERT INTO submission VALUES (1, 1, 2, 1, 'abc', 'S_1_2_1_essay.txt', 0.1, 'accepted', 'ok', '2029-12-01 00:00:00');
+"""
+
+@pytest.fixture
+def old_app(tmp_path):
+    """An app on a copy of a first-release database."""
+    path = tmp_path / 'old.db'
+    with sqlite3.connect(path) as conn:
+        conn.executescript(FIRST_RELEASE)
+    old = Flask(__name__, instance_path=str(tmp_path))
+    old.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}", UPLOAD_FOLDER=str(tmp_path / 'uploads'))
+    db.init_app(old)
+    return old
+
+def test_first_release_database_upgrades_in_place(old_app):
+    with old_app.app_context():
+        assert migrate.upgrade() == [version for version, _, _ in migrate.MIGRATIONS]
+        schema = inspect(db.engine)
+        with db.engine.connect() as conn:
+            version = migrate.current_version(conn)
+            counted = conn.execute(text("SELECT SUM(count) FROM integrity_stat WHERE assignment_id = 1")).scalar()
+            searchable = conn.execute(text("SELECT rowid FROM course_fts WHERE course_fts MATCH 'cs2*'")).scalars().all()
+
+        assert version == migrate.LATEST
+        assert 'email' in {c['name'] for c in schema.get_columns('user')}
+        assert {'ix_submission_course_hash', 'ix_submission_course_status_user', 'ix_submission_user_assignment'} \
+            <= {ix['name'] for ix in schema.get_indexes('submission')}
+        assert counted == 1 and searchable == [1]  # existing rows were backfilled
+        assert db.session.get(Submission, 1).reason == 'ok'
+        assert migrate.upgrade() == []
+
+def test_connections_use_wal_and_wait_for_the_lock(app):
+    with app.app_context():
+        assert db.session.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+        assert db.session.execute(text("PRAGMA busy_timeout")).scalar() == config.SQLITE_BUSY_TIMEOUT_MS
+
+@pytest.mark.parametrize('where, index', [
+    ("course_id = 1 AND content_hash = 'abc'", 'ix_submission_course_hash'),
+    ("course_id = 1 AND status = 'accepted' AND user_id != 2", 'ix_submission_course_status_user'),
+    ("user_id = 2 AND assignment_id = 1", 'ix_submission_user_assignment'),
+])
+def test_hot_paths_are_indexed(app, where, index):
+    with app.app_context():
+        plan = " ".join(row[-1] for row in db.session.execute(
+            text(f"EXPLAIN QUERY PLAN SELECT id FROM submission WHERE {where}")))
+
+    assert f"USING INDEX {index}" in plan or f"USING COVERING INDEX {index}" in plan
@@ -0,0 +1,57 @@
+import datetime
+import difflib
+import random
+
+import minhash
+from models import db, User, Assignment, Submission
+
+WORDS = ("the a of and to in is that for it as was with be by on not he this are or his from at which but have "
+         "an they you were her she there one all we can their has been if more when will would who so no algorithm "
+         "graph tree proof data memory network theory model history market policy energy language culture").split()
+
+def essay(seed, paragraphs=4, words=60):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words)) for _ in range(paragraphs)]
+
+def test_estimate_follows_shingle_jaccard():
+    first, second = essay(1), essay(2)
+    text = " ".join(first)
+    half = " ".join(first[:2] + second[:2])
+    a, b = minhash.shingles(text), minhash.shingles(half)
+
+    true = len(a & b) / len(a | b)
+    assert abs(minhash.jaccard(minhash.signature(text), minhash.signature(half)) - true) < 0.12
+    assert minhash.jaccard(minhash.signature(text), minhash.signature(text)) == 1.0
+
+def add(course_id, username, text, status='accepted'):
+    sub = Submission(assignment_id=Assignment.query.filter_by(course_id=course_id).one().id,
+                     user_id=User.query.filter_by(username=username).one().id, course_id=course_id,
+                     filename=f"{username}.txt", content_hash=f"{username}-{status}", status=status,
+                     timestamp=datetime.datetime.now())
+    db.session.add(sub)
+    db.session.flush()
+    minhash.index_submission(sub.id, course_id, minhash.signature(text))
+    db.session.commit()
+    return sub.id
+
+def test_reordered_copy_is_a_candidate_other_essays_are_not(app, course_id):
+    copied = essay(1)
+    with app.app_context():
+        source = add(course_id, 'b', " ".join(copied))
+        add(course_id, 'c', " ".join(essay(2)))
+        query = minhash.signature(" ".join(reversed(copied)))
+        found = minhash.candidates(course_id, query, User.query.filter_by(username='a').one().id, Submission)
+
+    # c's essay draws on the same words (quick_ratio calls it a near copy) but shares no shingles
+    assert difflib.SequenceMatcher(None, " ".join(copied), " ".join(essay(2))).quick_ratio() > 0.9
+    assert list(found) == [source] and found[source] > minhash.BANDS // 2
+
+def test_only_accepted_priors_of_other_students(app, course_id):
+    text = " ".join(essay(1))
+    with app.app_context():
+        add(course_id, 'b', text, status='rejected')
+        add(course_id, 'a', text)
+        a = User.query.filter_by(username='a').one().id
+
+        assert minhash.candidates(course_id, minhash.signature(text), a, Submission) == {}
+        assert minhash.candidates(course_id, minhash.signature(""), a, Submission) == {}
@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+
+import pytest
+
+import config
+import model_server
+
+@pytest.fixture
+def instance(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'INSTANCE_PATH', str(tmp_path))
+    monkeypatch.setattr(config, 'MODEL_SERVER_KEY', None)
+    monkeypatch.setattr(config, 'MODEL_SERVER_SOCKET', None)
+    return tmp_path
+
+def test_key_is_generated_once_owner_only(instance):
+    key = model_server._authkey()
+
+    assert len(key) == 64 and model_server._authkey() == key
+    assert os.stat(instance / 'models.key').st_mode & 0o777 == 0o600
+    assert [p.name for p in instance.iterdir()] == ['models.key']
+
+def test_key_readable_by_others_is_refused(instance):
+    (instance / 'models.key').write_text("guessable")
+    os.chmod(instance / 'models.key', 0o644)
+
+    with pytest.raises(PermissionError):
+        model_server._authkey()
+
+def test_only_key_holders_are_served(instance, monkeypatch):
+    server = model_server.ModelServer()
+    threading.Thread(target=server.serve, args=(model_server.socket_path(),), daemon=True).start()
+    deadline = time.monotonic() + 10
+    while model_server.ping() is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert model_server.ping() == server.info
+    monkeypatch.setattr(config, 'MODEL_SERVER_KEY', 'lyken-models')
+    assert model_server.ping() is None
+
+class _Interrupted:
+    closed = False
+
+    def send(self, message):
+        raise KeyboardInterrupt
+
+    def close(self):
+        self.closed = True
+
+def test_interrupted_call_closes_its_connection(monkeypatch):
+    conn = _Interrupted()
+    monkeypatch.setattr(model_server, '_connect', lambda: conn)
+    remote = model_server.RemoteEncoder({}, local_loader=None)
+
+    with pytest.raises(KeyboardInterrupt):
+        remote.encode(["text"])
+
+    assert conn.closed and remote._tls.conn is None
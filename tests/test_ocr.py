@@ -0,0 +1,69 @@
+import functools
+import io
+import json
+import threading
+import time
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+
+import config
+import ocr
+import worker
+
+def scanned_pdf(path, pages=2):
+    """A PDF of page images (no text layer), each with a few lines of writing."""
+    doc = fitz.open()
+    for page_no in range(pages):
+        image = Image.new('L', (600, 800), 255)
+        draw = ImageDraw.Draw(image)
+        for line in range(20):
+            draw.text((40, 40 + 30 * line), f"page {page_no} line {line} of a handwritten answer", fill=0)
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        doc.new_page().insert_image(fitz.Rect(0, 0, 595, 842), stream=buffer.getvalue())
+    doc.save(path)
+    return path
+
+def _ocr_in_worker(path, out, worker_no):
+    texts, stats = ocr.ocr_pages(path)
+    pooled = ocr._pool is not None
+    ocr.kill_pool()
+    with open(out, 'w') as f:
+        json.dump({'pages': sorted(texts), 'ocr_pages': stats['ocr_pages'], 'pooled': pooled}, f)
+
+def test_ocr_pages_in_queue_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'OCR_WORKERS', 2)
+    pdf = scanned_pdf(str(tmp_path / 'scan.pdf'))
+    out = tmp_path / 'result.json'
+
+    # The same process setup as `python worker.py`, running OCR instead of the job loop
+    proc, = worker.start_pool(1, target=functools.partial(_ocr_in_worker, pdf, str(out)))
+    proc.join(120)
+
+    assert proc.exitcode == 0
+    result = json.loads(out.read_text())
+    assert result == {'pages': [0, 1], 'ocr_pages': 2, 'pooled': True}
+
+def test_ocr_pages_through_model_server(tmp_path, monkeypatch):
+    import logic
+    import model_server
+
+    monkeypatch.setattr(config, 'OCR_WORKERS', 2)
+    monkeypatch.setattr(config, 'MODEL_SERVER_SOCKET', str(tmp_path / 'models.sock'))
+    monkeypatch.setattr(logic, '_models', {})
+    server = model_server.ModelServer()
+    batcher = server.batchers['readtext']
+    read = batcher.fn
+    batches = []
+    monkeypatch.setattr(batcher, 'fn', lambda images: batches.append(len(images)) or read(images))
+    threading.Thread(target=server.serve, args=(model_server.socket_path(),), daemon=True).start()
+    deadline = time.monotonic() + 10
+    while model_server.ping() is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    texts, stats = ocr.ocr_pages(scanned_pdf(str(tmp_path / 'scan.pdf'), pages=3))
+
+    # No page pool in this process: the server's reader read every page
+    assert ocr._pool is None and sum(batches) == 3
+    assert sorted(texts) == [0, 1, 2] and stats['ocr_pages'] == 3
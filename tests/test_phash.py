@@ -0,0 +1,33 @@
+import datetime
+
+import logic
+import phash
+from models import db, User, Submission
+
+PAGE = 0x0123456789ABCDEF
+TEXT = "the text OCR'd from student a's page"
+
+def test_page_text_of_another_student_needs_an_identical_hash(app, course_id, monkeypatch):
+    with app.app_context():
+        a, b = (User.query.filter_by(username=u).one() for u in 'ab')
+        prior = Submission(assignment_id=1, user_id=a.id, course_id=course_id, filename='a.png', content_hash='a',
+                           score=0.0, status='accepted', reason="✅ ACCEPTED", page_hashes=1,
+                           timestamp=datetime.datetime.now())
+        db.session.add(prior)
+        db.session.flush()
+        phash.index_pages(prior.id, course_id, [(0, PAGE)])
+        phash.remember(PAGE, TEXT)
+        db.session.commit()
+
+        def check(user, page_hash):
+            monkeypatch.setattr(phash, 'page_hashes', lambda path: [(0, page_hash)])
+            verdict, pages = logic.check_near_duplicate('upload.png', course_id, user.id, Submission,
+                                                       app.config['UPLOAD_FOLDER'])
+            return verdict, pages[0][1]
+
+        similar = PAGE ^ 0b111  # 3 bits apart: the same page for flagging, not for its text
+        verdict, known = check(b, similar)
+        assert verdict is not None and "NEAR-DUPLICATE" in verdict[1]
+        assert known is None
+        assert check(b, PAGE)[1] == TEXT
+        assert check(a, similar) == (None, TEXT)  # a's own re-scan
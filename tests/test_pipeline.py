@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pipeline
+
+def _busy(check):
+    """A stage that never finishes on its own, yielding at checkpoints like the OCR and AI loops."""
+    while True:
+        pipeline.checkpoint()
+        time.sleep(0.01)
+
+def test_stage_limit_off_the_main_thread():
+    stages = [pipeline.Stage('busy', _busy, cost=0, timeout=0.2)]
+    result = {}
+
+    # As in an inline check in a threaded dev server: no SIGALRM here
+    thread = threading.Thread(target=lambda: result.update(verdict=pipeline.run(stages, None, budget=10)))
+    started = time.monotonic()
+    thread.start()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert time.monotonic() - started < 2
+    score, reason = result['verdict']
+    assert pipeline.is_review(reason) and 'BUSY STAGE STOPPED' in reason
+    assert pipeline.time_left() is None
+
+def test_timed_out_check_leaves_no_index_rows(app, course_id, monkeypatch, tmp_path):
+    import config
+    import logic
+    import tasks
+    from models import db, User, Assignment, Submission, PageHash, LshBucket, CodeFingerprint
+    from test_ocr import scanned_pdf
+
+    def slow_ai(text):
+        _busy(None)
+
+    monkeypatch.setattr(config, 'CHECK_STAGE_TIMEOUTS', 'ai=0.5')
+    monkeypatch.setattr(logic, 'ai_window_scores', slow_ai)
+    pdf = scanned_pdf(str(tmp_path / 'scan.pdf'))
+
+    with app.app_context():
+        assignment = Assignment.query.filter_by(course_id=course_id).one()
+        student = User.query.filter_by(username='a').one()
+        sub = Submission(assignment_id=assignment.id, user_id=student.id, course_id=course_id,
+                         filename='scan.pdf', content_hash='scan', status='pending')
+        db.session.add(sub)
+        db.session.commit()
+        # Page hashes are indexed, and committed with the extracted text, before the AI stage
+        sub = tasks.check_submission(sub.id, pdf)
+
+        assert sub.status == 'review' and 'AI STAGE STOPPED' in sub.reason
+        for model in (PageHash, LshBucket, CodeFingerprint):
+            assert model.query.filter_by(submission_id=sub.id).count() == 0
+        assert sub.page_hashes is None and sub.minhash is None
+
+def test_stage_limit_waits_for_a_database_write(app, course_id):
+    from sqlalchemy import event
+    from models import db, Course, CheckSession
+
+    def slow_flush(session, flush_context, instances):
+        time.sleep(0.5)  # the alarm goes off in here
+
+    def rename(check):
+        db.session.get(Course, course_id).name = 'Renamed'
+        db.session.commit()
+        _busy(check)
+
+    stages = [pipeline.Stage('rename', rename, cost=0, timeout=0.2)]
+    event.listen(CheckSession, 'before_flush', slow_flush)
+    try:
+        with app.app_context():
+            started = time.monotonic()
+            score, reason = pipeline.run(stages, None, budget=10)
+            elapsed = time.monotonic() - started
+    finally:
+        event.remove(CheckSession, 'before_flush', slow_flush)
+
+    # Stopped once the commit was done, not inside it
+    assert 'RENAME STAGE STOPPED' in reason and 0.5 <= elapsed < 2
+    with app.app_context():
+        assert db.session.get(Course, course_id).name == 'Renamed'
@@ -0,0 +1,64 @@
+"""Guard against N+1 regressions: the SQL count of the busiest views must not grow with the data."""
+
+import datetime
+
+import pytest
+
+from models import db, User, Course, Assignment, Submission, enrollments
+
+# Queries per request, including the session's user lookup
+MAX_QUERIES = {'dashboard': 4, 'course_page': 4, 'view_reports': 5}
+
+def add_course(course, students):
+    """One more course of the same teacher, and two more assignments in it and in `course`,
+    each submitted to twice by every student (enrolled in the new course)."""
+    deadline = datetime.datetime.now() + datetime.timedelta(days=7)
+    n = Course.query.count()
+    extra = Course(name=f"Course {n}", code=f"X{n}", faculty_id=course.faculty_id)
+    db.session.add(extra)
+    db.session.flush()
+    for target in (course, extra):
+        for title in ('Essay', 'Lab'):
+            assignment = Assignment(course_id=target.id, title=f"{title} {n}", deadline=deadline)
+            db.session.add(assignment)
+            db.session.flush()
+            for student in students:
+                for attempt in range(2):
+                    db.session.add(Submission(
+                        assignment_id=assignment.id, user_id=student.id, course_id=target.id,
+                        filename=f"{n}-{attempt}.txt", content_hash=f"{assignment.id}-{student.id}-{attempt}",
+                        score=0.5 * attempt, status='rejected' if attempt else 'accepted',
+                        reason="✅ ACCEPTED: 0.0% MAX SIMILARITY (classmates)", timestamp=datetime.datetime.now()))
+    for student in students:
+        db.session.execute(enrollments.insert().values(student_id=student.id, course_id=extra.id))
+
+def populate(app, course_id, courses):
+    with app.app_context():
+        course = db.session.get(Course, course_id)
+        students = User.query.filter(User.username.in_(['a', 'b'])).all()
+        for _ in range(courses):
+            add_course(course, students)
+        db.session.commit()
+
+def query_counts(login, course_id):
+    teacher, student = login('teacher'), login('a')
+    pages = {
+        'dashboard': [teacher.get('/dashboard'), student.get('/dashboard')],
+        'course_page': [student.get(f"/course/{course_id}")],
+        'view_reports': [teacher.get(f"/view_reports/{course_id}")],
+    }
+    counts = {}
+    for view, responses in pages.items():
+        assert all(r.status_code == 200 for r in responses), view
+        counts[view] = max(int(r.headers['X-Query-Count']) for r in responses)
+    return counts
+
+@pytest.mark.parametrize('view', sorted(MAX_QUERIES))
+def test_query_count_is_flat(app, course_id, login, view):
+    populate(app, course_id, 1)
+    small = query_counts(login, course_id)
+    populate(app, course_id, 4)
+    large = query_counts(login, course_id)
+
+    assert large[view] == small[view]
+    assert large[view] <= MAX_QUERIES[view]
@@ -0,0 +1,50 @@
+import datetime
+import re
+
+import pytest
+
+from models import db, User, Assignment, Submission
+
+@pytest.fixture
+def submissions(app, course_id):
+    """Eight submissions: a and b alternate, every third one rejected."""
+    with app.app_context():
+        assignment = Assignment.query.filter_by(course_id=course_id).one()
+        users = {u.username: u.id for u in User.query}
+        for n in range(8):
+            db.session.add(Submission(
+                assignment_id=assignment.id, user_id=users['ab'[n % 2]], course_id=course_id,
+                filename=f"{n}.txt", content_hash=f"h{n}", score=0.1 * n,
+                status='rejected' if n % 3 == 0 else 'accepted', reason="", timestamp=datetime.datetime.now()))
+        db.session.commit()
+        return assignment.id
+
+def shown(response):
+    """Ids of the submissions listed on the page."""
+    return [int(i) for i in re.findall(rb'/submission/(\d+)/file', response.data)]
+
+def test_reports_are_paged(app, login, course_id, submissions, monkeypatch):
+    monkeypatch.setitem(app.config, 'REPORT_PAGE_SIZE', 3)
+    teacher = login('teacher')
+
+    pages = [teacher.get(f"/view_reports/{course_id}?page={n}") for n in (1, 2, 3)]
+
+    assert [shown(p) for p in pages] == [[1, 2, 3], [4, 5, 6], [7, 8]]
+    assert b"Page 1 of 3 (8 submissions)" in pages[0].data
+
+@pytest.mark.parametrize('query, expected', [
+    ("status=rejected", [1, 4, 7]),
+    ("student=B", [2, 4, 6, 8]),
+    ("student=b&status=accepted", [2, 6, 8]),
+    ("assignment_id=999", []),
+])
+def test_reports_are_filtered_in_sql(app, login, course_id, submissions, monkeypatch, query, expected):
+    monkeypatch.setitem(app.config, 'REPORT_PAGE_SIZE', 2)
+    teacher = login('teacher')
+    first = teacher.get(f"/view_reports/{course_id}?{query}")
+    ids = shown(first)
+    if b"Page 1 of 2" in first.data:
+        ids += shown(teacher.get(f"/view_reports/{course_id}?{query}&page=2"))
+
+    assert ids == expected
+    assert (b"of 2 (" in first.data) == (len(expected) > 2)
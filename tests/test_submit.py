@@ -0,0 +1,78 @@
+import io
+
+import pytest
+
+from models import db, Assignment, Submission
+
+ESSAY = (b"Dynamic programming solves a problem by combining the answers to overlapping subproblems, "
+         b"each computed once and kept in a table, so the running time is the number of subproblems "
+         b"times the work per subproblem rather than exponential in the input size.")
+
+@pytest.fixture
+def assignment_id(app, course_id):
+    with app.app_context():
+        return Assignment.query.filter_by(course_id=course_id).one().id
+
+def upload(client, assignment_id, data=ESSAY, name='essay.txt'):
+    return client.post(f"/submit/{assignment_id}", data={'file': (io.BytesIO(data), name)},
+                       content_type='multipart/form-data', follow_redirects=True)
+
+def submissions(app):
+    with app.app_context():
+        return [(s.status, s.counts_as_attempt) for s in Submission.query.order_by(Submission.id)]
+
+def test_failed_check_goes_to_review_and_is_no_attempt(app, assignment_id, login, monkeypatch):
+    import tasks
+    from app import job_queue
+
+    monkeypatch.setitem(app.config, 'ASYNC_SUBMISSIONS', True)
+    with app.app_context():
+        db.session.get(Assignment, assignment_id).attempt_limit = 1
+        db.session.commit()
+    student = login('a')
+    upload(student, assignment_id)
+
+    # The workers give up on the job
+    while not job_queue.fail((job := job_queue.get(timeout=0)).id, "boom"):
+        pass
+    with app.app_context():
+        tasks.mark_failed(job.payload['submission_id'], RuntimeError("boom"))
+
+    upload(student, assignment_id, data=ESSAY + b" Revised.")
+
+    assert submissions(app) == [('review', False), ('pending', True)]
+
+def test_inline_check_that_crashes_goes_to_review(app, assignment_id, login, monkeypatch):
+    import tasks
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("model server gone")
+
+    monkeypatch.setattr(tasks, 'check_submission', crash)
+    response = upload(login('a'), assignment_id)
+
+    assert b"NEEDS REVIEW: CHECK FAILED" in response.data
+    assert submissions(app) == [('review', False)]
+
+def test_repeat_of_a_queued_check_is_not_a_new_attempt(app, assignment_id, login, monkeypatch):
+    monkeypatch.setitem(app.config, 'ASYNC_SUBMISSIONS', True)
+    student = login('a')
+
+    upload(student, assignment_id)
+    response = upload(student, assignment_id)
+
+    assert b"already RECEIVED" in response.data
+    assert submissions(app) == [('pending', True)]
+
+def test_pending_row_without_a_job_does_not_block(app, assignment_id, login, monkeypatch):
+    from app import job_queue
+
+    monkeypatch.setitem(app.config, 'ASYNC_SUBMISSIONS', True)
+    monkeypatch.setitem(app.config, 'CHECK_INLINE_BUDGET_SECONDS', 0)
+    student = login('a')
+    upload(student, assignment_id)
+    job_queue.ack(job_queue.get(timeout=0).id)  # lost, e.g. the queue file was replaced
+
+    upload(student, assignment_id)
+
+    assert [status for status, _ in submissions(app)] == ['pending', 'pending']
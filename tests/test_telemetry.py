@@ -0,0 +1,31 @@
+import multiprocessing
+import os
+
+import telemetry
+
+def _count_and_die(value):
+    telemetry.inc('lyken_jobs_total', value, task='check_submission', outcome='ok')
+    telemetry.flush(force=True)  # then exits without atexit, as a killed worker would
+
+def jobs_total(text):
+    line = next(l for l in text.splitlines() if l.startswith('lyken_jobs_total{'))
+    return int(line.rsplit(" ", 1)[1])
+
+def test_exited_processes_are_retired_not_lost(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, '_metrics_dir', str(tmp_path))
+    fork = multiprocessing.get_context('fork')
+    for value in (2, 3):
+        child = fork.Process(target=_count_and_die, args=(value,))
+        child.start()
+        child.join()
+    assert len(os.listdir(tmp_path)) == 2
+
+    assert jobs_total(telemetry.render()) == 5
+    assert sorted(os.listdir(tmp_path)) == ['retired.json', 'retired.lock']
+    assert jobs_total(telemetry.render()) == 5  # counted once, still cumulative
+
+    child = fork.Process(target=_count_and_die, args=(4,))
+    child.start()
+    child.join()
+    assert jobs_total(telemetry.render()) == 9
+    assert sorted(os.listdir(tmp_path)) == ['retired.json', 'retired.lock']
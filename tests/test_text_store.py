@@ -0,0 +1,25 @@
+from models import db, ExtractedText
+import text_store
+
+def test_put_is_committed_by_the_caller(app):
+    with app.app_context():
+        text_store.put('h1', "first text")
+        assert text_store.get('h1') == "first text"
+        db.session.rollback()
+        assert text_store.get('h1') is None
+
+        text_store.put('h1', "first text")
+        db.session.commit()
+    with app.app_context():
+        assert text_store.get('h1') == "first text"
+
+def test_size_bound_checked_every_few_writes(app, monkeypatch):
+    monkeypatch.setattr(text_store, 'EVICT_EVERY', 3)
+    monkeypatch.setattr(text_store, 'MAX_BYTES', 15)
+    monkeypatch.setitem(text_store.stats, 'writes', 0)
+    with app.app_context():
+        for n in range(5):
+            text_store.put(f"h{n}", "ten bytes!")
+        db.session.commit()
+        # Evicted once, at the third write, down to 90% of the bound; two written since
+        assert sorted(r.content_hash for r in ExtractedText.query) == ['h2', 'h3', 'h4']
@@ -0,0 +1,95 @@
+"""
+📦 EXTRACTED-TEXT STORE
+Durable, content-addressed cache of extracted text keyed by Submission.content_hash.
+Lives in the application database, so every worker and every restart shares it.
+Writes go into the caller's transaction: text extracted during a check is
+stored with the verdict, never half-way through it.
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from models import db, ExtractedText
+import config
+import telemetry
+
+log = telemetry.get_logger('text_store')
+
+# Total text kept before least-recently-used rows are evicted
+MAX_BYTES = config.TEXT_STORE_MAX_BYTES
+# Only refresh last_access this often, so reads don't turn into writes
+TOUCH_INTERVAL = timedelta(hours=1)
+# Check the size bound every this many writes of a process, not on every write
+EVICT_EVERY = 50
+
+# Per-process counters (hits/misses seen by this worker)
+stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+def hit_ratio():
+    lookups = stats['hits'] + stats['misses']
+    return stats['hits'] / lookups if lookups else 0.0
+
+def _touch(rows):
+    """Refresh last_access of rows not read for a while (committed by the caller)."""
+    stale = [r.content_hash for r in rows if r.last_access is None or r.last_access < datetime.utcnow() - TOUCH_INTERVAL]
+    if stale:
+        ExtractedText.query.filter(ExtractedText.content_hash.in_(stale)).update(
+            {ExtractedText.last_access: datetime.utcnow()}, synchronize_session=False)
+
+def get(content_hash):
+    """Return stored text for a hash, or None on a miss."""
+    return get_many([content_hash]).get(content_hash) if content_hash else None
+
+def get_many(hashes):
+    """Batch lookup: {content_hash: text} for every hash that is stored."""
+    wanted = {h for h in hashes if h}
+    if not wanted:
+        return {}
+    rows = ExtractedText.query.filter(ExtractedText.content_hash.in_(wanted)).all()
+    stats['hits'] += len(rows)
+    stats['misses'] += len(wanted) - len(rows)
+    telemetry.inc('lyken_text_store_lookups_total', len(rows), result='hit')
+    telemetry.inc('lyken_text_store_lookups_total', len(wanted) - len(rows), result='miss')
+    _touch(rows)
+    return {r.content_hash: r.text for r in rows}
+
+def put(content_hash, text):
+    """Store extracted text under its content hash (committed by the caller); enforce the size bound now and then."""
+    if not content_hash:
+        return
+    text = text or ""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    row = dict(content_hash=content_hash, text=text, size=len(text.encode('utf-8')), last_access=datetime.utcnow())
+    # An upsert: another worker storing the same text first must not spoil the caller's transaction
+    stmt = insert(ExtractedText.__table__).values(**row)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['content_hash'],
+                                                  set_={k: stmt.excluded[k] for k in ('text', 'size', 'last_access')}))
+    stats['writes'] += 1
+    if stats['writes'] % EVICT_EVERY == 0:
+        evict()
+
+def evict(max_bytes=None):
+    """Drop least-recently-used rows until the store fits in max_bytes (committed by the caller)."""
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    total = db.session.query(func.coalesce(func.sum(ExtractedText.size), 0)).scalar()
+    if total <= max_bytes:
+        return 0
+
+    excess = total - int(max_bytes * 0.9)  # free a little headroom in one pass
+    victims = []
+    rows = db.session.query(ExtractedText.content_hash, ExtractedText.size) \
+        .order_by(ExtractedText.last_access.asc()).yield_per(500)
+    for content_hash, size in rows:
+        if excess <= 0:
+            break
+        victims.append(content_hash)
+        excess -= size
+
+    for i in range(0, len(victims), 500):
+        ExtractedText.query.filter(ExtractedText.content_hash.in_(victims[i:i + 500])) \
+            .delete(synchronize_session=False)
+    stats['evictions'] += len(victims)
+    log.info("🧹 Text store evicted entries", evicted=len(victims))
+    return len(victims)
@@ -0,0 +1,84 @@
+"""
+⚙️ SUBMISSION WORKER POOL
+Serves the local job queue with a pool of worker processes, so OCR, AI
+detection and similarity scoring never run inside a web request.
+
+Usage:  python worker.py [--workers N]      (default: WORKER_POOL_SIZE)
+
+With PRELOAD_MODELS=1 the parent loads the models once and forks the pool,
+so every worker shares the model pages copy-on-write.
+"""
+
+import argparse
+import multiprocessing
+import signal
+
+import config
+
+def work_loop(worker_no):
+    from app import app, job_queue
+    from models import db
+    import logic
+    import tasks
+    import telemetry
+
+    log = telemetry.get_logger('worker')
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    log.info("👷 Worker ready", worker=worker_no, **logic.startup_report())
+    while True:
+        job = job_queue.get(timeout=5)
+        if job is None:
+            continue
+        with app.app_context(), telemetry.bind(job_id=job.id, task=job.task, attempt=job.attempts):
+            try:
+                with telemetry.timed(f"job.{job.task}"):
+                    tasks.run_job(job)
+                job_queue.ack(job.id)
+                telemetry.inc('lyken_jobs_total', task=job.task, outcome='ok')
+            except Exception as e:
+                db.session.rollback()
+                log.exception("❌ Job failed", error=str(e))
+                final = job_queue.fail(job.id, e)
+                telemetry.inc('lyken_jobs_total', task=job.task, outcome='failed' if final else 'retried')
+                if final and 'submission_id' in job.payload:
+                    tasks.mark_failed(job.payload['submission_id'], e)
+        telemetry.flush(force=True)
+
+def start_pool(size, preload=False, target=work_loop):
+    if preload:
+        import app  # noqa: F401 - import everything once in the parent
+        import logic
+        logic.preload_models()
+    # fork (not spawn) so children inherit the parent's loaded modules and models
+    ctx = multiprocessing.get_context('fork')
+    procs = []
+    for n in range(size):
+        # Not daemonic: a daemon process may not start the OCR and audit process pools.
+        # main() terminates the workers on SIGTERM and Ctrl-C.
+        proc = ctx.Process(target=target, args=(n + 1,), daemon=False)
+        proc.start()
+        procs.append(proc)
+    return procs
+
+def main():
+    parser = argparse.ArgumentParser(description="Run plagiarism-check workers")
+    parser.add_argument('--workers', type=int, default=config.WORKER_POOL_SIZE)
+    parser.add_argument('--preload', action='store_true', default=config.PRELOAD_MODELS,
+                        help="load models in the parent before forking (PRELOAD_MODELS)")
+    args = parser.parse_args()
+
+    procs = start_pool(args.workers, preload=args.preload)
+    print(f"🚀 {len(procs)} submission workers running")
+
+    def shutdown(*_):
+        for proc in procs:
+            proc.terminate()
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        shutdown()
+
+if __name__ == '__main__':
+    main()